@@ -0,0 +1,252 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file contains an asyncio front-end to the parser, for embedding
+# Clanalyze in services. It requires Python 3.
+
+from .observer.base import DefinitionObserver
+from .parser import Parser, _DefinitionRecorder
+
+import asyncio
+import concurrent.futures
+import inspect
+import multiprocessing
+import threading
+import weakref
+
+class _Cancelled(Exception):
+    """Raised inside a parse to abort it once its request went away."""
+
+class _EventSink(object):
+    """Receives definition events in a worker thread.
+
+    This stands in for the events list of a _DefinitionRecorder. Events are
+    forwarded to an asyncio queue as they are produced.
+    """
+
+    def __init__(self, loop, queue, cancelled):
+        self.loop = loop
+        self.queue = queue
+        self.cancelled = cancelled
+
+    def append(self, event):
+        if self.cancelled.is_set():
+            raise _Cancelled()
+
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, event)
+
+# Parser instances used by process pool workers, keyed by factory.
+_process_parsers = {}
+
+def _parse_in_process(factory, filename, content, args):
+    """Parse an input in a worker process, returning definition events."""
+    parser = _process_parsers.get(factory)
+    if parser is None:
+        parser = _process_parsers[factory] = factory()
+
+    recorder = _DefinitionRecorder()
+    parser.add_observer(recorder)
+    try:
+        parser.parse(filename=filename, content=content, clang_args=args)
+    finally:
+        parser.remove_observer(recorder)
+
+    return recorder.events
+
+_DONE = object()
+
+class AsyncParser(object):
+    """Parses C language files without blocking the asyncio event loop.
+
+    Parsing is CPU bound and happens in libclang, so it is offloaded to an
+    executor. By default, a thread pool is used. Each thread has its own
+    Parser, created by the parser factory. Alternatively, a process pool can
+    be used, which avoids contention on the GIL at the cost of sending
+    definitions between processes.
+
+    Only definition observers can be registered. They are notified in the
+    event loop, so their methods may be coroutine functions, which are
+    awaited.
+
+    The number of requests parsing at the same time is limited. Additional
+    requests wait for a slot without occupying a thread.
+    """
+
+    def __init__(self, parser_factory=Parser, max_concurrency=None,
+            executor=None, use_processes=False, timeout=None):
+        """Create an asynchronous parser.
+
+        parser_factory -- Callable returning a Parser. Use this to configure
+          parsers, such as giving them a declaration cache. It must be
+          picklable when using processes.
+        max_concurrency -- Maximum number of requests parsing at the same
+          time. Defaults to the number of CPUs.
+        executor -- concurrent.futures.Executor to run parses in. Created on
+          first use if not given.
+        use_processes -- Whether the executor created by default is a process
+          pool instead of a thread pool.
+        timeout -- Default timeout in seconds for each request. None means no
+          timeout.
+        """
+        self._factory = parser_factory
+        self._max_concurrency = max_concurrency or multiprocessing.cpu_count()
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._use_processes = use_processes
+        # Semaphores are bound to the event loop they are first used in, so
+        # each loop the parser is used from gets its own.
+        self._semaphores = weakref.WeakKeyDictionary()
+        self._local = threading.local()
+        self._observers = []
+        self.timeout = timeout
+
+    def add_observer(self, obs):
+        """Register a definition observer."""
+        if not isinstance(obs, DefinitionObserver):
+            raise Exception('AsyncParser only supports definition observers: '
+                    '%s' % obs)
+
+        self._observers.append(obs)
+
+    def remove_observer(self, obs):
+        """Remove a definition observer."""
+        self._observers = [o for o in self._observers if o != obs]
+
+    def close(self):
+        """Shut down the executor created by this instance."""
+        if self._executor is not None and self._owns_executor:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self._use_processes:
+                cls = concurrent.futures.ProcessPoolExecutor
+            else:
+                cls = concurrent.futures.ThreadPoolExecutor
+
+            self._executor = cls(max_workers=self._max_concurrency)
+
+        return self._executor
+
+    def _get_semaphore(self):
+        loop = asyncio.get_running_loop()
+
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(
+                    self._max_concurrency)
+
+        return semaphore
+
+    def _parse_in_thread(self, filename, content, args, sink):
+        """Parse an input in an executor thread, sending events to a sink."""
+        parser = getattr(self._local, 'parser', None)
+        if parser is None:
+            parser = self._local.parser = self._factory()
+
+        recorder = _DefinitionRecorder()
+        recorder.events = sink
+        parser.add_observer(recorder)
+        try:
+            parser.parse(filename=filename, content=content, clang_args=args)
+        except _Cancelled:
+            pass
+        finally:
+            parser.remove_observer(recorder)
+
+    async def _notify(self, method, args):
+        for obs in self._observers:
+            result = getattr(obs, method)(*args)
+            if inspect.isawaitable(result):
+                await result
+
+    async def parse(self, filename=None, content=None, clang_args=None,
+            timeout=None):
+        """Parse an entity and send results to observers.
+
+        Returns a list of the definitions that were produced.
+
+        See iter_definitions() for arguments.
+        """
+        return [d async for d in self.iter_definitions(filename=filename,
+            content=content, clang_args=clang_args, timeout=timeout)]
+
+    async def iter_definitions(self, filename=None, content=None,
+            clang_args=None, timeout=None):
+        """Parse an entity and generate the definitions derived from it.
+
+        This is an asynchronous generator. Observers are notified of each
+        definition before it is yielded.
+
+        If the consuming task is cancelled or stops iterating, parsing in a
+        thread is aborted when it produces its next definition. Parses in a
+        process can only be abandoned, not interrupted.
+
+        Arguments:
+
+        filename -- The filename to load source from.
+        content -- str or bytes containing raw source to parse.
+        clang_args -- Arguments that would be passed to Clang compiler to
+          compile this file.
+        timeout -- Timeout in seconds for the request, including time waiting
+          for a free slot. Defaults to the timeout given at construction.
+          asyncio.TimeoutError is raised when it expires.
+        """
+        loop = asyncio.get_running_loop()
+
+        if timeout is None:
+            timeout = self.timeout
+
+        deadline = None
+        if timeout is not None:
+            deadline = loop.time() + timeout
+
+        def remaining():
+            if deadline is None:
+                return None
+
+            return max(0, deadline - loop.time())
+
+        args = list(clang_args or [])
+        semaphore = self._get_semaphore()
+
+        await asyncio.wait_for(semaphore.acquire(), remaining())
+        try:
+            if self._use_processes:
+                future = loop.run_in_executor(self._get_executor(),
+                        _parse_in_process, self._factory, filename, content,
+                        args)
+                events = await asyncio.wait_for(future, remaining())
+
+                for method, event_args in events:
+                    await self._notify(method, event_args)
+                    yield event_args[0]
+
+                return
+
+            queue = asyncio.Queue()
+            cancelled = threading.Event()
+            sink = _EventSink(loop, queue, cancelled)
+
+            future = loop.run_in_executor(self._get_executor(),
+                    self._parse_in_thread, filename, content, args, sink)
+            future.add_done_callback(lambda f: queue.put_nowait(_DONE))
+
+            try:
+                while True:
+                    event = await asyncio.wait_for(queue.get(), remaining())
+                    if event is _DONE:
+                        break
+
+                    method, event_args = event
+                    await self._notify(method, event_args)
+                    yield event_args[0]
+
+                # Propagates exceptions raised while parsing.
+                await future
+            finally:
+                cancelled.set()
+        finally:
+            semaphore.release()
@@ -0,0 +1,151 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file contains a generator of synthetic C++ source trees.
+
+import json
+import os.path
+import random
+
+FIELD_TYPES = (
+    'int',
+    'unsigned int',
+    'long',
+    'char',
+    'double',
+    'float',
+    'bool',
+    'short',
+)
+
+class CorpusSpec(object):
+    """Describes the shape of a synthetic corpus.
+
+    Corpora generated from equal specs are identical, byte for byte.
+
+    files -- Number of source files.
+    classes -- Number of classes defined in each source file.
+    fields -- Number of fields in each class.
+    namespace_depth -- Number of nested namespaces classes are defined in.
+    token_density -- Number of statements in the inline method body of each
+      class. Bodies are skipped by the AST walk unless an observer needs
+      them, but their tokens are lexed and tokenized.
+    headers -- Number of shared header files.
+    header_classes -- Number of classes defined in each header.
+    header_fanout -- Number of headers included by each source file.
+    seed -- Seed of the random number generator.
+    """
+
+    __slots__ = (
+        'classes',
+        'fields',
+        'files',
+        'header_classes',
+        'header_fanout',
+        'headers',
+        'namespace_depth',
+        'seed',
+        'token_density',
+    )
+
+    def __init__(self, files=10, classes=50, fields=5, namespace_depth=1,
+            token_density=4, headers=10, header_classes=10, header_fanout=3,
+            seed=0):
+        self.files = files
+        self.classes = classes
+        self.fields = fields
+        self.namespace_depth = namespace_depth
+        self.token_density = token_density
+        self.headers = headers
+        self.header_classes = header_classes
+        self.header_fanout = min(header_fanout, headers)
+        self.seed = seed
+
+    def to_dict(self):
+        return dict((k, getattr(self, k)) for k in self.__slots__)
+
+    @staticmethod
+    def from_dict(d):
+        return CorpusSpec(**d)
+
+def _write_classes(lines, rng, spec, prefix, count):
+    """Append definitions of classes to a list of lines."""
+    for i in range(spec.namespace_depth):
+        lines.append('namespace %s_ns%d {' % (prefix, i))
+
+    for i in range(count):
+        lines.append('class %s_C%d {' % (prefix, i))
+        lines.append('public:')
+
+        for j in range(spec.fields):
+            lines.append('    %s f%d;' % (rng.choice(FIELD_TYPES), j))
+
+        if spec.token_density:
+            lines.append('    int method(int x) {')
+            for j in range(spec.token_density):
+                lines.append('        x = x * %d + %d;' % (rng.randint(1, 99),
+                    rng.randint(0, 99)))
+            lines.append('        return x;')
+            lines.append('    }')
+
+        lines.append('};')
+
+    for i in range(spec.namespace_depth):
+        lines.append('}')
+
+def generate(directory, spec):
+    """Write a synthetic corpus to a directory.
+
+    Source files are written to directory/src and headers to
+    directory/include. A compile_commands.json describing how to compile the
+    source files is written to the directory.
+
+    Returns a list of absolute paths of the source files.
+    """
+    rng = random.Random(spec.seed)
+
+    directory = os.path.abspath(directory)
+    include = os.path.join(directory, 'include')
+    src = os.path.join(directory, 'src')
+    for d in (include, src):
+        if not os.path.isdir(d):
+            os.makedirs(d)
+
+    for i in range(spec.headers):
+        name = 'h%d' % i
+        lines = ['#ifndef %s_H' % name.upper(), '#define %s_H' % name.upper()]
+        _write_classes(lines, rng, spec, name, spec.header_classes)
+        lines.append('#endif')
+
+        with open(os.path.join(include, '%s.h' % name), 'w') as fh:
+            fh.write('\n'.join(lines) + '\n')
+
+    paths = []
+    commands = []
+    for i in range(spec.files):
+        name = 's%d' % i
+        lines = ['#include "h%d.h"' % h for h in
+                sorted(rng.sample(range(spec.headers), spec.header_fanout))]
+        _write_classes(lines, rng, spec, name, spec.classes)
+
+        path = os.path.join(src, '%s.cpp' % name)
+        with open(path, 'w') as fh:
+            fh.write('\n'.join(lines) + '\n')
+
+        paths.append(path)
+        commands.append({
+            'directory': directory,
+            'file': path,
+            'arguments': ['c++', '-x', 'c++', '-I%s' % include, '-c', path],
+        })
+
+    with open(os.path.join(directory, 'compile_commands.json'), 'w') as fh:
+        json.dump(commands, fh, indent=2)
+
+    return paths
+
+def clang_args(directory):
+    """Arguments for parsing the source files of a generated corpus."""
+    return ['-x', 'c++', '-I%s' % os.path.join(os.path.abspath(directory),
+        'include')]
@@ -0,0 +1,164 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file contains code for timing the parser on a corpus and comparing
+# results against a baseline.
+
+from .. import __version__
+from ..cache import libclang_version
+from ..observer.base import DefinitionObserver, TokenObserver
+from ..parser import Parser
+from ..stats import ParseStats, peak_memory
+
+import json
+import platform
+import time
+
+# Version of the result format. Results of different formats can't be
+# compared.
+FORMAT = 1
+
+# Metrics compared by compare(). Values are True if higher is better.
+METRICS = {
+    'files_per_sec': True,
+    'bytes_per_sec': True,
+    'cursors_per_sec': True,
+    'tokens_per_sec': True,
+    'wall': False,
+    'peak_memory': False,
+}
+
+class CountDefinitionObserver(DefinitionObserver):
+    def __init__(self):
+        self.count = 0
+
+    def process_definition(self, d):
+        self.count += 1
+
+class CountTokenObserver(TokenObserver):
+    def __init__(self):
+        self.count = 0
+
+    def process_tokens(self, batch):
+        self.count += len(batch)
+
+def create_parser(tokens=True, stats=None):
+    parser = Parser(stats=stats)
+    parser.add_observer(CountDefinitionObserver())
+
+    if tokens:
+        parser.add_observer(CountTokenObserver())
+
+    return parser
+
+def run(paths, clang_args=None, repeat=3, tokens=True, spec=None):
+    """Time parsing a set of files.
+
+    Files are parsed serially in this process. The end-to-end time is the
+    best of repeat runs without instrumentation. An additional run records
+    a stats.ParseStats, which provides counts and the time of each phase.
+
+    paths -- Filenames to parse.
+    clang_args -- Arguments to parse each file with.
+    repeat -- Number of timed runs.
+    tokens -- Whether to register a token observer, so the token stream is
+      measured.
+    spec -- corpus.CorpusSpec the files were generated from, if any. It is
+      recorded in the result.
+
+    Returns a dict of JSON-compatible types.
+    """
+    args = list(clang_args or [])
+
+    best = None
+    for i in range(repeat):
+        parser = create_parser(tokens)
+
+        start = time.perf_counter()
+        for path in paths:
+            parser.parse(filename=path, clang_args=args)
+        wall = time.perf_counter() - start
+
+        if best is None or wall < best:
+            best = wall
+
+    stats = ParseStats()
+    parser = create_parser(tokens, stats)
+    for path in paths:
+        parser.parse(filename=path, clang_args=args)
+
+    def rate(count):
+        return count / best if best else 0.0
+
+    return {
+        'format': FORMAT,
+        'environment': {
+            'clanalyze': __version__,
+            'libclang': libclang_version(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'corpus': spec.to_dict() if spec is not None else None,
+        'repeat': repeat,
+        'tokens': tokens,
+        'files': len(paths),
+        'wall': best,
+        'files_per_sec': rate(len(paths)),
+        'bytes_per_sec': rate(stats.bytes),
+        'cursors_per_sec': rate(stats.cursors),
+        'tokens_per_sec': rate(stats.tokens),
+        'peak_memory': peak_memory(),
+        'phases': dict((k, v.wall) for k, v in stats.phases.items()),
+        'stats': stats.to_dict(),
+    }
+
+def compare(result, baseline, tolerance=0.1):
+    """Compare a result against a baseline result.
+
+    Throughput metrics, the end-to-end time, peak memory, and the time of
+    each phase are compared.
+
+    tolerance -- Fraction by which a metric may be worse than the baseline
+      before it is considered a regression.
+
+    Returns a list of (metric, baseline value, value) tuples for metrics
+    that regressed.
+    """
+    if result.get('format') != baseline.get('format'):
+        raise Exception('Results have different formats.')
+
+    if result.get('corpus') != baseline.get('corpus'):
+        raise Exception('Results were obtained from different corpora.')
+
+    metrics = [(k, result.get(k), baseline.get(k), higher) for k, higher in
+            sorted(METRICS.items())]
+    for name in sorted(baseline.get('phases', {})):
+        metrics.append(('phases.%s' % name, result['phases'].get(name),
+            baseline['phases'][name], False))
+
+    regressions = []
+    for name, value, base, higher in metrics:
+        if value is None or base is None:
+            continue
+
+        if higher:
+            regressed = value < base * (1 - tolerance)
+        else:
+            regressed = value > base * (1 + tolerance)
+
+        if regressed:
+            regressions.append((name, base, value))
+
+    return regressions
+
+def load(path):
+    """Load a result from a JSON file."""
+    with open(path, 'r') as fh:
+        return json.load(fh)
+
+def save(result, path):
+    """Write a result to a JSON file."""
+    with open(path, 'w') as fh:
+        json.dump(result, fh, indent=2, sort_keys=True)
+        fh.write('\n')
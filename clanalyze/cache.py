@@ -0,0 +1,279 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file contains a persistent on-disk cache of the declarations derived
+# from parsing translation units.
+
+from . import __version__
+
+import clang.cindex
+import ctypes
+import errno
+import hashlib
+import os
+import pickle
+import tempfile
+
+# Version of the format of cache entries. Increment when the attributes of
+# declarations change, so stale entries aren't used.
+FORMAT = 5
+
+def libclang_version():
+    """Obtain the version string of the loaded libclang."""
+    # clang.cindex doesn't declare this function. A prototype of our own
+    # avoids changing the function object shared with other users of
+    # conf.lib.
+    prototype = ctypes.CFUNCTYPE(clang.cindex._CXString)
+    try:
+        f = prototype(('clang_getClangVersion', clang.cindex.conf.lib))
+    except AttributeError:
+        return 'unknown'
+
+    return clang.cindex._CXString.from_result(f())
+
+class DeclarationCache(object):
+    """Persistent cache of declarations produced by parsing files.
+
+    The cache stores the definition notifications emitted while parsing a
+    translation unit. When the same source is parsed again with the same
+    arguments, the notifications are replayed to definition observers without
+    invoking libclang.
+
+    Entries are keyed by the filename, a hash of the source content, the
+    Clang arguments and parse options, the libclang version, and the
+    Clanalyze version. Entries also record the content hashes of the files
+    the translation unit depended on, such as included headers. An entry
+    whose dependencies changed is treated as a miss and removed.
+
+    The cache is only consulted when no cursor or token observers besides the
+    built-in ones are registered with the parser, since those need a live
+    translation unit.
+    """
+
+    def __init__(self, path, max_size=None):
+        """Create a cache backed by a directory.
+
+        path -- Directory holding cache entries. It is created if it does not
+          exist.
+        max_size -- Maximum size of the cache in bytes. When exceeded, the
+          least recently used entries are deleted. None means unbounded.
+        """
+        self.path = path
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+
+        # Total size of entries. Computed lazily because it requires scanning
+        # the directory.
+        self._size = None
+
+        # Filename -> (mtime, size, content hash) of dependencies hashed so
+        # far. Headers are shared by many entries, so they are only hashed
+        # again when they were modified.
+        self._hashes = {}
+
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+        self._version = '%s\0%s\0%d' % (libclang_version(), __version__,
+                FORMAT)
+
+    def key(self, filename, content, args, options=0, variant=None):
+        """Compute the cache key for a source file.
+
+        content -- bytes of the source file.
+        args -- Arguments the file is parsed with.
+        options -- TranslationUnit.PARSE_* flags the file is parsed with.
+        variant -- str distinguishing the definitions of differently
+          configured parsers, or None.
+        """
+        h = hashlib.sha1()
+        h.update(self._version.encode('utf-8'))
+        h.update(b'\0')
+        h.update(filename.encode('utf-8'))
+        h.update(b'\0')
+        h.update('\0'.join(args).encode('utf-8'))
+        h.update(b'\0')
+        h.update(str(options).encode('utf-8'))
+        h.update(b'\0')
+        if variant is not None:
+            h.update(variant.encode('utf-8'))
+            h.update(b'\0')
+        h.update(content)
+
+        return h.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, key[0:2], key)
+
+    def _hash(self, filename):
+        """Obtain the content hash of a file, or None if it doesn't exist."""
+        try:
+            st = os.stat(filename)
+            known = self._hashes.get(filename)
+            if known is not None and known[0:2] == (st.st_mtime, st.st_size):
+                return known[2]
+
+            h = hashlib.sha1()
+            with open(filename, 'rb') as fh:
+                h.update(fh.read())
+        except (IOError, OSError):
+            return None
+
+        digest = h.hexdigest()
+        self._hashes[filename] = (st.st_mtime, st.st_size, digest)
+
+        return digest
+
+    def get(self, key):
+        """Obtain the cached definition events for a key.
+
+        Returns a list of (method, args) tuples or None if there is no entry
+        for the key, or if a dependency of the entry changed.
+        """
+        path = self._entry_path(key)
+
+        try:
+            with open(path, 'rb') as fh:
+                dependencies, events = pickle.load(fh)
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        except Exception:
+            # Corrupt entries are treated as a miss and removed.
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        for filename, digest in dependencies:
+            if self._hash(filename) != digest:
+                self._remove(path)
+                self.misses += 1
+                return None
+
+        # The modification time tracks when an entry was last used.
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        self.hits += 1
+
+        return events
+
+    def put(self, key, events, dependencies=()):
+        """Store definition events under a key.
+
+        dependencies -- Filenames besides the main file the events depend on,
+          such as included headers. Their current content is recorded, and
+          the entry is only used while it is unchanged.
+        """
+        path = self._entry_path(key)
+        dependencies = [(f, self._hash(f)) for f in sorted(set(dependencies))]
+        directory = os.path.dirname(path)
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+        # Entries are written to a temporary file and renamed so concurrent
+        # readers never see partial entries.
+        fd, temp = tempfile.mkstemp(dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                pickle.dump((dependencies, events), fh,
+                        pickle.HIGHEST_PROTOCOL)
+
+            size = os.path.getsize(temp)
+
+            # An entry being replaced no longer counts towards the size.
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+
+            os.rename(temp, path)
+        except Exception:
+            self._remove(temp)
+            raise
+
+        self.stores += 1
+
+        if self._size is not None:
+            self._size += size - replaced
+
+        if self.max_size is not None:
+            self._evict()
+
+    def _entries(self):
+        """Obtain a list of (mtime, size, path) for all entries."""
+        entries = []
+        for root, dirs, files in os.walk(self.path):
+            for f in files:
+                path = os.path.join(root, f)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+
+                entries.append((st.st_mtime, st.st_size, path))
+
+        return entries
+
+    def _evict(self):
+        if self._size is not None and self._size <= self.max_size:
+            return
+
+        entries = self._entries()
+        self._size = sum(e[1] for e in entries)
+
+        if self._size <= self.max_size:
+            return
+
+        entries.sort()
+        for mtime, size, path in entries:
+            if self._size <= self.max_size:
+                break
+
+            self._remove(path)
+            self._size -= size
+            self.evictions += 1
+
+    def _remove(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        """Delete all entries from the cache."""
+        for mtime, size, path in self._entries():
+            self._remove(path)
+
+        self._size = 0
+
+    def stats(self):
+        """Obtain statistics about the cache.
+
+        Returns a dict with the number of hits, misses, stores, and evictions
+        performed through this instance, as well as the number of entries and
+        total size in bytes of the cache on disk.
+        """
+        entries = self._entries()
+        self._size = sum(e[1] for e in entries)
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'stores': self.stores,
+            'evictions': self.evictions,
+            'entries': len(entries),
+            'size': self._size,
+        }
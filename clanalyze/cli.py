@@ -0,0 +1,338 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file contains the implementation of the clanalyze command line tool.
+
+from .cache import DeclarationCache
+from .export import BinaryExporter
+from .observer.base import DefinitionObserver
+from .parser import Parser
+from .pch import PrecompiledHeaders
+from .symbols import SymbolIndex
+from . import incremental
+from . import project
+from . import shard
+
+import argparse
+import importlib
+import shutil
+import sys
+import tempfile
+
+class PrintDefinitionObserver(DefinitionObserver):
+    """Definition observer that prints a summary of each definition."""
+
+    def __init__(self, fh=None):
+        self.fh = fh or sys.stdout
+
+    def process_class_definition(self, c):
+        filename, line, column, offset = c.start_location
+        self.fh.write('%s:%d:%d: class %s (%d fields)\n' % (filename, line,
+            column, c.name, len(c.fields)))
+
+    def process_definition(self, d):
+        filename, line, column, offset = d.start_location
+        self.fh.write('%s:%d:%d: %s %s\n' % (filename, line, column,
+            type(d).__name__.lower(), d.name))
+
+def load_observer(spec):
+    """Instantiate an observer from a "module:ClassName" string."""
+    if ':' not in spec:
+        raise Exception('Observer must be specified as module:ClassName: %s' %
+                spec)
+
+    module_name, class_name = spec.split(':', 1)
+    module = importlib.import_module(module_name)
+
+    return getattr(module, class_name)()
+
+def add_selection_arguments(parser):
+    parser.add_argument('-p', '--database', default='.',
+            help='Path to compile_commands.json or a directory containing it.')
+    parser.add_argument('--include', action='append', default=[],
+            metavar='GLOB', help='Only analyze files matching this pattern.')
+    parser.add_argument('--exclude', action='append', default=[],
+            metavar='GLOB', help='Do not analyze files matching this pattern.')
+    parser.add_argument('--observer', action='append', default=[],
+            metavar='MODULE:CLASS',
+            help='Observer to register. Defaults to printing definitions.')
+    parser.add_argument('--cache', metavar='DIR',
+            help='Directory in which to cache definitions between runs.')
+    parser.add_argument('--cache-size', type=int, metavar='BYTES',
+            help='Maximum size of the definition cache.')
+    parser.add_argument('--skip-seen-headers', action='store_true',
+            help='Only process the content of each header once.')
+    parser.add_argument('--main-file-only', action='store_true',
+            help='Ignore declarations outside the files being analyzed.')
+    parser.add_argument('--memory-budget', type=int, metavar='MB',
+            help='Limit the memory used by parsing, in megabytes. Each file '
+                'is parsed in a new worker process.')
+
+def create_parser(args, extra_observers=(), observers=None):
+    """Create a Parser with the observers requested on the command line.
+
+    extra_observers -- Observers registered in addition to those requested
+      with --observer. Definitions are only printed by default if there are
+      none.
+    observers -- Observers to register instead of those requested with
+      --observer. Definitions are never printed by default if given.
+    """
+    cache = None
+    if args.cache:
+        cache = DeclarationCache(args.cache, max_size=args.cache_size)
+
+    parser = Parser(cache=cache, skip_seen_headers=args.skip_seen_headers,
+            main_file_only=args.main_file_only)
+
+    if observers is None:
+        observers = [load_observer(spec) for spec in args.observer]
+        if not observers and not extra_observers:
+            observers = [PrintDefinitionObserver()]
+
+    observers = list(observers) + list(extra_observers)
+
+    for obs in observers:
+        parser.add_observer(obs)
+
+    return parser
+
+def memory_budget(args):
+    """Obtain the memory budget in bytes given on the command line."""
+    if args.memory_budget is None:
+        return None
+
+    return args.memory_budget * 1024 * 1024
+
+def report_failures(results):
+    """Print failed files to stderr. Returns the process exit code."""
+    failures = [r for r in results if not r.ok]
+    for result in failures:
+        sys.stderr.write('error: %s: %s\n' % (result.filename, result.error))
+
+    return 1 if failures else 0
+
+def command_analyze(args):
+    extra = []
+    if args.index:
+        extra.append(SymbolIndex(args.index))
+    if args.export:
+        extra.append(BinaryExporter(args.export))
+
+    parser = create_parser(args, extra)
+
+    pch = None
+    if args.pch:
+        pch = PrecompiledHeaders(args.pch, prelude=args.prelude)
+
+    try:
+        if args.incremental:
+            return command_analyze_incremental(args, parser, pch)
+
+        results = project.analyze(parser, args.database,
+                include=args.include, exclude=args.exclude, workers=args.jobs,
+                order=args.order, fail_fast=args.fail_fast, pch=pch,
+                memory_budget=memory_budget(args))
+    finally:
+        for obs in extra:
+            obs.close()
+
+    return report_failures(results)
+
+def command_analyze_incremental(args, parser, pch):
+    database = project.CompilationDatabase(args.database)
+    commands = database.select(include=args.include, exclude=args.exclude,
+            order=args.order)
+    jobs = [(c.filename, c.args) for c in commands]
+
+    state = incremental.DependencyState(args.incremental)
+
+    kwargs = {'workers': args.jobs, 'fail_fast': args.fail_fast, 'pch': pch,
+            'memory_budget': memory_budget(args)}
+
+    if not args.watch:
+        return report_failures(incremental.analyze(parser, jobs, state,
+            **kwargs))
+
+    try:
+        incremental.watch(parser, jobs, state, interval=args.interval,
+                callback=report_failures, **kwargs)
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+def command_shard(args):
+    observers = [load_observer(spec) for spec in args.observer]
+    parser = create_parser(args, observers=observers)
+
+    database = project.CompilationDatabase(args.database)
+    commands = database.select(include=args.include, exclude=args.exclude,
+            order='database')
+
+    results = shard.run_shard(parser, [(c.filename, c.args) for c in
+        commands], args.shard, args.shards, args.output,
+        strategy=args.strategy,
+        observers=[o for o in observers
+            if not isinstance(o, DefinitionObserver)],
+        workers=args.jobs, fail_fast=args.fail_fast,
+        memory_budget=memory_budget(args))
+
+    return report_failures(results)
+
+def command_merge(args):
+    observers = [load_observer(spec) for spec in args.observer]
+    if not observers and not args.output:
+        observers = [PrintDefinitionObserver()]
+
+    summary = shard.merge(args.files, output=args.output,
+            observers=observers, partial=args.partial)
+
+    for index, filename, error in summary['errors']:
+        sys.stderr.write('error: %s: %s\n' % (filename, error))
+
+    return 1 if summary['errors'] else 0
+
+def command_bench(args):
+    from .bench import corpus, runner
+
+    spec = corpus.CorpusSpec(files=args.files, classes=args.classes,
+            fields=args.fields, namespace_depth=args.namespace_depth,
+            token_density=args.token_density, headers=args.headers,
+            header_fanout=args.header_fanout, seed=args.seed)
+
+    directory = args.corpus or tempfile.mkdtemp()
+    try:
+        paths = corpus.generate(directory, spec)
+        result = runner.run(paths, corpus.clang_args(directory),
+                repeat=args.repeat, tokens=not args.no_tokens, spec=spec)
+    finally:
+        if not args.corpus:
+            shutil.rmtree(directory)
+
+    for key in ('files_per_sec', 'bytes_per_sec', 'cursors_per_sec',
+            'tokens_per_sec'):
+        print('%s: %.1f' % (key, result[key]))
+
+    for name, wall in sorted(result['phases'].items()):
+        print('phase %s: %.3fs' % (name, wall))
+
+    if args.output:
+        runner.save(result, args.output)
+
+    if not args.baseline:
+        return 0
+
+    regressions = runner.compare(result, runner.load(args.baseline),
+            args.tolerance)
+    for name, base, value in regressions:
+        sys.stderr.write('regression: %s: %s -> %s\n' % (name, base, value))
+
+    return 1 if regressions else 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='clanalyze',
+            description='C language analyzer.')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    analyze = subparsers.add_parser('analyze',
+            help='Analyze files listed in a compilation database.')
+    add_selection_arguments(analyze)
+    analyze.add_argument('-j', '--jobs', type=int, default=None,
+            help='Number of worker processes. Defaults to the number of CPUs.')
+    analyze.add_argument('--order', choices=['size', 'database'],
+            default='size', help='Order in which files are scheduled.')
+    analyze.add_argument('--fail-fast', action='store_true',
+            help='Stop at the first file that fails to parse.')
+    analyze.add_argument('--index', metavar='FILE',
+            help='Add definitions to a SQLite symbol index in this file.')
+    analyze.add_argument('--export', metavar='FILE',
+            help='Write definitions to a binary export file.')
+    analyze.add_argument('--pch', metavar='DIR',
+            help='Precompile headers common to files and cache them here.')
+    analyze.add_argument('--prelude', metavar='HEADER',
+            help='Precompile this header instead of detecting common '
+                'headers. Requires --pch.')
+    analyze.add_argument('--incremental', metavar='FILE',
+            help='Only analyze files whose dependencies changed since the '
+                'last run. Dependencies are recorded in this file.')
+    analyze.add_argument('--watch', action='store_true',
+            help='Keep analyzing files as they change. Requires '
+                '--incremental.')
+    analyze.add_argument('--interval', type=float, default=1.0,
+            help='Seconds between checks for changes when watching.')
+    analyze.set_defaults(func=command_analyze)
+
+    shard_parser = subparsers.add_parser('shard',
+            help='Analyze one shard of the files in a compilation database.')
+    add_selection_arguments(shard_parser)
+    shard_parser.add_argument('--shard', type=int, required=True,
+            help='Index of the shard to analyze, starting at 0.')
+    shard_parser.add_argument('--shards', type=int, required=True,
+            help='Total number of shards.')
+    shard_parser.add_argument('--strategy', choices=shard.STRATEGIES,
+            default='hash', help='How files are assigned to shards.')
+    shard_parser.add_argument('-o', '--output', required=True,
+            metavar='FILE', help='File to write the results of the shard to.')
+    shard_parser.add_argument('-j', '--jobs', type=int, default=None,
+            help='Number of worker processes. Defaults to the number of CPUs.')
+    shard_parser.add_argument('--fail-fast', action='store_true',
+            help='Stop at the first file that fails to parse.')
+    shard_parser.set_defaults(func=command_shard)
+
+    merge = subparsers.add_parser('merge',
+            help='Merge the results of shards.')
+    merge.add_argument('files', nargs='+', metavar='FILE',
+            help='Result files written by the shard command.')
+    merge.add_argument('-o', '--output', metavar='FILE',
+            help='File to write the merged results to.')
+    merge.add_argument('--observer', action='append', default=[],
+            metavar='MODULE:CLASS',
+            help='Observer to send merged results to. Defaults to printing '
+                'definitions unless --output is given.')
+    merge.add_argument('--partial', action='store_true',
+            help='Allow merging a subset of the shards.')
+    merge.set_defaults(func=command_merge)
+
+    bench = subparsers.add_parser('bench',
+            help='Measure throughput on a synthetic corpus.')
+    bench.add_argument('--files', type=int, default=10,
+            help='Number of source files to generate.')
+    bench.add_argument('--classes', type=int, default=50,
+            help='Number of classes in each source file.')
+    bench.add_argument('--fields', type=int, default=5,
+            help='Number of fields in each class.')
+    bench.add_argument('--namespace-depth', type=int, default=1,
+            help='Depth of namespaces classes are defined in.')
+    bench.add_argument('--token-density', type=int, default=4,
+            help='Number of statements in the method body of each class.')
+    bench.add_argument('--headers', type=int, default=10,
+            help='Number of shared headers to generate.')
+    bench.add_argument('--header-fanout', type=int, default=3,
+            help='Number of headers each source file includes.')
+    bench.add_argument('--seed', type=int, default=0,
+            help='Seed of the corpus generator.')
+    bench.add_argument('--corpus', metavar='DIR',
+            help='Directory to generate the corpus in and keep it.')
+    bench.add_argument('--repeat', type=int, default=3,
+            help='Number of timed runs. The best is reported.')
+    bench.add_argument('--no-tokens', action='store_true',
+            help='Do not measure the token stream.')
+    bench.add_argument('-o', '--output', metavar='FILE',
+            help='Write results as JSON to this file.')
+    bench.add_argument('--baseline', metavar='FILE',
+            help='Compare results against a previously written file.')
+    bench.add_argument('--tolerance', type=float, default=0.1,
+            help='Fraction by which metrics may regress (default 0.1).')
+    bench.set_defaults(func=command_bench)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'analyze':
+        if args.prelude and not args.pch:
+            analyze.error('--prelude requires --pch')
+        if args.watch and not args.incremental:
+            analyze.error('--watch requires --incremental')
+
+    return args.func(args)
@@ -5,9 +5,15 @@
 # This file defines classes which represent declarations in C language
 # files.
 
-import clang.cindex
 import collections
 
+def _filename(f):
+    """Obtain the name of a Clang File, which may be None."""
+    if f is None:
+        return None
+
+    return f.name
+
 class Declaration(object):
     """The base class for all declarations.
 
@@ -22,12 +28,15 @@ class Declaration(object):
     Declarations all contain the following properties:
 
     end_location -- The source location where the declaration ends. Is a tuple
-        of (filename, line, column, offset). Line and column are indexed from
-        1. Offset is the byte offset in the source file.
+        of (filename, line, column, offset). Filename is a str, or None if the
+        location isn't in a file. Line and column are indexed from 1. Offset
+        is the byte offset in the source file.
 
     start_location -- The source location where the declaration starts. Is a
-        tuple of (filename, line, column, offset). Line and column are indexed
-        from 1. Offset is the byte offset in the source file.
+        tuple of (filename, line, column, offset), like end_location.
+
+    Declarations only hold plain Python values. They don't reference libclang
+    objects, so keeping them doesn't keep translation units alive.
 
     usr -- The Unified Symbol Resolution (USR) string for the entity. These
         are effectively global identifiers that can be used to test for
@@ -53,15 +62,60 @@ class Declaration(object):
         self.spelling = cursor.spelling
         self.usr = cursor.get_usr()
 
-        start = cursor.extent.start
-        end = cursor.extent.end
-        # TODO normalize file to a sane type
-        self.start_location = (start.file, start.line, start.column,
-                start.offset)
-        self.end_location = (end.file, end.line, end.column, end.offset)
+        extent = cursor.extent
+        start = extent.start
+        end = extent.end
+        self.start_location = (_filename(start.file), start.line,
+                start.column, start.offset)
+        self.end_location = (_filename(end.file), end.line, end.column,
+                end.offset)
 
         self._init()
 
+    def __getstate__(self):
+        """Obtain the picklable state of the declaration.
+
+        Declarations are sent between processes when parsing in parallel.
+        """
+        state = {}
+        for cls in type(self).__mro__:
+            for name in getattr(cls, '__slots__', ()):
+                if hasattr(self, name):
+                    state[name] = getattr(self, name)
+
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def to_dict(self):
+        """Obtain a dict of JSON-compatible values describing the declaration.
+
+        The dict holds the state of the declaration plus a 'kind' key naming
+        its class. It can be converted back with from_dict().
+        """
+        d = self.__getstate__()
+        d['kind'] = type(self).__name__
+
+        for name in ('start_location', 'end_location'):
+            if d.get(name) is not None:
+                d[name] = list(d[name])
+
+        return d
+
+    @classmethod
+    def _state_from_dict(cls, d):
+        """Convert a dict from to_dict() to the state of an instance."""
+        state = dict(d)
+        del state['kind']
+
+        for name in ('start_location', 'end_location'):
+            if state.get(name) is not None:
+                state[name] = tuple(state[name])
+
+        return state
+
     def _init(self):
         """Called during instance initialization.
 
@@ -70,6 +124,14 @@ class Declaration(object):
         """
         pass
 
+    def children(self):
+        """Obtain the list of declarations this declaration encloses.
+
+        These are members, such as the fields and methods of a class or the
+        constants of an enum, in declaration order.
+        """
+        return []
+
 class Class(Declaration):
     """Represents the declaration of a C++ class.
 
@@ -79,21 +141,223 @@ class Class(Declaration):
       It is an ordered dictionary where keys are the field name and
       values are Field instances. The order is the order in which the fields
       were declared in the class definition.
+
+    methods -- List of Method instances for the methods declared in this
+      class, including constructors and destructors, in declaration order.
+      Overloads share a spelling, so this isn't keyed by name.
     """
 
     __slots__ = (
         'fields',
+        'methods',
     )
 
     def _init(self):
         self.fields = collections.OrderedDict()
+        self.methods = []
+
+    def children(self):
+        return list(self.fields.values()) + self.methods
+
+    def to_dict(self):
+        d = Declaration.to_dict(self)
+        d['fields'] = [f.to_dict() for f in self.fields.values()]
+        d['methods'] = [m.to_dict() for m in self.methods]
+
+        return d
+
+    @classmethod
+    def _state_from_dict(cls, d):
+        state = super(Class, cls)._state_from_dict(d)
+        state['fields'] = collections.OrderedDict((f['name'], from_dict(f))
+                for f in d.get('fields', []))
+        state['methods'] = [from_dict(m) for m in d.get('methods', [])]
+
+        return state
+
+class Struct(Class):
+    """Represents the declaration of a C or C++ struct.
+
+    Structs have the same properties as classes.
+    """
+
+    __slots__ = ()
+
+class Union(Class):
+    """Represents the declaration of a C or C++ union.
+
+    Unions have the same properties as classes.
+    """
+
+    __slots__ = ()
 
 class Field(Declaration):
-    """Represents a C++ class field."""
+    """Represents a C++ class field.
+
+    This class contains the following properties:
+
+    type -- The spelling of the field's type.
+
+    type_usr -- The USR of the declaration of the field's type, with
+      pointers, references, and arrays stripped. None if the type isn't
+      declared in source, such as built-in types.
+    """
 
     __slots__ = (
+        'type',
+        'type_usr',
+    )
+
+    def _init(self):
+        self.type = None
+        self.type_usr = None
+
+class Function(Declaration):
+    """Represents the declaration of a function.
+
+    This class contains the following properties:
 
+    type -- The spelling of the function's type, such as 'int (char *)'.
+
+    result_type -- The spelling of the type the function returns.
+
+    arguments -- List of (name, type spelling) tuples describing the
+      function's parameters. Names are empty for unnamed parameters.
+    """
+
+    __slots__ = (
+        'arguments',
+        'result_type',
+        'type',
     )
 
     def _init(self):
-        pass
+        self.type = None
+        self.result_type = None
+        self.arguments = []
+
+    def to_dict(self):
+        d = Declaration.to_dict(self)
+        d['arguments'] = [list(a) for a in self.arguments]
+
+        return d
+
+    @classmethod
+    def _state_from_dict(cls, d):
+        state = super(Function, cls)._state_from_dict(d)
+        state['arguments'] = [tuple(a) for a in d.get('arguments', [])]
+
+        return state
+
+class Method(Function):
+    """Represents the declaration of a C++ method, constructor or destructor.
+
+    In addition to the properties of functions, this class contains:
+
+    is_static -- Whether the method is static.
+
+    is_virtual -- Whether the method is virtual.
+
+    is_const -- Whether the method is const qualified.
+    """
+
+    __slots__ = (
+        'is_const',
+        'is_static',
+        'is_virtual',
+    )
+
+    def _init(self):
+        Function._init(self)
+        self.is_static = False
+        self.is_virtual = False
+        self.is_const = False
+
+class Enum(Declaration):
+    """Represents the declaration of an enumeration.
+
+    This class contains the following properties:
+
+    type -- The spelling of the underlying integer type.
+
+    constants -- Ordered dictionary of constant names to EnumConstant
+      instances, in declaration order.
+    """
+
+    __slots__ = (
+        'constants',
+        'type',
+    )
+
+    def _init(self):
+        self.type = None
+        self.constants = collections.OrderedDict()
+
+    def children(self):
+        return list(self.constants.values())
+
+    def to_dict(self):
+        d = Declaration.to_dict(self)
+        d['constants'] = [c.to_dict() for c in self.constants.values()]
+
+        return d
+
+    @classmethod
+    def _state_from_dict(cls, d):
+        state = super(Enum, cls)._state_from_dict(d)
+        state['constants'] = collections.OrderedDict((c['name'],
+            from_dict(c)) for c in d.get('constants', []))
+
+        return state
+
+class EnumConstant(Declaration):
+    """Represents a constant of an enumeration.
+
+    This class contains the following properties:
+
+    value -- The integer value of the constant.
+    """
+
+    __slots__ = (
+        'value',
+    )
+
+    def _init(self):
+        self.value = None
+
+class Typedef(Declaration):
+    """Represents a typedef or type alias.
+
+    This class contains the following properties:
+
+    type -- The spelling of the type being aliased.
+
+    type_usr -- The USR of the declaration of the aliased type, with
+      pointers, references, and arrays stripped. None if the type isn't
+      declared in source.
+    """
+
+    __slots__ = (
+        'type',
+        'type_usr',
+    )
+
+    def _init(self):
+        self.type = None
+        self.type_usr = None
+
+# Declaration classes by name, as stored in the 'kind' key of dicts obtained
+# by Declaration.to_dict().
+TYPES = dict((cls.__name__, cls) for cls in (Class, Struct, Union, Field,
+    Function, Method, Enum, EnumConstant, Typedef))
+
+def from_dict(d):
+    """Construct a declaration from a dict obtained by Declaration.to_dict()."""
+    cls = TYPES.get(d.get('kind'))
+    if cls is None:
+        raise Exception('Unknown declaration kind: %s' % d.get('kind'))
+
+    declaration = cls.__new__(cls)
+    declaration.__setstate__(cls._state_from_dict(d))
+
+    return declaration
@@ -0,0 +1,411 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file contains a compact binary file format for declarations, along
+# with an observer writing it and a reader memory-mapping it.
+
+from .declaration import Class
+from .observer.base import DefinitionObserver
+from .store import (KIND_CODES, StringTable, VIEWS, children_of, flags_of,
+    stored_value)
+
+import array
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+# Identifies export files.
+MAGIC = b'CLZX'
+
+# Version of the file format.
+FORMAT = 2
+
+"""Layout of the file header.
+
+magic, format -- See MAGIC and FORMAT.
+record_size -- Size in bytes of each declaration record.
+record_count -- Number of declaration records.
+string_count -- Number of strings in the string table.
+records_offset -- File offset of the first record.
+string_index_offset -- File offset of the string index: string_count + 1
+  unsigned 64-bit offsets into the string data. String i spans from entry i
+  to entry i + 1.
+string_data_offset -- File offset of the UTF-8 string data.
+"""
+HEADER = struct.Struct('<4sIII5Q')
+
+# The header is padded so records are aligned.
+HEADER_SIZE = 64
+
+"""Fields of declaration records, in order.
+
+Each field corresponds to the column of the same name in
+store.DeclarationStore and has the same meaning. String and filename fields
+are ids in the string table, -1 meaning None.
+"""
+RECORD_FIELDS = (
+    ('kinds', 'B'),
+    ('flags', 'B'),
+    (None, '2x'),
+    ('names', 'i'),
+    ('spellings', 'i'),
+    ('usrs', 'i'),
+    ('start_files', 'i'),
+    ('start_lines', 'I'),
+    ('start_columns', 'I'),
+    ('start_offsets', 'I'),
+    ('end_files', 'i'),
+    ('end_lines', 'I'),
+    ('end_columns', 'I'),
+    ('end_offsets', 'I'),
+    ('parents', 'i'),
+    ('child_counts', 'I'),
+    ('types', 'i'),
+    ('type_usrs', 'i'),
+    ('result_types', 'i'),
+    (None, '4x'),
+    ('values', 'q'),
+)
+
+RECORD = struct.Struct('<' + ''.join(code for name, code in RECORD_FIELDS))
+
+def _field_offsets():
+    offsets = {}
+    fmt = '<'
+    for name, code in RECORD_FIELDS:
+        if name is not None:
+            offsets[name] = (struct.calcsize(fmt), struct.Struct('<' + code))
+        fmt += code
+
+    return offsets
+
+# Column name -> (offset within record, struct.Struct of the value).
+FIELD_OFFSETS = _field_offsets()
+
+# Column name -> position in the tuples produced by ExportFile.records().
+FIELD_POSITIONS = dict((name, i) for i, name in
+        enumerate(n for n, code in RECORD_FIELDS if n is not None))
+
+# Number of records decoded at a time when scanning.
+SCAN_BATCH = 8192
+
+class BinaryExporter(DefinitionObserver):
+    """Definition observer writing declarations to an export file.
+
+    Declarations are written as fixed-width records as they arrive. Children
+    of a declaration, such as class fields, immediately follow their parent.
+    Strings and filenames are interned into a string table, which is
+    written when the exporter is closed. Until then, the file is written
+    under a temporary name, so readers never see incomplete files.
+
+    The exporter can be used as a context manager, which closes it.
+    """
+
+    def __init__(self, path):
+        """Create an exporter writing to a file.
+
+        path -- Filename of the export file. It is replaced when the
+          exporter is closed.
+        """
+        self.path = path
+        self.strings = StringTable()
+        self.count = 0
+
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, self._temp = tempfile.mkstemp(dir=directory)
+        self._fh = os.fdopen(fd, 'wb')
+
+        # The header is written on close. Until then, the file has no magic.
+        self._fh.write(b'\0' * HEADER_SIZE)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.discard()
+
+    def process_definition(self, d):
+        self.add(d)
+
+    def flush(self):
+        self._fh.flush()
+
+    def add(self, declaration, parent=-1):
+        """Write a declaration and its children.
+
+        Returns the index of the declaration's record.
+        """
+        code = KIND_CODES.get(type(declaration))
+        if code is None:
+            raise Exception('Unsupported declaration type: %s' %
+                    type(declaration).__name__)
+
+        index = self.count
+        intern = self.strings.intern
+
+        start_file, start_line, start_column, start_offset = \
+                declaration.start_location
+        end_file, end_line, end_column, end_offset = declaration.end_location
+
+        children = children_of(declaration)
+
+        self._fh.write(RECORD.pack(code, flags_of(declaration),
+            intern(declaration.name),
+            intern(declaration.spelling),
+            intern(declaration.usr),
+            intern(getattr(start_file, 'name', start_file)),
+            start_line, start_column, start_offset,
+            intern(getattr(end_file, 'name', end_file)),
+            end_line, end_column, end_offset,
+            parent,
+            len(children),
+            intern(getattr(declaration, 'type', None)),
+            intern(getattr(declaration, 'type_usr', None)),
+            intern(getattr(declaration, 'result_type', None)),
+            stored_value(declaration)))
+        self.count += 1
+
+        for child in children:
+            if children_of(child):
+                raise Exception('Nested children are not supported.')
+
+            self.add(child, index)
+
+        return index
+
+    def close(self):
+        """Write the string table and header and move the file in place."""
+        if self._fh is None:
+            return
+
+        fh = self._fh
+        records_size = self.count * RECORD.size
+
+        data = [s.encode('utf-8') for s in self.strings.strings]
+        offsets = array.array('Q', [0])
+        for s in data:
+            offsets.append(offsets[-1] + len(s))
+
+        if offsets.itemsize != 8:
+            raise Exception('Unsigned long long is not 64 bits.')
+
+        if sys.byteorder == 'big':
+            offsets.byteswap()
+
+        string_index_offset = HEADER_SIZE + records_size
+        string_data_offset = string_index_offset + len(offsets) * 8
+
+        fh.write(offsets.tobytes())
+        for s in data:
+            fh.write(s)
+
+        fh.seek(0)
+        fh.write(HEADER.pack(MAGIC, FORMAT, RECORD.size, 0, self.count,
+            len(data), HEADER_SIZE, string_index_offset, string_data_offset))
+        fh.close()
+        self._fh = None
+
+        os.rename(self._temp, self.path)
+
+    def discard(self):
+        """Stop writing without creating the export file."""
+        if self._fh is None:
+            return
+
+        self._fh.close()
+        self._fh = None
+        os.unlink(self._temp)
+
+class _Column(object):
+    """Sequence of the values of a record field in a memory-mapped file."""
+
+    __slots__ = (
+        '_base',
+        '_count',
+        '_map',
+        '_unpack',
+    )
+
+    def __init__(self, m, base, count, unpack):
+        self._map = m
+        self._base = base
+        self._count = count
+        self._unpack = unpack
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if i < 0 or i >= self._count:
+            raise IndexError('record index out of range')
+
+        return self._unpack(self._map, self._base + i * RECORD.size)[0]
+
+class _Strings(object):
+    """String table of a memory-mapped file.
+
+    Strings are decoded when they are looked up.
+    """
+
+    __slots__ = (
+        '_count',
+        '_data',
+        '_index',
+        '_map',
+    )
+
+    def __init__(self, m, count, index, data):
+        self._map = m
+        self._count = count
+        self._index = index
+        self._data = data
+
+    def __len__(self):
+        return self._count
+
+    def get(self, i):
+        """Obtain the string with an id."""
+        if i < 0:
+            return None
+
+        if i >= self._count:
+            raise IndexError('string id out of range')
+
+        start, end = struct.unpack_from('<2Q', self._map, self._index + i * 8)
+
+        return self._map[self._data + start:self._data + end].decode('utf-8')
+
+class ExportFile(object):
+    """Reader of an export file written by BinaryExporter.
+
+    The file is memory-mapped, so opening it only reads the header. Records
+    are decoded as they are accessed, and pages of the file are loaded by
+    the operating system on demand.
+
+    The reader has the same columns and methods for reading them as
+    store.DeclarationStore, and declarations are accessed through the same
+    views. The reader can be used as a context manager, which closes it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(path, 'rb') as fh:
+            size = os.fstat(fh.fileno()).st_size
+            if size < HEADER_SIZE:
+                raise Exception('Not an export file: %s' % path)
+
+            self._map = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, record_size, _, count, string_count, records_offset,
+                string_index_offset, string_data_offset) = \
+                HEADER.unpack_from(self._map, 0)
+
+        if magic != MAGIC:
+            self.close()
+            raise Exception('Not an export file: %s' % path)
+
+        if version != FORMAT or record_size != RECORD.size:
+            self.close()
+            raise Exception('Unsupported export file format: %s' % path)
+
+        self._count = count
+        self._records_offset = records_offset
+
+        self.strings = _Strings(self._map, string_count, string_index_offset,
+                string_data_offset)
+        # Filenames share the string table.
+        self.files = self.strings
+
+        for name, (offset, field) in FIELD_OFFSETS.items():
+            setattr(self, name, _Column(self._map, records_offset + offset,
+                count, field.unpack_from))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+
+        if i < 0 or i >= self._count:
+            raise IndexError('declaration index out of range')
+
+        return VIEWS[self.kinds[i]](self, i)
+
+    def __iter__(self):
+        for i, kind in enumerate(self.iter_column('kinds')):
+            yield VIEWS[kind](self, i)
+
+    def iter_column(self, name):
+        """Generator of the values of a column for all records.
+
+        This is faster than indexing the column for every record.
+        """
+        position = FIELD_POSITIONS[name]
+        for values in self.records():
+            yield values[position]
+
+    def records(self):
+        """Generator of the raw field tuples of all records, in order.
+
+        Values are in the order of RECORD_FIELDS, without padding. See
+        FIELD_POSITIONS. Records are decoded in batches, which is much faster
+        than accessing them one at a time.
+        """
+        batch = SCAN_BATCH * RECORD.size
+        start = self._records_offset
+        end = start + self._count * RECORD.size
+
+        while start < end:
+            chunk = self._map[start:min(start + batch, end)]
+            for values in RECORD.iter_unpack(chunk):
+                yield values
+
+            start += batch
+
+    def children(self, i):
+        """Obtain the range of indices of the children of a declaration."""
+        return range(i + 1, i + 1 + self.child_counts[i])
+
+    def indices(self, kind=None, top_level=False):
+        """Generator of indices of declarations.
+
+        kind -- Declaration class (such as declaration.Class) to limit
+          results to.
+        top_level -- Only generate declarations without a parent.
+        """
+        code = None if kind is None else KIND_CODES[kind]
+        kinds = FIELD_POSITIONS['kinds']
+        parents = FIELD_POSITIONS['parents']
+
+        for i, values in enumerate(self.records()):
+            if code is not None and values[kinds] != code:
+                continue
+
+            if top_level and values[parents] != -1:
+                continue
+
+            yield i
+
+    def classes(self):
+        """Generator of views of every class."""
+        for i in self.indices(Class):
+            yield VIEWS[KIND_CODES[Class]](self, i)
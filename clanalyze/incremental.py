@@ -0,0 +1,306 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file contains code for only re-analyzing files whose dependencies
+# changed since they were last analyzed.
+
+from .observer.base import CursorObserver
+
+import clang.cindex
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+# Version of the format of state files.
+FORMAT = 1
+
+class IncludeRecorder(CursorObserver):
+    """Records the files each parsed translation unit includes.
+
+    graph -- dict of main filename to the set of filenames it includes,
+      directly or transitively.
+    """
+
+    PROCESS_KINDS = [clang.cindex.CursorKind.TRANSLATION_UNIT]
+
+    NEEDS_FUNCTION_BODIES = False
+
+    def __init__(self):
+        CursorObserver.__init__(self)
+        self.graph = {}
+
+    def process_cursor(self, cursor):
+        tu = cursor.tu
+        self.graph[tu.spelling] = set(i.include.name for i in
+                tu.get_includes())
+
+    def worker_result(self):
+        graph = self.graph
+        self.graph = {}
+
+        return graph
+
+    def merge_worker_result(self, result):
+        self.graph.update(result)
+
+class DependencyState(object):
+    """Persistent record of what analyzed files depend on.
+
+    For every analyzed file and its arguments, the state holds the files it
+    depends on (itself and every included file) along with their content
+    hashes. A file needs to be analyzed again if its arguments are new or
+    the content of any dependency changed.
+
+    To avoid hashing unchanged files, the modification time and size of
+    dependencies are recorded as well. Files are only hashed when those
+    differ.
+    """
+
+    def __init__(self, path=None):
+        """Load state from a file.
+
+        path -- JSON file holding the state. It doesn't need to exist. None
+          keeps the state in memory.
+        """
+        self.path = path
+
+        # (filename, args tuple) -> list of dependency filenames.
+        self._entries = {}
+        # filename -> (mtime, size, sha1) when the file was last hashed.
+        self._files = {}
+        # filename -> (mtime, size, sha1) or None of files checked during
+        # the current scan.
+        self._scan = None
+        # Like _scan, for the files checked by the last select(). Those
+        # values are what the selected files were analyzed from.
+        self._selected = {}
+
+        if path is not None and os.path.exists(path):
+            with open(path, 'r') as fh:
+                data = json.load(fh)
+
+            if data.get('format') == FORMAT:
+                for entry in data['entries']:
+                    key = (entry['filename'], tuple(entry['args']))
+                    self._entries[key] = entry['dependencies']
+
+                for filename, info in data['files'].items():
+                    self._files[filename] = tuple(info)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _info(self, filename):
+        """Obtain the (mtime, size, sha1) of a file, or None if it doesn't
+        exist."""
+        if self._scan is not None and filename in self._scan:
+            return self._scan[filename]
+
+        try:
+            st = os.stat(filename)
+        except OSError:
+            info = None
+        else:
+            known = self._files.get(filename)
+            if known is not None and known[0:2] == (st.st_mtime, st.st_size):
+                info = known
+            else:
+                h = hashlib.sha1()
+                with open(filename, 'rb') as fh:
+                    h.update(fh.read())
+
+                info = (st.st_mtime, st.st_size, h.hexdigest())
+
+                # The file was touched without changing. Remember its new
+                # modification time so it isn't hashed again.
+                if known is not None and known[2] == info[2]:
+                    self._files[filename] = info
+
+        if self._scan is not None:
+            self._scan[filename] = info
+
+        return info
+
+    def _hash(self, filename):
+        """Obtain the content hash of a file, or None if it doesn't exist."""
+        info = self._info(filename)
+
+        return info[2] if info is not None else None
+
+    def changed(self, filename, args):
+        """Whether a file needs to be analyzed again."""
+        dependencies = self._entries.get((filename, tuple(args)))
+        if dependencies is None:
+            return True
+
+        for path in dependencies:
+            known = self._files.get(path)
+            digest = self._hash(path)
+            if digest is None or known is None or digest != known[2]:
+                return True
+
+        return False
+
+    def select(self, jobs):
+        """Obtain the (filename, args) jobs that need to be analyzed again.
+
+        Files shared by many jobs, such as common headers, are only checked
+        once. The modification times, sizes and hashes of the selected files
+        and their known dependencies are kept for record(), so a file
+        changing while it is analyzed is analyzed again next time.
+        """
+        self._scan = {}
+        try:
+            dirty = [(f, a) for f, a in jobs if self.changed(f, a)]
+
+            # changed() stops at the first difference.
+            for filename, args in dirty:
+                self._info(filename)
+                for path in self._entries.get((filename, tuple(args)), ()):
+                    self._info(path)
+
+            self._selected = self._scan
+        finally:
+            self._scan = None
+
+        return dirty
+
+    def record(self, filename, args, dependencies, hashes=None):
+        """Record the dependencies of an analyzed file.
+
+        Files checked by the last select() are recorded as they were then.
+        Others, such as newly included headers, are checked now.
+
+        dependencies -- Iterable of filenames the file includes.
+        hashes -- dict of filename to content hash for dependencies whose
+          hash is already known, such as headers in a precompiled header.
+          Those are recorded as is, so a change made since they were hashed
+          isn't lost.
+        """
+        hashes = hashes or {}
+        paths = sorted(set(dependencies) | set(hashes) | set([filename]))
+
+        for path in paths:
+            if path in self._selected:
+                info = self._selected[path]
+            else:
+                info = self._info(path)
+
+            if info is None:
+                continue
+
+            digest = hashes.get(path)
+            if digest is not None:
+                info = info[0:2] + (digest,)
+
+            self._files[path] = info
+
+        self._entries[(filename, tuple(args))] = paths
+
+    def forget(self, filename, args):
+        """Remove the record of a file, so it is analyzed again."""
+        self._entries.pop((filename, tuple(args)), None)
+
+    def save(self):
+        """Write the state to its file."""
+        if self.path is None:
+            return
+
+        # Only keep information about files still depended on.
+        used = set()
+        for dependencies in self._entries.values():
+            used.update(dependencies)
+
+        data = {
+            'format': FORMAT,
+            'entries': [{'filename': f, 'args': list(a), 'dependencies': d}
+                for (f, a), d in sorted(self._entries.items())],
+            'files': dict((f, list(info)) for f, info in self._files.items()
+                if f in used),
+        }
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp = tempfile.mkstemp(dir=directory)
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(data, fh)
+
+        os.rename(temp, self.path)
+
+def analyze(parser, jobs, state, workers=None, fail_fast=False, pch=None,
+        memory_budget=None):
+    """Analyze the files whose dependencies changed since the last analysis.
+
+    Files that parse successfully have their dependencies recorded in the
+    state, which is saved afterwards. Failed files are analyzed again next
+    time.
+
+    parser -- Parser to parse files with. Its observers are notified of the
+      definitions of the analyzed files only.
+    jobs -- List of (filename, args) tuples of all files of interest.
+    state -- DependencyState.
+    workers, fail_fast, memory_budget -- See Parser.parse_many().
+    pch -- pch.PrecompiledHeaders instance to parse files with.
+
+    Returns the list of ParseResult for the files that were analyzed.
+    """
+    dirty = state.select([(f, list(a)) for f, a in jobs])
+    if not dirty:
+        return []
+
+    # Translation units parsed against a PCH don't report what it includes,
+    # so we need to know which PCH each file used.
+    parse_jobs = dirty
+    if pch is not None:
+        parse_jobs = pch.prepare(dirty, parser.parse_options())
+
+    recorder = IncludeRecorder()
+    parser.add_observer(recorder)
+    try:
+        results = parser.parse_many(parse_jobs, workers=workers,
+                fail_fast=fail_fast, memory_budget=memory_budget)
+    finally:
+        parser.remove_observer(recorder)
+
+    for (filename, args), (_, parse_args), result in zip(dirty, parse_jobs,
+            results):
+        if not result.ok:
+            state.forget(filename, args)
+            continue
+
+        hashes = None
+        if '-include-pch' in parse_args:
+            hashes = pch.dependencies(
+                    parse_args[parse_args.index('-include-pch') + 1])
+
+        state.record(filename, args, recorder.graph.get(filename, ()),
+                hashes)
+
+    state.save()
+
+    return results
+
+def watch(parser, jobs, state, interval=1.0, callback=None, stop=None,
+        **kwargs):
+    """Continuously analyze files as they or their dependencies change.
+
+    Files are checked by polling their modification times and sizes. Each
+    time files changed, they are analyzed with analyze() and observers
+    registered with the parser are notified of their new definitions.
+
+    interval -- Seconds to wait between checks.
+    callback -- Function called with the list of ParseResult after each
+      analysis that parsed files.
+    stop -- Function returning True when watching should stop. If None,
+      watching continues until interrupted.
+
+    Other keyword arguments are passed to analyze().
+    """
+    while stop is None or not stop():
+        results = analyze(parser, jobs, state, **kwargs)
+        if results and callback is not None:
+            callback(results)
+
+        time.sleep(interval)
@@ -12,14 +12,70 @@ class TokenObserver(object):
     an AST, such as the presence and locations of braces, comments, and raw
     identifiers.
 
-    TODO support filtering
+    Observers can limit the tokens they receive by defining the PROCESS_*
+    attributes below. The parser only tokenizes the parts of a file some
+    observer is interested in, so narrow filters make parsing faster.
     """
 
+    """Define which token kinds this observer handles.
+
+    If True, all tokens are sent to the observer. Otherwise, define an
+    iterable of clang.cindex.TokenKind. e.g. [TokenKind.COMMENT] to only
+    receive comments.
+    """
+    PROCESS_KINDS = True
+
+    """Define which lines of the main file this observer handles.
+
+    If None, tokens on all lines are sent to the observer. Otherwise, define a
+    tuple of (first, last) line numbers, inclusive and indexed from 1.
+    """
+    PROCESS_LINES = None
+
+    """Define which cursors this observer wants the tokens of.
+
+    If None, tokens are not limited by cursors. Otherwise, define an iterable
+    of clang.cindex.CursorKind. Only tokens inside the extents of cursors of
+    these kinds in the main file are sent to the observer. The cursors must
+    be visited during the AST walk: top-level cursors always are, while
+    nested cursors require a cursor observer to request their subtree (see
+    CursorObserver.SUBTREE_KINDS).
+    """
+    PROCESS_CURSOR_KINDS = None
+
+    """Whether this observer needs function bodies to be parsed.
+
+    Tokens are derived from the source text, so token observers don't need
+    function bodies to be parsed. See CursorObserver.NEEDS_FUNCTION_BODIES.
+    """
+    NEEDS_FUNCTION_BODIES = False
+
+    """Whether this observer needs the detailed preprocessing record.
+
+    See CursorObserver.NEEDS_PREPROCESSING_RECORD.
+    """
+    NEEDS_PREPROCESSING_RECORD = False
+
+    def process_tokens(self, batch):
+        """Handler called with a batch of tokens.
+
+        tokens.TokenBatch instances hold many tokens in compact arrays.
+        This is the most efficient way to consume tokens. The batch is only
+        valid for the duration of the call.
+
+        The default implementation calls process_token() for each token in
+        the batch. Child classes should implement either this method or
+        process_token().
+        """
+        for token in batch.wrapped_tokens():
+            self.process_token(token)
+
     def process_token(self, token):
         """Handler called when an individual token is processed.
 
-        This method must be implemented by child classes. It is called
-        by the parser for every token present in the original translation unit.
+        This method must be implemented by child classes not implementing
+        process_tokens(). It is called by the parser for every token present
+        in the original translation unit.
 
         token -- wrapper.Token instance of the token to be processed. The
             instance contains references to the original translation unit and
@@ -27,6 +83,28 @@ class TokenObserver(object):
         """
         raise Exception('process_token must be implemented.')
 
+    def worker_result(self):
+        """Obtain results accumulated in a worker process.
+
+        When files are parsed in parallel via Parser.parse_many(), a copy of
+        this observer runs inside each worker process. After each file is
+        processed, this method is called on the copy. The returned value must
+        be picklable. It is sent back to the parent process and passed to
+        merge_worker_result() on the original observer instance.
+
+        Implementations should return results accumulated since the last
+        call. The default implementation returns None, which means there is
+        nothing to send back.
+        """
+        return None
+
+    def merge_worker_result(self, result):
+        """Merge a result produced by worker_result() in a worker process.
+
+        Results are merged in the order files were given to the parser.
+        """
+        pass
+
 class CursorObserver(object):
     """Base class for observers handling the raw cursor stream from the parser.
 
@@ -49,6 +127,46 @@ class CursorObserver(object):
     """
     PROCESS_KINDS = True
 
+    """Define which cursor kinds this observer wants the children of.
+
+    The parser only descends into the translation unit, namespaces and
+    extern "C" blocks by default. Observers needing to see the members of
+    other cursors, such as the fields of a class, list the kinds of those
+    cursors here. The parser then visits the children of matching cursors
+    and sends them to this observer (subject to PROCESS_KINDS). Once all
+    children of a matching cursor have been visited, end_cursor() is called.
+
+    Cursors within a subtree are only sent to the observers that requested
+    it. So, requesting subtrees doesn't change what other observers see.
+    """
+    SUBTREE_KINDS = ()
+
+    """Whether this observer needs function bodies to be parsed.
+
+    The parser asks libclang to skip parsing function bodies if no
+    registered observer needs them. This makes parsing significantly faster,
+    especially for header-heavy C++. Observers only looking at declarations
+    should set this to False.
+    """
+    NEEDS_FUNCTION_BODIES = True
+
+    """Whether this observer needs the detailed preprocessing record.
+
+    If True, libclang records macro definitions, macro expansions, and
+    inclusion directives and exposes them as cursors. This is implied if
+    PROCESS_KINDS contains preprocessing cursor kinds.
+    """
+    NEEDS_PREPROCESSING_RECORD = False
+
+    """Whether this observer needs every occurrence of header content.
+
+    A parser can be configured to skip top-level cursors in headers it
+    already processed while parsing earlier files. Observers that need to
+    see the content of headers once per including file set this to True,
+    which disables the skipping. It doesn't affect main file only mode.
+    """
+    NEEDS_ALL_OCCURRENCES = False
+
     def __init__(self):
         pass
 
@@ -64,6 +182,29 @@ class CursorObserver(object):
         """
         raise Exception('process_cursor must be implemented.')
 
+    def end_cursor(self, cursor):
+        """Handler called when all children of a cursor have been processed.
+
+        This is only called for cursors whose kind is in SUBTREE_KINDS. It
+        receives the same wrapper.Cursor instance that was passed to
+        process_cursor().
+        """
+        pass
+
+    def worker_result(self):
+        """Obtain results accumulated in a worker process.
+
+        See TokenObserver.worker_result().
+        """
+        return None
+
+    def merge_worker_result(self, result):
+        """Merge a result produced by worker_result() in a worker process.
+
+        See TokenObserver.merge_worker_result().
+        """
+        pass
+
 class DefinitionObserver(object):
     """Base class for observers handling higher-level entity definitions.
 
@@ -76,10 +217,101 @@ class DefinitionObserver(object):
     Clang API.
     """
 
+    """Whether this observer needs function bodies to be parsed.
+
+    Definitions describe declarations, so function bodies aren't needed by
+    default. See CursorObserver.NEEDS_FUNCTION_BODIES.
+    """
+    NEEDS_FUNCTION_BODIES = False
+
+    """Whether this observer needs the detailed preprocessing record.
+
+    See CursorObserver.NEEDS_PREPROCESSING_RECORD.
+    """
+    NEEDS_PREPROCESSING_RECORD = False
+
+    """Whether this observer needs definitions from headers once per file.
+
+    See CursorObserver.NEEDS_ALL_OCCURRENCES.
+    """
+    NEEDS_ALL_OCCURRENCES = False
+
+    def process_definition(self, d):
+        """Process a declaration of any kind.
+
+        The process_*() methods below call this unless they are overridden,
+        so observers treating every kind alike only need to implement this.
+
+        Takes a declaration.Declaration instance.
+        """
+        pass
+
     def process_class_definition(self, c):
         """Process a class definition.
 
         Takes a declaration.Class instance describing the class that was
         defined.
         """
+        self.process_definition(c)
+
+    def process_struct_definition(self, s):
+        """Process a struct definition.
+
+        Takes a declaration.Struct instance describing the struct that was
+        defined.
+        """
+        self.process_definition(s)
+
+    def process_union_definition(self, u):
+        """Process a union definition.
+
+        Takes a declaration.Union instance describing the union that was
+        defined.
+        """
+        self.process_definition(u)
+
+    def process_function_declaration(self, f):
+        """Process a function declaration.
+
+        Takes a declaration.Function instance. This is called for every
+        declaration of a function outside of classes, including prototypes.
+        Unless function bodies are parsed, definitions can't be told apart
+        from prototypes. Methods are part of their class instead.
+        """
+        self.process_definition(f)
+
+    def process_enum_definition(self, e):
+        """Process an enum definition.
+
+        Takes a declaration.Enum instance describing the enum that was
+        defined.
+        """
+        self.process_definition(e)
+
+    def process_typedef_definition(self, t):
+        """Process a typedef or type alias.
+
+        Takes a declaration.Typedef instance.
+        """
+        self.process_definition(t)
+
+    def end_file(self, filename):
+        """Called once a file has been processed.
+
+        All definitions derived from the file have been sent by the time
+        this is called. It is called even if processing the file failed, in
+        which case some or none of its definitions were sent.
+
+        filename -- The filename the parser was given. For content parsed
+          from memory, this is the placeholder name the content was parsed
+          under.
+        """
+        pass
+
+    def flush(self):
+        """Release buffered data, such as by writing it out.
+
+        This is called when a batch runs short of memory. See the
+        memory_budget argument of Parser.parse_many().
+        """
         pass
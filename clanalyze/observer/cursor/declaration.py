@@ -3,48 +3,210 @@
 # You can obtain one at http://mozilla.org/MPL/2.0/.
 
 from ..base import CursorObserver
-from ...declaration import Class, Field
+from ...declaration import (Class, Enum, EnumConstant, Field, Function,
+    Method, Struct, Typedef, Union)
 
 import clang.cindex
 
-class ClassExpander(CursorObserver):
-    """Expands class declarations into a high-level data structure.
+# Type kinds which are stripped to find the declaration a type refers to.
+INDIRECT_TYPE_KINDS = {
+    clang.cindex.TypeKind.POINTER: lambda t: t.get_pointee(),
+    clang.cindex.TypeKind.LVALUEREFERENCE: lambda t: t.get_pointee(),
+    clang.cindex.TypeKind.RVALUEREFERENCE: lambda t: t.get_pointee(),
+    clang.cindex.TypeKind.CONSTANTARRAY: lambda t: t.get_array_element_type(),
+    clang.cindex.TypeKind.INCOMPLETEARRAY:
+        lambda t: t.get_array_element_type(),
+}
 
-    This is a built-in observer which takes class declaration cursors and
-    converts them into object types defined in this package. It then passes
-    these objects to other observers through the parser.
+# DefinitionObserver method notified of each kind of top-level declaration.
+DEFINITION_METHODS = {
+    Class: 'process_class_definition',
+    Struct: 'process_struct_definition',
+    Union: 'process_union_definition',
+    Function: 'process_function_declaration',
+    Enum: 'process_enum_definition',
+    Typedef: 'process_typedef_definition',
+}
+
+# Declaration types of cursors whose children are expanded into members.
+# Class templates are expanded as classes, whether they were declared with
+# class or struct, since the bindings don't expose the keyword. Their names
+# include the template parameters, such as 'Foo<T>'. Instantiations aren't
+# in the AST as declarations, so they aren't expanded.
+CONTAINER_TYPES = {
+    clang.cindex.CursorKind.CLASS_DECL: Class,
+    clang.cindex.CursorKind.STRUCT_DECL: Struct,
+    clang.cindex.CursorKind.UNION_DECL: Union,
+    clang.cindex.CursorKind.CLASS_TEMPLATE: Class,
+    clang.cindex.CursorKind.CLASS_TEMPLATE_PARTIAL_SPECIALIZATION: Class,
+    clang.cindex.CursorKind.ENUM_DECL: Enum,
+}
+
+METHOD_KINDS = set([
+    clang.cindex.CursorKind.CXX_METHOD,
+    clang.cindex.CursorKind.CONSTRUCTOR,
+    clang.cindex.CursorKind.DESTRUCTOR,
+    clang.cindex.CursorKind.CONVERSION_FUNCTION,
+])
+
+TYPEDEF_KINDS = set([
+    clang.cindex.CursorKind.TYPEDEF_DECL,
+    clang.cindex.CursorKind.TYPE_ALIAS_DECL,
+])
+
+def type_usr(t):
+    """Obtain the USR of the declaration a type refers to, or None.
+
+    Pointers, references, and arrays are stripped.
     """
+    while t.kind in INDIRECT_TYPE_KINDS:
+        t = INDIRECT_TYPE_KINDS[t.kind](t)
+
+    return t.get_declaration().get_usr() or None
+
+class DeclarationExpander(CursorObserver):
+    """Expands declarations into a high-level data structure.
+
+    This is a built-in observer which takes declaration cursors and converts
+    them into object types defined in this package. It then passes these
+    objects to other observers through the parser.
 
-    PROCESS_KINDS = [clang.cindex.CursorKind.CLASS_DECL]
+    All kinds are expanded in a single walk. Classes, structs, unions and
+    enums are sent once their members have been visited. Functions and
+    typedefs are sent as they are visited. Methods are members of their
+    class.
+    """
 
-    # Set of cursor kinds to ignore when processing classes.
-    IGNORE_KINDS = [
-        clang.cindex.CursorKind.CXX_ACCESS_SPEC_DECL
+    PROCESS_KINDS = [
+        clang.cindex.CursorKind.TRANSLATION_UNIT,
+        clang.cindex.CursorKind.CLASS_DECL,
+        clang.cindex.CursorKind.STRUCT_DECL,
+        clang.cindex.CursorKind.UNION_DECL,
+        clang.cindex.CursorKind.CLASS_TEMPLATE,
+        clang.cindex.CursorKind.CLASS_TEMPLATE_PARTIAL_SPECIALIZATION,
+        clang.cindex.CursorKind.FIELD_DECL,
+        clang.cindex.CursorKind.CXX_METHOD,
+        clang.cindex.CursorKind.CONSTRUCTOR,
+        clang.cindex.CursorKind.DESTRUCTOR,
+        clang.cindex.CursorKind.CONVERSION_FUNCTION,
+        clang.cindex.CursorKind.FUNCTION_DECL,
+        clang.cindex.CursorKind.ENUM_DECL,
+        clang.cindex.CursorKind.ENUM_CONSTANT_DECL,
+        clang.cindex.CursorKind.TYPEDEF_DECL,
+        clang.cindex.CursorKind.TYPE_ALIAS_DECL,
     ]
 
+    # We need to see the members of containers to populate them.
+    SUBTREE_KINDS = list(CONTAINER_TYPES)
+
+    # Declarations are all we look at.
+    NEEDS_FUNCTION_BODIES = False
+
+    def __init__(self):
+        CursorObserver.__init__(self)
+
+        # Stack of containers being expanded. Containers may be nested, so
+        # members are added to the innermost one. Entries are None for
+        # declarations that aren't definitions.
+        self._containers = []
+
     def process_cursor(self, cursor):
-        # We only care about cursors that also define the class.
-        if not cursor.is_definition():
+        kind = cursor.kind
+
+        # A walk may have been aborted, such as by an observer raising,
+        # leaving containers on the stack. Each translation unit starts
+        # afresh.
+        if kind == clang.cindex.CursorKind.TRANSLATION_UNIT:
+            self._containers = []
             return
 
-        cl = Class(cursor)
+        container = self._containers[-1] if self._containers else None
+
+        if kind == clang.cindex.CursorKind.FIELD_DECL:
+            if isinstance(container, Class):
+                field = DeclarationExpander.create_field(cursor)
+                container.fields[field.name] = field
+
+        elif kind in METHOD_KINDS:
+            # Methods defined outside of their class were already seen in
+            # the class.
+            if isinstance(container, Class):
+                container.methods.append(
+                        DeclarationExpander.create_method(cursor))
 
-        # We descend into all cursors contained within the class definition
-        # and extract information as we encounter it.
-        for c, level in cursor.parser.emit_child_cursors(cursor):
-            if c.kind in ClassExpander.IGNORE_KINDS:
-                continue
+        elif kind == clang.cindex.CursorKind.ENUM_CONSTANT_DECL:
+            if isinstance(container, Enum):
+                constant = EnumConstant(cursor)
+                constant.value = cursor.enum_value
+                container.constants[constant.name] = constant
 
-            if c.kind == clang.cindex.CursorKind.FIELD_DECL:
-                field = ClassExpander.create_field(c)
-                cl.fields[field.name] = field
+        elif kind == clang.cindex.CursorKind.FUNCTION_DECL:
+            # Functions in classes are friends, which aren't members.
+            if not self._containers:
+                self._notify(cursor,
+                        DeclarationExpander.create_function(cursor))
 
-        cursor.parser.notify_definition_observers('process_class_definition',
-                cl)
+        elif kind in TYPEDEF_KINDS:
+            typedef = Typedef(cursor)
+            t = cursor.underlying_typedef_type
+            typedef.type = t.spelling
+            typedef.type_usr = type_usr(t)
+            self._notify(cursor, typedef)
+
+        # We only care about cursors that also define the container.
+        elif not cursor.is_definition():
+            self._containers.append(None)
+
+        elif kind == clang.cindex.CursorKind.ENUM_DECL:
+            e = Enum(cursor)
+            e.type = cursor.enum_type.spelling
+            self._containers.append(e)
+
+        else:
+            self._containers.append(CONTAINER_TYPES[kind](cursor))
+
+    def end_cursor(self, cursor):
+        container = self._containers.pop()
+        if container is None:
+            return
+
+        self._notify(cursor, container)
+
+    def _notify(self, cursor, declaration):
+        cursor.parser.notify_definition_observers(
+                DEFINITION_METHODS[type(declaration)], declaration)
 
     @staticmethod
     def create_field(cursor):
         """Construct a field from a cursor."""
         field = Field(cursor)
 
+        t = cursor.type
+        field.type = t.spelling
+        field.type_usr = type_usr(t)
+
         return field
+
+    @staticmethod
+    def create_function(cursor, cls=Function):
+        """Construct a function from a cursor."""
+        function = cls(cursor)
+        function.type = cursor.type.spelling
+        function.result_type = cursor.result_type.spelling
+        function.arguments = [(a.spelling, a.type.spelling)
+                for a in cursor.get_arguments()]
+
+        return function
+
+    @staticmethod
+    def create_method(cursor):
+        """Construct a method from a cursor."""
+        method = DeclarationExpander.create_function(cursor, Method)
+        method.is_static = cursor.is_static_method()
+        method.is_virtual = cursor.is_virtual_method()
+        method.is_const = cursor.is_const_method()
+
+        return method
+
+# The expander used to only handle classes.
+ClassExpander = DeclarationExpander
@@ -6,11 +6,191 @@
 # the Clang Python bindings.
 
 from .observer.base import CursorObserver, DefinitionObserver, TokenObserver
-from .observer.cursor.declaration import ClassExpander
+from .observer.cursor.declaration import (DEFINITION_METHODS,
+    DeclarationExpander)
+from .stats import ParseStats, current_memory, peak_memory
+from . import tokens
 from . import wrapper
 
 import clang.cindex
+import collections
+import contextlib
+import multiprocessing
 import os.path
+import weakref
+
+class ParseResult(object):
+    """Describes the outcome of parsing a single file in a batch.
+
+    Instances are returned by Parser.parse_many().
+
+    filename -- The filename that was parsed.
+    error -- None if the file was parsed successfully. Otherwise, a str
+        describing the failure.
+    max_rss -- The peak resident set size in bytes of the process that
+        parsed the file, as of when it finished. When parsing with a memory
+        budget, each file is parsed in a new worker process, so no other file
+        contributes to it. It still includes the memory the worker started
+        with. None if unknown or the file was served from the cache.
+    """
+
+    __slots__ = (
+        'error',
+        'filename',
+        'max_rss',
+    )
+
+    def __init__(self, filename, error=None, max_rss=None):
+        self.filename = filename
+        self.error = error
+        self.max_rss = max_rss
+
+    @property
+    def ok(self):
+        """Whether the file was parsed successfully."""
+        return self.error is None
+
+class ParseError(Exception):
+    """Raised when a file in a batch fails to parse and failures are fatal."""
+
+    def __init__(self, result):
+        Exception.__init__(self, 'Error parsing %s: %s' % (result.filename,
+            result.error))
+        self.result = result
+
+class _DefinitionRecorder(DefinitionObserver):
+    """Definition observer that records notifications for later replay.
+
+    This is used to capture definitions in one context (such as a worker
+    process) and deliver them to the real observers in another.
+    """
+
+    def __init__(self):
+        self.events = []
+
+    def process_definition(self, d):
+        self.events.append((DEFINITION_METHODS[type(d)], (d,)))
+
+# Observers copied into each worker process by Parser.parse_many(). This is
+# populated by the pool initializer so observers are only pickled once per
+# worker instead of once per file.
+_worker_observers = []
+
+# Parser instance used by a worker process. It is reused for every file the
+# worker parses so the clang Index is shared.
+_worker_parser = None
+_worker_recorder = None
+
+def _init_worker(observers, parse_options, stats, main_file_only,
+        track_dependencies, skip_seen_headers):
+    global _worker_observers, _worker_parser, _worker_recorder
+    _worker_observers = observers
+
+    # Definition observers stay in the parent, so the worker can't derive
+    # the parse options or whether seen headers may be skipped itself.
+    #
+    # A worker only skips headers it has seen itself, in files that come
+    # earlier in the jobs than the file it parses. The parent drops
+    # definitions of headers seen in any earlier file when replaying, so
+    # the result doesn't depend on which worker parsed which file.
+    _worker_parser = Parser(parse_options=parse_options,
+            stats=ParseStats() if stats else None,
+            main_file_only=main_file_only,
+            skip_seen_headers=skip_seen_headers)
+    _worker_parser._track_dependencies = track_dependencies
+    for obs in observers:
+        _worker_parser.add_observer(obs)
+
+    # Definitions are replayed in the parent process. Observers shipped to
+    # the worker only participate in their cursor and token roles.
+    _worker_recorder = _DefinitionRecorder()
+    _worker_parser._definition_observers = [_worker_recorder]
+
+def _parse_worker(job):
+    """Parse a single file inside a worker process.
+
+    Returns a tuple of (definition events, observer results, error, stats,
+    memory, dependencies). stats is None unless the parent parser records
+    statistics. memory is a tuple of (peak resident set size, growth of the
+    resident set size while parsing), in bytes. Either may be None if
+    unknown. dependencies are the files the translation unit depends on
+    besides the main file, if the parent caches declarations.
+    """
+    filename, args = job
+
+    recorder = _worker_recorder
+    recorder.events = []
+
+    stats = _worker_parser.stats
+    if stats is not None:
+        _worker_parser.stats = ParseStats()
+
+    before = current_memory()
+
+    try:
+        _worker_parser.parse(filename=filename, clang_args=args)
+    except Exception as e:
+        # Discard anything the observers accumulated for the failed file.
+        for obs in _worker_observers:
+            obs.worker_result()
+
+        return (None, None, '%s: %s' % (type(e).__name__, e),
+                _worker_parser.stats, _memory_since(before), None)
+
+    results = [obs.worker_result() for obs in _worker_observers]
+
+    stats = _worker_parser.stats
+    if stats is not None:
+        # Definitions are counted when the parent replays them.
+        stats.declarations = 0
+
+    return (recorder.events, results, None, stats, _memory_since(before),
+            _worker_parser._dependencies)
+
+def _tu_dependencies(tu, args):
+    """Obtain the set of files besides the main file a translation unit
+    depends on."""
+    files = set(i.include.name for i in tu.get_includes())
+
+    # Headers in a PCH aren't reported as includes. The PCH is rebuilt when
+    # they change, so depending on it covers them.
+    if '-include-pch' in args:
+        files.add(args[args.index('-include-pch') + 1])
+
+    return files
+
+def _reparse(tu, unsaved_files):
+    """Reparse a translation unit with new content.
+
+    TranslationUnit.reparse() ignores failures, so libclang is called
+    directly. Returns whether reparsing succeeded.
+    """
+    unsaved_files = unsaved_files or []
+
+    unsaved = (clang.cindex._CXUnsavedFile * len(unsaved_files))()
+    for i, (name, contents) in enumerate(unsaved_files):
+        if hasattr(contents, 'read'):
+            contents = contents.read()
+        if not isinstance(contents, bytes):
+            contents = contents.encode('utf-8')
+
+        unsaved[i].name = os.fsencode(name)
+        unsaved[i].contents = contents
+        unsaved[i].length = len(contents)
+
+    return clang.cindex.conf.lib.clang_reparseTranslationUnit(tu,
+            len(unsaved_files), unsaved, 0) == 0
+
+def _memory_since(before):
+    """Obtain a tuple of (peak, growth) of memory since a measurement."""
+    peak = peak_memory()
+    if peak is None or before is None:
+        return (peak, None)
+
+    return (peak, max(0, peak - before))
+
+# Stands in for ParseStats.phase() when statistics aren't recorded.
+_NO_PHASE = contextlib.nullcontext()
 
 class Parser(object):
     """Interface for parsing C language files.
@@ -24,25 +204,224 @@ class Parser(object):
     """
 
     __slots__ = (
+        '_cache',
+        '_cursor_catchall',
+        '_cursor_dispatch',
         '_cursor_observers',
+        '_cursor_subtrees',
+        '_cursor_wrappers',
         '_definition_observers',
+        '_dependencies',
+        '_index',
+        '_main_file_only',
+        '_parse_options',
+        '_seen_headers',
+        '_skip_seen_headers',
+        '_stats',
+        '_token_batch_size',
+        '_token_cursor_kinds',
         '_token_observers',
+        '_track_dependencies',
+        '_tu_cache',
+        '_tu_cache_size',
     )
 
     EXPAND_CURSORS = set([
         clang.cindex.CursorKind.TRANSLATION_UNIT,
-        clang.cindex.CursorKind.NAMESPACE
+        clang.cindex.CursorKind.NAMESPACE,
+        # extern "C" { ... } blocks, commonly wrapping C headers.
+        clang.cindex.CursorKind.LINKAGE_SPEC,
     ])
 
-    def __init__(self):
+    def __init__(self, tu_cache_size=0, cache=None, token_batch_size=4096,
+            parse_options=None, stats=None, skip_seen_headers=False,
+            main_file_only=False):
+        """Construct a parser.
+
+        tu_cache_size -- Number of translation units to keep alive between
+          calls to parse(). When a file is parsed again with the same
+          arguments, its cached translation unit is reparsed instead of
+          parsed from scratch. Reparsing reuses the precompiled preamble
+          (the leading #include directives) and is much faster than a full
+          parse. This is useful when the same files are analyzed repeatedly,
+          such as in editor integrations. 0 disables the cache.
+        cache -- cache.DeclarationCache instance used to persist definitions
+          between runs. When a file's definitions are found in the cache,
+          they are sent to definition observers without parsing the file.
+        token_batch_size -- Maximum number of tokens sent to token observers
+          at a time.
+        parse_options -- clang.cindex.TranslationUnit.PARSE_* flags to parse
+          with. By default, the cheapest options satisfying the registered
+          observers are used. See parse_options().
+        stats -- stats.ParseStats instance to record statistics about parsing
+          in. See the stats property.
+        skip_seen_headers -- Whether to skip top-level cursors located in
+          headers that were processed while parsing an earlier file. This
+          avoids expanding the same header content once per including file.
+          It assumes headers produce the same declarations wherever they are
+          included. Skipping is disabled while an observer sets
+          NEEDS_ALL_OCCURRENCES. The declaration cache isn't used in this
+          mode, since definitions depend on what was parsed before.
+        main_file_only -- Whether to skip all top-level cursors outside the
+          file being parsed.
+        """
+        self._cache = cache
+        # Wrappers are only kept while in use, so they don't keep translation
+        # units alive.
+        self._cursor_wrappers = weakref.WeakValueDictionary()
+        # Files the last parsed translation unit depends on. Only tracked
+        # when they are needed to validate cached declarations.
+        self._dependencies = set()
+        self._track_dependencies = cache is not None
+        self._index = None
+        self._parse_options = parse_options
+        self._main_file_only = main_file_only
+        self._seen_headers = set()
+        self._skip_seen_headers = skip_seen_headers
+        self._stats = stats
+        self._token_batch_size = token_batch_size
+        self._tu_cache = collections.OrderedDict()
+        self._tu_cache_size = tu_cache_size
+
         # Load basic built-in observers by default. These observers implement
         # a lot of the business logic, such as expanding class declarations
         # into Clanalyze object type instances. This minimizes the logic in
         # this file.
-        self._cursor_observers = [ClassExpander()]
+        self._cursor_observers = [DeclarationExpander()]
         self._definition_observers = []
         self._token_observers = []
 
+        self._build_cursor_dispatch()
+        self._build_token_cursor_kinds()
+
+    @property
+    def index(self):
+        """The clang.cindex.Index used by this parser.
+
+        The index is created on first use and shared by all parses performed
+        by this parser.
+        """
+        if self._index is None:
+            self._index = clang.cindex.Index.create()
+
+        return self._index
+
+    @property
+    def stats(self):
+        """The stats.ParseStats recording statistics, if any.
+
+        Statistics can be enabled or disabled by assigning an instance or
+        None.
+        """
+        return self._stats
+
+    @stats.setter
+    def stats(self, stats):
+        self._stats = stats
+        self._build_cursor_dispatch()
+
+    def _phase(self, name):
+        """Context manager accounting the enclosed code to a stats phase."""
+        if self._stats is None:
+            return _NO_PHASE
+
+        return self._stats.phase(name)
+
+    def parse_options(self):
+        """Obtain the options translation units are parsed with.
+
+        Unless options were given explicitly, they are derived from the
+        NEEDS_* attributes of the registered observers:
+
+        * Function bodies are skipped unless an observer needs them.
+        * The detailed preprocessing record is enabled if an observer needs
+          it or processes preprocessing cursors.
+
+        Returns an int of clang.cindex.TranslationUnit.PARSE_* flags.
+        """
+        if self._parse_options is not None:
+            return self._parse_options
+
+        TranslationUnit = clang.cindex.TranslationUnit
+
+        observers = (self._cursor_observers + self._definition_observers +
+                self._token_observers)
+
+        options = TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
+        for obs in observers:
+            if obs.NEEDS_FUNCTION_BODIES:
+                options &= ~TranslationUnit.PARSE_SKIP_FUNCTION_BODIES
+
+            kinds = ()
+            if isinstance(obs, CursorObserver) and obs.PROCESS_KINDS is not True:
+                kinds = obs.PROCESS_KINDS
+            elif (isinstance(obs, TokenObserver) and
+                    obs.PROCESS_CURSOR_KINDS is not None):
+                kinds = obs.PROCESS_CURSOR_KINDS
+
+            if (obs.NEEDS_PREPROCESSING_RECORD or
+                    any(k.is_preprocessing() for k in kinds)):
+                options |= TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD
+
+        return options
+
+    def clear_tu_cache(self):
+        """Discard all translation units cached by this parser."""
+        self._tu_cache.clear()
+
+    @property
+    def seen_headers(self):
+        """The set of header filenames whose content has been processed.
+
+        When skipping seen headers, top-level cursors in these files are
+        skipped. Headers are added once a translation unit including them
+        has been walked completely.
+        """
+        return self._seen_headers
+
+    def clear_seen_headers(self):
+        """Forget which headers have been processed."""
+        self._seen_headers.clear()
+
+    def _skipping_seen_headers(self):
+        """Whether top-level cursors in seen headers are skipped."""
+        if not self._skip_seen_headers:
+            return False
+
+        for obs in self._cursor_observers + self._definition_observers:
+            if obs.NEEDS_ALL_OCCURRENCES:
+                return False
+
+        return True
+
+    @property
+    def cache(self):
+        """The cache.DeclarationCache used by this parser, if any."""
+        return self._cache
+
+    def _cache_applicable(self):
+        """Whether definitions for a file can be served from the cache.
+
+        Cached definitions can only stand in for a parse if nothing besides
+        the built-in observers needs the translation unit.
+        """
+        if self._cache is None or self._token_observers:
+            return False
+
+        if self._skipping_seen_headers():
+            return False
+
+        for obs in self._cursor_observers:
+            if not isinstance(obs, DeclarationExpander):
+                return False
+
+        return True
+
+    def _replay(self, events):
+        """Send recorded definition events to definition observers."""
+        for method, args in events:
+            self.notify_definition_observers(method, *args)
+
     def add_observer(self, obs):
         """Add an observer to the parser instance.
 
@@ -51,6 +430,7 @@ class Parser(object):
         added = False
         if isinstance(obs, CursorObserver):
             self._cursor_observers.append(obs)
+            self._build_cursor_dispatch()
             added = True
 
         if isinstance(obs, DefinitionObserver):
@@ -59,6 +439,7 @@ class Parser(object):
 
         if isinstance(obs, TokenObserver):
             self._token_observers.append(obs)
+            self._build_token_cursor_kinds()
             added = True
 
         if not added:
@@ -72,6 +453,58 @@ class Parser(object):
                 o != obs]
         self._token_observers = [o for o in self._token_observers if o != obs]
 
+        self._build_cursor_dispatch()
+        self._build_token_cursor_kinds()
+
+    def _build_token_cursor_kinds(self):
+        """Compute the cursor kinds whose extents token observers need."""
+        kinds = set()
+        for obs in self._token_observers:
+            if obs.PROCESS_CURSOR_KINDS is not None:
+                kinds.update(obs.PROCESS_CURSOR_KINDS)
+
+        self._token_cursor_kinds = kinds
+
+    def _build_cursor_dispatch(self):
+        """Build the tables used to dispatch cursors to cursor observers.
+
+        Observers declaring specific PROCESS_KINDS are indexed by kind so
+        dispatching a cursor is a single dict lookup. Cursors of kinds no
+        observer declares go to the observers accepting all kinds.
+        """
+        observers = self._cursor_observers
+
+        # When recording statistics, the tables hold proxies timing the
+        # observers instead.
+        proxies = {}
+        for obs in observers:
+            if self._stats is not None:
+                proxies[id(obs)] = self._stats.wrap_cursor_observer(obs)
+            else:
+                proxies[id(obs)] = obs
+
+        catchall = [proxies[id(o)] for o in observers
+                if o.PROCESS_KINDS is True]
+
+        kinds = set()
+        for obs in observers:
+            if obs.PROCESS_KINDS is not True:
+                kinds.update(obs.PROCESS_KINDS)
+
+        dispatch = {}
+        for kind in kinds:
+            dispatch[kind] = [proxies[id(o)] for o in observers
+                    if o.PROCESS_KINDS is True or kind in o.PROCESS_KINDS]
+
+        subtrees = {}
+        for obs in observers:
+            for kind in obs.SUBTREE_KINDS:
+                subtrees.setdefault(kind, []).append(proxies[id(obs)])
+
+        self._cursor_catchall = catchall
+        self._cursor_dispatch = dispatch
+        self._cursor_subtrees = subtrees
+
     def parse(self, filename=None, fh=None, content=None, clang_args=None):
         """Parse an entity and send results to observers.
 
@@ -82,15 +515,177 @@ class Parser(object):
 
         filename -- The filename to load source from.
         fh -- The file handle to load source from.
-        content -- String containing raw source to parse.
+        content -- str or bytes containing raw source to parse.
         clang_args -- Arguments that would be passed to Clang compiler to
           compiler this file.
         """
         args = clang_args or []
 
-        # We first convert the input to a set of lines. Along the way we
-        # perform input validation.
-        lines = []
+        if self._stats is not None:
+            self._stats.files += 1
+
+        input_filename = filename or 'INPUT.C'
+        try:
+            with self._phase('input'):
+                input_filename, source = self._read_input(filename, fh,
+                        content)
+                cache_key = self._cache_key(input_filename, source, args)
+
+            self._parse_input(input_filename, source, args, cache_key)
+        finally:
+            self._end_file(input_filename)
+
+    def _parse_input(self, input_filename, source, args, cache_key):
+        """Perform parse() for validated input."""
+        recorder = None
+        if cache_key is not None:
+            with self._phase('cache'):
+                events = self._cache.get(cache_key)
+
+            if events is not None:
+                with self._phase('replay'):
+                    self._replay(events)
+                return
+
+            recorder = _DefinitionRecorder()
+            self._definition_observers.append(recorder)
+
+        try:
+            self._parse_source(input_filename, source, args)
+        finally:
+            if recorder is not None:
+                self._definition_observers.remove(recorder)
+
+        if cache_key is not None:
+            with self._phase('cache'):
+                self._cache.put(cache_key, recorder.events,
+                        self._dependencies)
+
+    def _end_file(self, filename):
+        """Tell definition observers a file has been processed."""
+        for obs in self._definition_observers:
+            obs.end_file(filename)
+
+    def iter_definitions(self, filename=None, fh=None, content=None,
+            clang_args=None):
+        """Parse an entity and generate the definitions derived from it.
+
+        This is a pull-based alternative to registering a DefinitionObserver.
+        Definitions (such as declaration.Class instances) are yielded as soon
+        as the AST walk produces them. If the consumer stops iterating, the
+        rest of the AST is not walked.
+
+        Registered cursor observers run during the walk and registered
+        definition observers are notified of every yielded definition. Token
+        observers are not notified. The parser must not be used for other
+        parses until iteration finishes.
+
+        Arguments are the same as for parse().
+        """
+        args = clang_args or []
+
+        if self._stats is not None:
+            self._stats.files += 1
+
+        input_filename = filename or 'INPUT.C'
+        try:
+            input_filename, source = self._read_input(filename, fh, content)
+
+            for d in self._iter_definitions(input_filename, source, args):
+                yield d
+        finally:
+            self._end_file(input_filename)
+
+    def _iter_definitions(self, input_filename, source, args):
+        """Perform iter_definitions() for validated input."""
+        cache_key = self._cache_key(input_filename, source, args)
+        if cache_key is not None:
+            events = self._cache.get(cache_key)
+            if events is not None:
+                for method, event_args in events:
+                    self.notify_definition_observers(method, *event_args)
+                    yield event_args[0]
+
+                return
+
+        recorder = _DefinitionRecorder()
+        self._definition_observers.append(recorder)
+        recorded = []
+
+        try:
+            tu, size = self._open_tu(input_filename, source, args)
+
+            for cursor in self._iter_walk(tu, {}):
+                if not recorder.events:
+                    continue
+
+                events = recorder.events
+                recorder.events = []
+                recorded.extend(events)
+
+                for method, event_args in events:
+                    yield event_args[0]
+
+            recorded.extend(recorder.events)
+            for method, event_args in recorder.events:
+                yield event_args[0]
+        finally:
+            self._definition_observers.remove(recorder)
+
+        # Only complete walks are cached.
+        if cache_key is not None:
+            self._cache.put(cache_key, recorded, self._dependencies)
+
+    def iter_cursors(self, filename=None, fh=None, content=None,
+            clang_args=None, kinds=None):
+        """Parse an entity and generate the cursors in its AST.
+
+        This walks the entire AST depth-first, in pre-order, and yields a
+        wrapper.Cursor for each cursor. Unlike parse(), the walk isn't limited
+        to top-level cursors. Cursors are produced lazily, so the walk stops
+        when the consumer stops iterating.
+
+        Observers are not notified.
+
+        Arguments are the same as for parse(), plus:
+
+        kinds -- Iterable of clang.cindex.CursorKind to limit the yielded
+          cursors to. The walk still descends into cursors of other kinds.
+        """
+        args = clang_args or []
+        input_filename, source = self._read_input(filename, fh, content)
+
+        if kinds is not None:
+            kinds = set(kinds)
+
+        # Consumers may be interested in cursors inside function bodies.
+        options = self._parse_options
+        if options is None:
+            options = (self.parse_options() &
+                    ~clang.cindex.TranslationUnit.PARSE_SKIP_FUNCTION_BODIES)
+
+        tu, size = self._open_tu(input_filename, source, args, options)
+
+        stack = [iter([tu.cursor])]
+        while stack:
+            child = next(stack[-1], None)
+            if child is None:
+                stack.pop()
+                continue
+
+            if kinds is None or child.kind in kinds:
+                yield wrapper.Cursor(child, tu, self)
+
+            stack.append(iter(child.get_children()))
+
+    def _read_input(self, filename, fh, content):
+        """Validate the input given to parse().
+
+        Returns a tuple of (filename, source). Files on disk are passed to
+        libclang by path, so their content never passes through Python and
+        source is None. Otherwise, source is the bytes content of the input.
+        """
+        source = None
         source_count = 0
         input_filename = 'INPUT.C'
         if filename is not None:
@@ -98,28 +693,69 @@ class Parser(object):
                 raise Exception('Passed filename does not exist: %s' %
                         filename)
 
-            with open(filename, 'r') as f:
-                lines = [l for l in f]
-
             input_filename = filename
             source_count += 1
 
         if fh is not None:
             source_count += 1
-            lines = [l for l in fh]
+            source = fh.read()
 
         if content is not None:
             source_count += 1
-            raise Exception('Parsing from strings is not yet supported.')
+            source = content
 
         if source_count == 0:
             raise Exception('No sources given to parse().')
         elif source_count > 1:
             raise Exception('Multiple sources given to parse().')
 
-        index = clang.cindex.Index.create()
-        tu = index.parse(input_filename, args=args,
-                unsaved_files=[(input_filename, ''.join(lines))])
+        # libclang operates on bytes. Encoding here means the size we compute
+        # matches what libclang sees and the bindings don't copy it again.
+        if source is not None and not isinstance(source, bytes):
+            source = source.encode('utf-8')
+
+        return input_filename, source
+
+    def _cache_key(self, input_filename, source, args):
+        """Compute the declaration cache key for an input.
+
+        Returns None if the declaration cache can't be used.
+        """
+        if not self._cache_applicable():
+            return None
+
+        if source is None:
+            with open(input_filename, 'rb') as f:
+                source = f.read()
+
+        return self._cache.key(input_filename, source, args,
+                self.parse_options(), self._cache_variant())
+
+    def _cache_variant(self):
+        """The variant of declaration cache keys for this parser."""
+        if self._main_file_only:
+            return 'main_file_only'
+
+        return None
+
+    def _open_tu(self, input_filename, source, args, options=None):
+        """Obtain a parsed translation unit for an input.
+
+        Returns a tuple of (tu, size) where size is the size of the main file
+        in bytes.
+        """
+        if source is None:
+            unsaved_files = None
+            size = os.path.getsize(input_filename)
+        else:
+            unsaved_files = [(input_filename, source)]
+            size = len(source)
+
+        with self._phase('clang'):
+            tu = self._get_tu(input_filename, args, unsaved_files, options)
+
+        if self._stats is not None:
+            self._stats.bytes += size
 
         # Clang silently fails if Translation Unit parsing fails. libclang
         # returns null and Python effectively returns None.
@@ -128,6 +764,23 @@ class Parser(object):
         if not tu:
             raise Exception('Unknown error in Clang when parsing.')
 
+        if self._track_dependencies:
+            self._dependencies = _tu_dependencies(tu, args)
+
+        return tu, size
+
+    def _parse_source(self, input_filename, source, args):
+        """Parse source with libclang and send results to observers.
+
+        source is the bytes content of the file or None to have libclang read
+        the file from disk.
+        """
+        tu, size = self._open_tu(input_filename, source, args)
+
+        self._process_tu(tu, input_filename, source, size)
+
+    def _process_tu(self, tu, input_filename, source, size):
+        """Send the content of a parsed translation unit to observers."""
         # Now that we have a translation unit, we can inform others about it
         # so they can do something with it.
 
@@ -137,32 +790,549 @@ class Parser(object):
 
         # Cursors iterate over the AST.
         assert(tu.cursor.kind == clang.cindex.CursorKind.TRANSLATION_UNIT)
-        for child, level in self.emit_toplevel_cursors(tu.cursor, 0):
-            cursor = wrapper.Cursor(child)
-            cursor.tu = tu
-            cursor.parser = self
+        with self._phase('walk'):
+            extents = self._walk_cursors(tu)
 
-            kind = cursor.kind
+        # Tokens constituting the raw source code.
+        if self._token_observers:
+            with self._phase('tokens'):
+                self._process_tokens(tu, input_filename, source, size,
+                        extents)
 
-            for observer in self._cursor_observers:
-                if (observer.PROCESS_KINDS is True or kind in
-                observer.PROCESS_KINDS):
-                    observer.process_cursor(cursor)
+    def _process_tokens(self, tu, input_filename, source, size, extents):
+        """Send tokens of the main file to token observers.
 
-        # Tokens constituting the raw source code.
-        # TODO the range generation doesn't work for all method arguments.
+        Only the byte ranges some observer is interested in are tokenized.
+
+        extents -- dict of CursorKind to list of (start, end) byte ranges of
+          cursors of that kind, as recorded during the AST walk.
+        """
         source_file = clang.cindex.File.from_name(tu, input_filename)
-        start = clang.cindex.SourceLocation.from_position(tu, source_file, 1, 1)
-        end = clang.cindex.SourceLocation.from_position(tu, source_file,
-                len(lines), len(lines[len(lines)-1]))
 
-        for token in tu.get_tokens(start_location=start, end_location=end):
-            wrapped = wrapper.Token(token)
-            wrapped.tu = tu
-            wrapped.parser = self
+        def offset(o):
+            return clang.cindex.SourceLocation.from_offset(tu, source_file, o)
+
+        whole = [(0, size)]
+
+        # Compute the ranges and kinds each observer wants.
+        observers = []
+        fetch = []
+        keep_tokens = False
+        for observer in self._token_observers:
+            ranges = whole
+
+            if observer.PROCESS_LINES is not None:
+                first, last = observer.PROCESS_LINES
+                start = clang.cindex.SourceLocation.from_position(tu,
+                        source_file, first, 1)
+                end = clang.cindex.SourceLocation.from_position(tu,
+                        source_file, last + 1, 1)
+
+                # Positions past the end of the file are clamped by Clang.
+                end_offset = end.offset if end.line == last + 1 else size
+                ranges = tokens.intersect_ranges(ranges,
+                        [(start.offset, end_offset)])
+
+            if observer.PROCESS_CURSOR_KINDS is not None:
+                cursor_ranges = []
+                for kind in observer.PROCESS_CURSOR_KINDS:
+                    cursor_ranges.extend(extents.get(kind, ()))
+
+                ranges = tokens.intersect_ranges(ranges,
+                        tokens.merge_ranges(cursor_ranges))
+
+            if not ranges:
+                continue
+
+            kinds = None
+            if observer.PROCESS_KINDS is not True:
+                kinds = set(k.value for k in observer.PROCESS_KINDS)
+
+            # Observers only implementing the per-token API need the raw
+            # clang tokens.
+            if type(observer).process_tokens == TokenObserver.process_tokens:
+                keep_tokens = True
+
+            fetch.extend(ranges)
+            observers.append((observer, kinds,
+                None if ranges == whole else ranges))
+
+        if not observers:
+            return
+
+        stats = self._stats
+
+        buf = tokens.source_buffer(input_filename, source, size)
+        try:
+            for start, end in tokens.merge_ranges(fetch):
+                extent = clang.cindex.SourceRange.from_locations(offset(start),
+                        offset(end))
+
+                for batch in tokens.tokenize(tu, extent, buf,
+                        self._token_batch_size, self, keep_tokens):
+                    if stats is not None:
+                        stats.tokens += len(batch)
+
+                    for observer, kinds, ranges in observers:
+                        filtered = batch.filtered(kinds, ranges)
+                        if not len(filtered):
+                            continue
+
+                        if stats is not None:
+                            stats.call_observer(observer, 'process_tokens',
+                                    filtered)
+                        else:
+                            observer.process_tokens(filtered)
+        finally:
+            if buf is not source and hasattr(buf, 'close'):
+                buf.close()
+
+    def _walk_cursors(self, tu):
+        """Walk the AST of a translation unit, dispatching to cursor observers.
+
+        Returns a dict of CursorKind to list of (start, end) byte ranges of
+        visited cursors in the main file whose kinds are in
+        PROCESS_CURSOR_KINDS of a token observer.
+        """
+        extents = {}
+
+        stats = self._stats
+        if stats is None:
+            for cursor in self._iter_walk(tu, extents):
+                pass
+        else:
+            for cursor in self._iter_walk(tu, extents):
+                stats.count_cursor(cursor.kind)
+
+        return extents
+
+    def _iter_walk(self, tu, extents):
+        """Generator performing the AST walk of a translation unit.
+
+        Every cursor is visited at most once, using an explicit stack instead
+        of recursion. The children of the translation unit and of
+        EXPAND_CURSORS are always visited. The children of other cursors are
+        only visited if an observer lists the cursor's kind in its
+        SUBTREE_KINDS. Cursors inside such a subtree are only sent to the
+        observers that requested it, and those observers have end_cursor()
+        called once the subtree has been visited.
+
+        Each visited cursor is yielded after it has been dispatched. So, the
+        walk only progresses as the generator is consumed.
+
+        Extents of cursors token observers are interested in are recorded in
+        the passed dict. See _walk_cursors().
+
+        Top-level cursors outside the main file are skipped, along with their
+        children, in main file only mode or if they are in a seen header.
+        """
+        dispatch = self._cursor_dispatch
+        catchall = self._cursor_catchall
+        subtrees = self._cursor_subtrees
+        expand = self.EXPAND_CURSORS
+
+        extent_kinds = self._token_cursor_kinds
+        main_file = tu.spelling
+
+        main_only = self._main_file_only
+        seen = None
+        if self._skipping_seen_headers():
+            seen = self._seen_headers
+        filter_files = main_only or seen is not None
+
+        # Headers processed during this walk. They are only marked as seen
+        # once the walk completes, since their cursors are spread across it.
+        visited = set()
+
+        root = self.wrap_cursor(tu.cursor, tu)
+        for obs in dispatch.get(root.kind, catchall):
+            obs.process_cursor(root)
+
+        yield root
+
+        # Entries are (cursor, children iterator, observers owning the
+        # subtree). Observers are None for the expanded top-level scopes.
+        stack = [(root, iter(tu.cursor.get_children()), None)]
+        while stack:
+            parent, children, active = stack[-1]
+
+            child = next(children, None)
+            if child is None:
+                stack.pop()
+                if active is not None:
+                    for obs in active:
+                        obs.end_cursor(parent)
+                continue
+
+            # Every cursor is visited once, so the wrapper is shared by all
+            # observers without registering it with wrap_cursor().
+            cursor = wrapper.Cursor(child, tu, self)
+            kind = cursor.kind
+
+            if extent_kinds and kind in extent_kinds:
+                extent = cursor.extent
+                f = extent.start.file
+                if f is not None and f.name == main_file:
+                    extents.setdefault(kind, []).append((extent.start.offset,
+                        extent.end.offset))
+
+            if active is None:
+                if filter_files:
+                    # Where the extent starts, like the start_location of
+                    # declarations, which _unseen_events() filters by.
+                    f = cursor.extent.start.file
+                    name = f.name if f is not None else None
+
+                    if name != main_file:
+                        if main_only or name in seen:
+                            continue
+
+                        visited.add(name)
+
+                for obs in dispatch.get(kind, catchall):
+                    obs.process_cursor(cursor)
+
+                if kind in expand:
+                    stack.append((cursor, iter(child.get_children()), None))
+                    yield cursor
+                    continue
+
+                interested = subtrees.get(kind)
+            else:
+                for obs in dispatch.get(kind, catchall):
+                    if obs in active:
+                        obs.process_cursor(cursor)
+
+                interested = [o for o in subtrees.get(kind, ()) if o in active]
+
+            if interested:
+                stack.append((cursor, iter(child.get_children()), interested))
+
+            yield cursor
+
+        if seen is not None:
+            seen.update(visited)
+
+    def _get_tu(self, filename, args, unsaved_files, options=None):
+        """Obtain a parsed translation unit for a file.
+
+        If the translation unit cache is enabled and holds a translation unit
+        for this file and arguments, it is reparsed with the new content.
+        Otherwise the file is parsed from scratch.
+
+        options defaults to parse_options().
+        """
+        if options is None:
+            options = self.parse_options()
+
+        if not self._tu_cache_size:
+            return self.index.parse(filename, args=args,
+                    unsaved_files=unsaved_files, options=options)
 
-            for observer in self._token_observers:
-                observer.process_token(wrapped)
+        key = (filename, tuple(args), options)
+        tu = self._tu_cache.pop(key, None)
+
+        # A translation unit failing to reparse can't be used anymore. It is
+        # dropped and the file parsed from scratch.
+        if tu is not None and not _reparse(tu, unsaved_files):
+            tu = None
+
+        if tu is None:
+            options |= (
+                clang.cindex.TranslationUnit.PARSE_PRECOMPILED_PREAMBLE |
+                clang.cindex.TranslationUnit.PARSE_CACHE_COMPLETION_RESULTS)
+            tu = self.index.parse(filename, args=args,
+                    unsaved_files=unsaved_files, options=options)
+
+        if tu:
+            self._tu_cache[key] = tu
+            while len(self._tu_cache) > self._tu_cache_size:
+                self._tu_cache.popitem(last=False)
+
+        return tu
+
+    def parse_many(self, paths, clang_args=None, workers=None, chunksize=1,
+            fail_fast=False, pch=None, memory_budget=None):
+        """Parse multiple files in parallel and send results to observers.
+
+        Translation units are parsed in a pool of worker processes. Each
+        worker runs the built-in observers and copies of the cursor and token
+        observers registered with this parser. Definitions produced by the
+        workers are sent back to this process, where definition observers
+        are notified in the order of the passed paths. This ordering is
+        deterministic and independent of the number of workers.
+
+        Cursor and token observers registered with this parser must be
+        picklable. Results they produce in workers are transferred back via
+        worker_result() and merge_worker_result().
+
+        If the parser has a declaration cache, files found in the cache are
+        not sent to workers.
+
+        When skipping seen headers, definitions of seen headers are dropped
+        in this process as they are replayed, in the order of the paths, so
+        definition observers see the same definitions as when parsing
+        serially. Workers also skip headers they parsed before, so cursor
+        and token observers in workers see header content once per worker.
+
+        Arguments:
+
+        paths -- Iterable of filenames to parse. Entries may also be tuples
+          of (filename, clang_args) to give a file its own arguments.
+        clang_args -- Arguments that would be passed to Clang compiler to
+          compile each file not having its own arguments.
+        workers -- Number of worker processes to use. Defaults to the number
+          of CPUs. If 1, files are parsed serially in this process, unless
+          a memory budget is given.
+        chunksize -- Number of files to send to a worker at a time. Larger
+          values reduce communication overhead for many small files.
+        fail_fast -- If True, the first file that fails to parse raises a
+          ParseError. Otherwise, failures are isolated to the file that
+          caused them and parsing continues.
+        pch -- pch.PrecompiledHeaders instance. If given, headers common to
+          the files are precompiled before parsing, and files are parsed
+          against the precompiled headers.
+        memory_budget -- Approximate number of bytes of memory the batch may
+          use across this process and workers. If given, every file is
+          parsed in a new worker process, even with a single worker or file,
+          so its translation unit is disposed of when the file is done,
+          whatever observers hold on to. The number of files parsed at once
+          is limited so the memory this process uses plus the largest growth
+          seen while parsing a file, times the number of files in flight,
+          stays within the budget. At least one file is always parsed. When
+          this process alone leaves no room for parsing another file,
+          definition observers are asked to flush() and cached translation
+          units are released.
+
+        Returns a list of ParseResult describing the outcome for each file,
+        in the order of the passed paths.
+        """
+        args = list(clang_args or [])
+        jobs = []
+        for entry in paths:
+            if isinstance(entry, tuple):
+                jobs.append((entry[0], list(entry[1])))
+            else:
+                jobs.append((entry, args))
+
+        if pch is not None:
+            with self._phase('pch'):
+                jobs = pch.prepare(jobs, self.parse_options())
+
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+
+        if workers < 1:
+            raise Exception('workers must be at least 1.')
+
+        # With a memory budget, files are always parsed in worker processes,
+        # even one at a time, so their memory is returned when they finish.
+        if memory_budget is None and (workers == 1 or len(jobs) < 2):
+            return self._parse_serial(jobs, fail_fast)
+
+        observers = [o for o in self._cursor_observers + self._token_observers
+                if not isinstance(o, DeclarationExpander)]
+        # Observers that are both cursor and token observers are only
+        # shipped once.
+        shipped = []
+        for obs in observers:
+            if obs not in shipped:
+                shipped.append(obs)
+
+        keys = [None] * len(jobs)
+        cached = [None] * len(jobs)
+        if self._cache_applicable():
+            for i, (filename, job_args) in enumerate(jobs):
+                try:
+                    with open(filename, 'rb') as f:
+                        source = f.read()
+                except (IOError, OSError):
+                    # Let the worker report the error.
+                    continue
+
+                keys[i] = self._cache.key(filename, source, job_args,
+                        self.parse_options(), self._cache_variant())
+                cached[i] = self._cache.get(keys[i])
+
+        misses = [job for job, events in zip(jobs, cached) if events is None]
+
+        # Decided here, since definition observers stay in this process.
+        skipping = self._skipping_seen_headers()
+
+        results = []
+        # Largest growth of memory seen while parsing a file.
+        growth = [0]
+
+        pool = multiprocessing.Pool(processes=workers,
+                initializer=_init_worker, initargs=(shipped,
+                    self.parse_options(), self._stats is not None,
+                    self._main_file_only, self._cache_applicable(),
+                    skipping),
+                maxtasksperchild=1 if memory_budget is not None else None)
+        try:
+            if memory_budget is None:
+                it = pool.imap(_parse_worker, misses, chunksize)
+            else:
+                it = self._iter_budgeted(pool, misses, workers, memory_budget,
+                        growth)
+
+            for i, (filename, job_args) in enumerate(jobs):
+                if cached[i] is not None:
+                    results.append(ParseResult(filename))
+
+                    if self._stats is not None:
+                        self._stats.files += 1
+
+                    with self._phase('replay'):
+                        self._replay(cached[i])
+
+                    self._end_file(filename)
+                    continue
+
+                (events, worker_results, error, stats, memory,
+                        dependencies) = next(it)
+                result = ParseResult(filename, error, memory[0])
+                results.append(result)
+
+                if stats is not None and self._stats is not None:
+                    self._stats.merge(stats)
+
+                if error is not None:
+                    self._end_file(filename)
+
+                    if fail_fast:
+                        raise ParseError(result)
+                    continue
+
+                if keys[i] is not None:
+                    self._cache.put(keys[i], events, dependencies)
+
+                if skipping:
+                    events = self._unseen_events(filename, events)
+
+                self._replay(events)
+
+                for obs, worker_result in zip(shipped, worker_results):
+                    if worker_result is not None:
+                        obs.merge_worker_result(worker_result)
+
+                self._end_file(filename)
+
+                if memory_budget is not None:
+                    self._check_memory(memory_budget - growth[0])
+        finally:
+            pool.terminate()
+            pool.join()
+
+        return results
+
+    def _unseen_events(self, filename, events):
+        """Drop definition events of headers seen while parsing earlier files.
+
+        This applies skip_seen_headers to definitions produced by a worker,
+        in the order of the jobs, so the result doesn't depend on which
+        worker parsed which file. Headers are marked as seen afterwards.
+        """
+        seen = self._seen_headers
+        visited = set()
+        kept = []
+        for event in events:
+            name = event[1][0].start_location[0]
+            if name != filename:
+                if name in seen:
+                    continue
+
+                visited.add(name)
+
+            kept.append(event)
+
+        seen.update(visited)
+
+        return kept
+
+    def _iter_budgeted(self, pool, jobs, workers, budget, growth):
+        """Generator of worker results for jobs, limiting memory use.
+
+        Jobs are submitted to the pool as long as the memory of this process
+        plus the largest growth seen while parsing a file for each job in
+        flight fits in the budget. Until a file was parsed, only one is in
+        flight. Results are generated in the order of the jobs.
+
+        growth is a list holding the largest growth seen. It is updated as
+        results arrive.
+        """
+        pending = collections.deque()
+        submitted = 0
+
+        while pending or submitted < len(jobs):
+            allowed = 1
+            if growth[0]:
+                available = budget - (current_memory() or 0)
+                allowed = max(1, min(workers, available // growth[0]))
+
+            while submitted < len(jobs) and len(pending) < allowed:
+                pending.append(pool.apply_async(_parse_worker,
+                    (jobs[submitted],)))
+                submitted += 1
+
+            result = pending.popleft().get()
+
+            file_growth = result[4][1]
+            if file_growth is not None and file_growth > growth[0]:
+                growth[0] = file_growth
+
+            yield result
+
+    def _check_memory(self, limit):
+        """Release memory held for observers if this process exceeds a limit.
+
+        Definition observers are asked to flush() and cached translation
+        units are released.
+        """
+        memory = current_memory()
+        if memory is None or memory <= limit:
+            return
+
+        for obs in self._definition_observers:
+            obs.flush()
+
+        self.clear_tu_cache()
+
+    def _parse_serial(self, jobs, fail_fast):
+        """Parse (filename, args) jobs in this process, isolating failures."""
+        results = []
+        for filename, args in jobs:
+            try:
+                self.parse(filename=filename, clang_args=args)
+                results.append(ParseResult(filename, max_rss=peak_memory()))
+            except Exception as e:
+                result = ParseResult(filename, '%s: %s' % (type(e).__name__,
+                    e), peak_memory())
+                results.append(result)
+
+                if fail_fast:
+                    raise ParseError(result)
+
+        return results
+
+    def wrap_cursor(self, cursor, tu):
+        """Obtain the wrapper.Cursor for a Clang cursor.
+
+        As long as a wrapper is referenced, it is shared per underlying
+        cursor. So, attributes cached by the wrapper are only fetched from
+        libclang once, no matter how many traversals (such as
+        emit_child_cursors()) see the cursor.
+
+        The AST walk performed by parse() doesn't use this. It visits every
+        cursor once and passes the same wrapper to all observers, which
+        avoids hashing every cursor through libclang.
+        """
+        wrapped = self._cursor_wrappers.get(cursor)
+        if wrapped is None:
+            wrapped = wrapper.Cursor(cursor, tu, self)
+            self._cursor_wrappers[cursor] = wrapped
+
+        return wrapped
 
     def emit_toplevel_cursors(self, cursor, level=0):
         """Generator to descend into cursors."""
@@ -189,14 +1359,14 @@ class Parser(object):
         parser instance is manageable.
         """
         for child in cursor.get_children():
-            wrapped = wrapper.Cursor(child)
-            if isinstance(cursor, wrapper.Cursor):
-                wrapped.tu = cursor.tu
-                wrapper.parser = cursor.parser
+            if isinstance(cursor, wrapper.Cursor) and cursor.tu is not None:
+                wrapped = self.wrap_cursor(child, cursor.tu)
+            else:
+                wrapped = wrapper.Cursor(child)
 
             yield (wrapped, level)
 
-            for t in self.emit_child_cursors(child, level + 1): yield t
+            for t in self.emit_child_cursors(wrapped, level + 1): yield t
 
     def notify_definition_observers(self, method, *args):
         """Notify definition observers to a new definition.
@@ -209,7 +1379,15 @@ class Parser(object):
         args -- Set of arguments to pass to called method.
         """
 
+        stats = self._stats
+        if stats is not None:
+            stats.declarations += 1
+
         # TODO need a story for error handling
         for obs in self._definition_observers:
+            if stats is not None and not isinstance(obs, _DefinitionRecorder):
+                stats.call_observer(obs, method, *args)
+                continue
+
             f = getattr(obs, method)
             f(*args)
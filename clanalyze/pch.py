@@ -0,0 +1,338 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file contains code for building precompiled headers shared by the
+# files of a batch, so common headers are only parsed once.
+
+from .cache import libclang_version
+
+import clang.cindex
+import collections
+import hashlib
+import json
+import os
+import re
+import tempfile
+
+# Version of the format of the PCH cache directory.
+FORMAT = 1
+
+INCLUDE_RE = re.compile(r'^#\s*(?:include|import)\s*([<"][^>"]+[>"])')
+
+# Languages of headers, by source file extension. Others are C++.
+HEADER_LANGUAGES = {
+    '.c': 'c-header',
+    '.m': 'objective-c-header',
+    '.mm': 'objective-c++-header',
+}
+
+def leading_includes(filename):
+    """Obtain the include directives at the start of a source file.
+
+    Scanning stops at the first line that isn't an include directive, a
+    comment, or blank. Quoted includes which exist relative to the file are
+    made absolute, so they identify the same header in every file.
+
+    Returns a list of directive arguments, such as '<vector>' or
+    '"/abs/path/foo.h"'. Returns None if the file can't be read.
+    """
+    try:
+        with open(filename, 'r') as fh:
+            lines = fh.readlines()
+    except (IOError, OSError, UnicodeDecodeError):
+        return None
+
+    directory = os.path.dirname(os.path.abspath(filename))
+
+    includes = []
+    in_comment = False
+    for line in lines:
+        line = line.strip()
+
+        if in_comment:
+            if '*/' not in line:
+                continue
+
+            line = line.split('*/', 1)[1].strip()
+            in_comment = False
+
+        if line.startswith('/*'):
+            if '*/' not in line:
+                in_comment = True
+                continue
+
+            line = line.split('*/', 1)[1].strip()
+
+        if not line or line.startswith('//'):
+            continue
+
+        m = INCLUDE_RE.match(line)
+        if not m:
+            break
+
+        target = m.group(1)
+        if target.startswith('"'):
+            path = os.path.join(directory, target[1:-1])
+            if os.path.exists(path):
+                target = '"%s"' % os.path.normpath(path)
+
+        includes.append(target)
+
+    return includes
+
+def common_prefix(lists):
+    """Obtain the longest common prefix of lists."""
+    if not lists:
+        return []
+
+    prefix = list(lists[0])
+    for l in lists[1:]:
+        i = 0
+        while i < len(prefix) and i < len(l) and prefix[i] == l[i]:
+            i += 1
+
+        del prefix[i:]
+
+    return prefix
+
+def header_language(filename, args):
+    """Obtain the language to compile the prelude of a file with."""
+    if '-x' in args:
+        i = args.index('-x')
+        if i + 1 < len(args):
+            return '%s-header' % args[i + 1]
+
+    ext = os.path.splitext(filename)[1].lower()
+
+    return HEADER_LANGUAGES.get(ext, 'c++-header')
+
+def strip_language(args):
+    """Remove -x arguments from a list of arguments."""
+    result = []
+    skip = False
+    for arg in args:
+        if skip:
+            skip = False
+        elif arg == '-x':
+            skip = True
+        else:
+            result.append(arg)
+
+    return result
+
+def _hash_file(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        h.update(fh.read())
+
+    return h.hexdigest()
+
+class PrecompiledHeaders(object):
+    """Builds and reuses precompiled headers for batches of files.
+
+    Files of a batch are grouped by their arguments. Within a group, the
+    include directives the files start with are compared, and the common
+    prefix becomes the prelude of the group. Alternatively, a prelude header
+    can be given for all groups. The prelude is compiled into a precompiled
+    header (PCH) once, and files are parsed against it with -include-pch.
+    libclang then loads the prelude from the PCH instead of parsing it
+    again.
+
+    PCHs are stored in a directory, keyed by the libclang version, the
+    arguments, parse options, and prelude. Alongside each PCH, the content
+    hashes of all headers it includes are recorded. A PCH is rebuilt when
+    any of them changed.
+
+    Headers in the prelude must be protected by include guards or
+    #pragma once, since files still include them after the PCH.
+    """
+
+    def __init__(self, directory, prelude=None, min_files=2):
+        """Create a manager of precompiled headers.
+
+        directory -- Directory holding built PCHs. It is created if it does
+          not exist.
+        prelude -- Filename of a header to use as the prelude of all files,
+          instead of detecting common includes.
+        min_files -- Minimum number of files in a group to build a PCH for.
+        """
+        self.directory = directory
+        self.prelude = prelude
+        self.min_files = min_files
+
+        self.builds = 0
+        self.reuses = 0
+        self.failures = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = clang.cindex.Index.create()
+
+        return self._index
+
+    def prepare(self, jobs, options=0):
+        """Build PCHs for jobs and add them to the arguments of the jobs.
+
+        jobs -- List of (filename, args) tuples.
+        options -- TranslationUnit.PARSE_* flags the files will be parsed
+          with.
+
+        Returns a new list of (filename, args) tuples.
+        """
+        groups = collections.OrderedDict()
+        for i, (filename, args) in enumerate(jobs):
+            key = (tuple(args), header_language(filename, args))
+            groups.setdefault(key, []).append(i)
+
+        result = list(jobs)
+        for (args, language), indices in groups.items():
+            if len(indices) < self.min_files:
+                continue
+
+            if self.prelude is not None:
+                includes = ['"%s"' % os.path.abspath(self.prelude)]
+            else:
+                found = [leading_includes(jobs[i][0]) for i in indices]
+                includes = common_prefix([f for f in found if f is not None])
+
+            if not includes:
+                continue
+
+            pch = self.get(list(args), language, includes, options)
+            if pch is None:
+                continue
+
+            for i in indices:
+                filename, job_args = jobs[i]
+                result[i] = (filename, list(job_args) + ['-include-pch', pch])
+
+        return result
+
+    def get(self, args, language, includes, options=0):
+        """Obtain the path of a PCH for a prelude, building it if needed.
+
+        args -- Arguments the files using the PCH are parsed with.
+        language -- Language of the prelude, such as 'c++-header'.
+        includes -- List of include directive arguments forming the prelude.
+        options -- TranslationUnit.PARSE_* flags files are parsed with.
+
+        Returns None if the PCH couldn't be built.
+        """
+        prelude = ''.join('#include %s\n' % i for i in includes)
+
+        h = hashlib.sha1()
+        h.update(('%s\0%d\0%s\0%s\0%d\0' % (libclang_version(), FORMAT,
+            language, '\0'.join(args), options)).encode('utf-8'))
+        h.update(prelude.encode('utf-8'))
+        key = h.hexdigest()
+
+        base = os.path.join(self.directory, key)
+        pch = base + '.pch'
+        manifest = base + '.json'
+
+        if self._valid(pch, manifest):
+            self.reuses += 1
+            return pch
+
+        if not self._build(base, args, language, prelude, options):
+            self.failures += 1
+            return None
+
+        self.builds += 1
+
+        return pch
+
+    def _valid(self, pch, manifest):
+        """Whether a PCH exists and the headers it includes are unchanged."""
+        if not os.path.exists(pch):
+            return False
+
+        try:
+            with open(manifest, 'r') as fh:
+                dependencies = json.load(fh)['dependencies']
+        except (IOError, OSError, ValueError, KeyError):
+            return False
+
+        for path, digest in dependencies.items():
+            try:
+                if _hash_file(path) != digest:
+                    return False
+            except (IOError, OSError):
+                return False
+
+        return True
+
+    def _build(self, base, args, language, prelude, options):
+        TranslationUnit = clang.cindex.TranslationUnit
+
+        header = base + '.h'
+        build_args = strip_language(args) + ['-x', language]
+
+        # Semantic analysis that only happens at the end of a translation
+        # unit must be left to the files using the PCH.
+        options = ((options & TranslationUnit.PARSE_SKIP_FUNCTION_BODIES) |
+                TranslationUnit.PARSE_INCOMPLETE)
+
+        try:
+            tu = self.index.parse(header, args=build_args,
+                    unsaved_files=[(header, prelude)], options=options)
+        except clang.cindex.TranslationUnitLoadError:
+            return False
+
+        dependencies = {}
+        for include in tu.get_includes():
+            path = include.include.name
+            if path == header or path in dependencies:
+                continue
+
+            try:
+                dependencies[path] = _hash_file(path)
+            except (IOError, OSError):
+                return False
+
+        # The PCH and manifest are written to temporary files and renamed so
+        # concurrent readers never see partial files.
+        fd, temp = tempfile.mkstemp(dir=self.directory)
+        os.close(fd)
+        try:
+            tu.save(temp)
+            os.rename(temp, base + '.pch')
+        except clang.cindex.TranslationUnitSaveError:
+            os.unlink(temp)
+            return False
+
+        fd, temp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'w') as fh:
+            json.dump({'dependencies': dependencies}, fh)
+        os.rename(temp, base + '.json')
+
+        return True
+
+    def dependencies(self, pch):
+        """Obtain the headers included by a PCH built by this instance.
+
+        Translation units parsed against a PCH don't report the headers it
+        includes, so this is needed to know everything they depend on.
+
+        Returns a dict of filename to content hash.
+        """
+        try:
+            with open(os.path.splitext(pch)[0] + '.json', 'r') as fh:
+                return json.load(fh)['dependencies']
+        except (IOError, OSError, ValueError, KeyError):
+            return {}
+
+    def stats(self):
+        """Obtain a dict with the number of builds, reuses, and failures."""
+        return {
+            'builds': self.builds,
+            'reuses': self.reuses,
+            'failures': self.failures,
+        }
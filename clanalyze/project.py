@@ -0,0 +1,238 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file contains code for analyzing whole projects described by a Clang
+# compilation database (compile_commands.json).
+
+import fnmatch
+import json
+import os.path
+import shlex
+
+# Arguments which only influence code generation or dependency file output
+# and are meaningless to the parser. Values are the number of arguments that
+# follow the flag.
+DROP_ARGS = {
+    '-c': 0,
+    '-o': 1,
+    '-M': 0,
+    '-MD': 0,
+    '-MMD': 0,
+    '-MP': 0,
+    '-MF': 1,
+    '-MT': 1,
+    '-MQ': 1,
+}
+
+# Arguments taking a path which is relative to the directory of the compile
+# command. These are made absolute because libclang doesn't know about that
+# directory.
+PATH_ARGS = (
+    '-I',
+    '-idirafter',
+    '-imacros',
+    '-include',
+    '-iquote',
+    '-isystem',
+)
+
+class CompileCommand(object):
+    """Describes how to compile a single file in a compilation database.
+
+    filename -- Absolute path of the file being compiled.
+    directory -- The working directory of the compile command.
+    args -- Tuple of arguments to pass to Clang when parsing the file. The
+        compiler executable, the file itself, and output-only arguments are
+        not included.
+    """
+
+    __slots__ = (
+        'args',
+        'directory',
+        'filename',
+    )
+
+    def __init__(self, filename, directory, args):
+        self.filename = filename
+        self.directory = directory
+        self.args = args
+
+    def __repr__(self):
+        return 'CompileCommand(%r)' % self.filename
+
+class CompilationDatabase(object):
+    """A Clang compilation database.
+
+    A compilation database is a JSON file, typically named
+    compile_commands.json, that is emitted by build systems like CMake. It
+    lists every file in the project along with the command used to compile
+    it.
+
+    Entries compiling the same file with the same arguments are only kept
+    once. Identical argument vectors are shared between entries.
+    """
+
+    def __init__(self, path):
+        """Load a compilation database.
+
+        path -- Path to a compile_commands.json file or to a directory
+          containing one.
+        """
+        if os.path.isdir(path):
+            path = os.path.join(path, 'compile_commands.json')
+
+        if not os.path.exists(path):
+            raise Exception('Compilation database does not exist: %s' % path)
+
+        self.path = os.path.abspath(path)
+        self.root = os.path.dirname(self.path)
+
+        with open(path, 'r') as fh:
+            entries = json.load(fh)
+
+        self.commands = []
+
+        seen = set()
+        interned = {}
+        for entry in entries:
+            command = CompilationDatabase.parse_entry(entry)
+
+            # Many build systems emit the same file multiple times. We also
+            # share argument vectors between entries as most files in a
+            # project are compiled with the same flags.
+            args = interned.setdefault(command.args, command.args)
+            command.args = args
+
+            key = (command.filename, args)
+            if key in seen:
+                continue
+
+            seen.add(key)
+            self.commands.append(command)
+
+    @staticmethod
+    def parse_entry(entry):
+        """Convert a compilation database JSON entry to a CompileCommand."""
+        directory = entry.get('directory', '')
+        filename = os.path.normpath(os.path.join(directory, entry['file']))
+
+        if 'arguments' in entry:
+            argv = list(entry['arguments'])
+        else:
+            argv = shlex.split(entry['command'])
+
+        return CompileCommand(filename, directory,
+                CompilationDatabase.normalize_args(argv[1:], directory,
+                    filename))
+
+    @staticmethod
+    def normalize_args(argv, directory, filename):
+        """Convert compiler arguments to arguments suitable for libclang."""
+        args = []
+
+        i = 0
+        while i < len(argv):
+            arg = argv[i]
+            i += 1
+
+            if arg in DROP_ARGS:
+                i += DROP_ARGS[arg]
+                continue
+
+            if arg.startswith('-o') and len(arg) > 2:
+                continue
+
+            if not arg.startswith('-'):
+                if os.path.normpath(os.path.join(directory, arg)) == filename:
+                    continue
+
+            if arg in PATH_ARGS and i < len(argv):
+                args.append(arg)
+                args.append(os.path.normpath(os.path.join(directory,
+                    argv[i])))
+                i += 1
+                continue
+
+            if arg.startswith('-I') and len(arg) > 2:
+                arg = '-I' + os.path.normpath(os.path.join(directory,
+                    arg[2:]))
+
+            args.append(arg)
+
+        return tuple(args)
+
+    def select(self, include=None, exclude=None, order='size'):
+        """Obtain compile commands, optionally filtered and sorted.
+
+        include -- Iterable of glob patterns. If defined, only files matching
+          at least one pattern are returned.
+        exclude -- Iterable of glob patterns. Files matching any pattern are
+          not returned.
+        order -- How to order the returned commands. 'size' puts the largest
+          source files first, so the longest translation units start early
+          and don't dominate wall time when parsing in parallel. 'database'
+          retains the order of the compilation database.
+
+        Patterns are matched against the absolute filename and the filename
+        relative to the directory containing the compilation database.
+        """
+        commands = [c for c in self.commands
+                if self._matches(c.filename, include, exclude)]
+
+        if order == 'size':
+            def size(command):
+                try:
+                    return os.path.getsize(command.filename)
+                except OSError:
+                    return 0
+
+            # Python's sort is stable, so equally sized files retain database
+            # order and the result is deterministic.
+            commands.sort(key=size, reverse=True)
+        elif order != 'database':
+            raise Exception('Unknown order: %s' % order)
+
+        return commands
+
+    def _matches(self, filename, include, exclude):
+        names = (filename, os.path.relpath(filename, self.root))
+
+        def matches(patterns):
+            for pattern in patterns:
+                for name in names:
+                    if fnmatch.fnmatch(name, pattern):
+                        return True
+
+            return False
+
+        if include and not matches(include):
+            return False
+
+        if exclude and matches(exclude):
+            return False
+
+        return True
+
+def analyze(parser, database, include=None, exclude=None, workers=None,
+        order='size', fail_fast=False, pch=None, memory_budget=None):
+    """Analyze every file in a compilation database.
+
+    This is the main entry point for running observers against a whole
+    project. Observers must already be registered with the passed parser.
+
+    parser -- Parser instance to parse files with.
+    database -- CompilationDatabase instance or path to one.
+    include, exclude, order -- See CompilationDatabase.select().
+    workers, fail_fast, pch, memory_budget -- See Parser.parse_many().
+
+    Returns the list of ParseResult from Parser.parse_many().
+    """
+    if not isinstance(database, CompilationDatabase):
+        database = CompilationDatabase(database)
+
+    commands = database.select(include=include, exclude=exclude, order=order)
+
+    return parser.parse_many([(c.filename, c.args) for c in commands],
+            workers=workers, fail_fast=fail_fast, pch=pch,
+            memory_budget=memory_budget)
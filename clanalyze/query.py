@@ -0,0 +1,405 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file contains an in-memory model of declarations with indexes for
+# answering queries without scanning every declaration.
+
+from .observer.base import DefinitionObserver
+from .store import children_of
+
+import re
+
+class IntervalIndex(object):
+    """Index of closed intervals supporting overlap queries.
+
+    Intervals are kept sorted by start. An implicit balanced binary tree over
+    the sorted intervals records the greatest end in each subtree, so queries
+    only descend into subtrees that can hold overlapping intervals. A query
+    takes O(log n + k) time for k results.
+
+    The tree is rebuilt on the first query after intervals were added.
+    """
+
+    __slots__ = (
+        '_dirty',
+        '_ends',
+        '_intervals',
+        '_max_ends',
+        '_starts',
+        '_values',
+    )
+
+    def __init__(self):
+        self._intervals = []
+        self._dirty = False
+
+        self._starts = []
+        self._ends = []
+        self._values = []
+        self._max_ends = []
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def add(self, start, end, value):
+        """Add the interval from start to end, inclusive, holding a value."""
+        self._intervals.append((start, end, value))
+        self._dirty = True
+
+    def _build(self):
+        # Intervals are sorted by start, then insertion order.
+        intervals = sorted(range(len(self._intervals)),
+                key=lambda i: (self._intervals[i][0], i))
+
+        self._starts = [self._intervals[i][0] for i in intervals]
+        self._ends = [self._intervals[i][1] for i in intervals]
+        self._values = [self._intervals[i][2] for i in intervals]
+        self._max_ends = [0] * len(intervals)
+        self._build_max_ends(0, len(intervals))
+
+        self._dirty = False
+
+    def _build_max_ends(self, lo, hi):
+        """Compute the greatest end of the subtree over [lo, hi)."""
+        mid = (lo + hi) // 2
+        max_end = self._ends[mid]
+        if lo < mid:
+            max_end = max(max_end, self._build_max_ends(lo, mid))
+        if mid + 1 < hi:
+            max_end = max(max_end, self._build_max_ends(mid + 1, hi))
+
+        self._max_ends[mid] = max_end
+
+        return max_end
+
+    def overlapping(self, start, end):
+        """Obtain the values of intervals overlapping start to end, inclusive.
+
+        Values are returned in order of the start of their intervals.
+        """
+        if self._dirty:
+            self._build()
+
+        result = []
+        if self._starts:
+            self._search(0, len(self._starts), start, end, result)
+
+        return result
+
+    def _search(self, lo, hi, start, end, result):
+        mid = (lo + hi) // 2
+        if self._max_ends[mid] < start:
+            return
+
+        if lo < mid:
+            self._search(lo, mid, start, end, result)
+
+        # Intervals in the right subtree start after this one.
+        if self._starts[mid] > end:
+            return
+
+        if self._ends[mid] >= start:
+            result.append(self._values[mid])
+
+        if mid + 1 < hi:
+            self._search(mid + 1, hi, start, end, result)
+
+    def containing(self, position):
+        """Obtain the values of intervals containing a position."""
+        return self.overlapping(position, position)
+
+class DeclarationModel(DefinitionObserver):
+    """Queryable model of declarations.
+
+    The model is a definition observer. Register it with a parser and every
+    definition the parser produces is added, along with its children, such
+    as class fields. Declarations are indexed by name, USR, file and kind,
+    and by the extents of their locations in each file, both in byte offsets
+    and in lines.
+
+    Every added declaration is kept, so a class defined in a header is added
+    once per translation unit including it. Parse with skip_seen_headers to
+    avoid that.
+
+    Use query() to look up declarations. See Query.
+    """
+
+    def __init__(self):
+        # Declarations, identified by their index in this list.
+        self.declarations = []
+        # Index of the enclosing declaration of each declaration, or -1.
+        self.parents = []
+
+        self._ids = {}
+        self._children = {}
+        self._names = {}
+        self._usrs = {}
+        self._files = {}
+        self._kinds = {}
+        self._offsets = {}
+        self._lines = {}
+
+    def __len__(self):
+        return len(self.declarations)
+
+    def process_definition(self, d):
+        self.add(d)
+
+    def add(self, declaration, parent=-1):
+        """Add a declaration and its children to the model.
+
+        Returns the id of the declaration.
+        """
+        i = len(self.declarations)
+        self.declarations.append(declaration)
+        self.parents.append(parent)
+        self._ids[id(declaration)] = i
+        if parent != -1:
+            self._children.setdefault(parent, []).append(i)
+
+        self._names.setdefault(declaration.name, []).append(i)
+        if declaration.usr:
+            self._usrs.setdefault(declaration.usr, []).append(i)
+        self._kinds.setdefault(type(declaration), []).append(i)
+
+        filename, start_line, _, start_offset = declaration.start_location
+        end_line, end_offset = declaration.end_location[1::2]
+        self._files.setdefault(filename, []).append(i)
+
+        if filename not in self._offsets:
+            self._offsets[filename] = IntervalIndex()
+            self._lines[filename] = IntervalIndex()
+
+        self._offsets[filename].add(start_offset, end_offset, i)
+        self._lines[filename].add(start_line, end_line, i)
+
+        for child in children_of(declaration):
+            self.add(child, i)
+
+        return i
+
+    def id_of(self, declaration):
+        """Obtain the id of a declaration in the model."""
+        return self._ids[id(declaration)]
+
+    def parent(self, declaration):
+        """Obtain the enclosing declaration of a declaration, or None."""
+        parent = self.parents[self.id_of(declaration)]
+        if parent == -1:
+            return None
+
+        return self.declarations[parent]
+
+    def files(self):
+        """Obtain the sorted list of files declarations are in."""
+        return sorted(f for f in self._files if f is not None)
+
+    def query(self):
+        """Obtain a Query matching every declaration of the model."""
+        return Query(self)
+
+class Query(object):
+    """Composable query over a DeclarationModel.
+
+    Queries are immutable. Every method adding a criterion returns a new
+    query matching declarations which match all criteria of the original
+    query and the new one::
+
+        model.query().kind(Class).in_file('foo.h').with_field('refcount')
+
+    Most criteria can select the ids of matching declarations from an index,
+    and cheaply estimate how many they select. The ids of the criterion with
+    the smallest estimate are the candidates, which are then checked against
+    the remaining criteria one by one. So a query costs about as much as its
+    most selective criterion, not the size of the model.
+
+    Results are in the order declarations were added to the model.
+    """
+
+    __slots__ = (
+        '_criteria',
+        '_model',
+    )
+
+    def __init__(self, model, criteria=()):
+        self._model = model
+        # Tuples of (test, select, estimate). test is a function of (id,
+        # declaration) checking the criterion for a single declaration.
+        # select is a function of the model returning the ids matching the
+        # criterion, or None if the criterion isn't indexed. estimate is a
+        # function of the model returning an upper bound of the number of
+        # ids select returns.
+        self._criteria = tuple(criteria)
+
+    def _add(self, test, select=None, estimate=None):
+        if select is not None and estimate is None:
+            estimate = lambda m: len(select(m))
+
+        return Query(self._model, self._criteria + ((test, select,
+            estimate),))
+
+    def name(self, name):
+        """Match declarations with a name."""
+        return self._add(lambda i, d: d.name == name,
+                lambda m: m._names.get(name, ()))
+
+    def name_matches(self, pattern):
+        """Match declarations whose name matches a regular expression.
+
+        The pattern is searched for in names, so use anchors to match whole
+        names. Only distinct names are checked against the pattern.
+        """
+        search = re.compile(pattern).search
+
+        def select(m):
+            ids = []
+            for name, name_ids in m._names.items():
+                if name is not None and search(name):
+                    ids.extend(name_ids)
+
+            return ids
+
+        return self._add(
+                lambda i, d: d.name is not None and bool(search(d.name)),
+                select, lambda m: len(m.declarations))
+
+    def usr(self, usr):
+        """Match declarations with a USR."""
+        return self._add(lambda i, d: d.usr == usr,
+                lambda m: m._usrs.get(usr, ()))
+
+    def kind(self, kind):
+        """Match declarations of a class, such as declaration.Class."""
+        return self._add(lambda i, d: type(d) is kind,
+                lambda m: m._kinds.get(kind, ()))
+
+    def in_file(self, filename):
+        """Match declarations starting in a file."""
+        return self._add(lambda i, d: d.start_location[0] == filename,
+                lambda m: m._files.get(filename, ()))
+
+    def overlapping(self, filename, start, end, lines=True):
+        """Match declarations in a file overlapping a range.
+
+        start, end -- Bounds of the range, inclusive.
+        lines -- Whether the range is of lines. Otherwise, it is of byte
+          offsets.
+        """
+        # Position of the line or offset in locations.
+        position = 1 if lines else 3
+
+        def select(m):
+            index = (m._lines if lines else m._offsets).get(filename)
+            if index is None:
+                return ()
+
+            return index.overlapping(start, end)
+
+        def test(i, d):
+            return (d.start_location[0] == filename and
+                    d.start_location[position] <= end and
+                    d.end_location[position] >= start)
+
+        # Interval queries are cheap, so their actual size is the estimate.
+        return self._add(test, select)
+
+    def at(self, filename, line):
+        """Match declarations in a file whose extent contains a line."""
+        return self.overlapping(filename, line, line)
+
+    def with_field(self, name):
+        """Match declarations having a child with a name, such as classes
+        with a field."""
+        m = self._model
+
+        def test(i, d):
+            for child in m._children.get(i, ()):
+                if m.declarations[child].name == name:
+                    return True
+
+            return False
+
+        return self._add(test,
+                lambda m: set(m.parents[i] for i in m._names.get(name, ())
+                    if m.parents[i] != -1),
+                lambda m: len(m._names.get(name, ())))
+
+    def children_of(self, declaration):
+        """Match the children of a declaration, such as the fields of a
+        class."""
+        m = self._model
+        parent = m.id_of(declaration)
+
+        return self._add(lambda i, d: m.parents[i] == parent,
+                lambda m: m._children.get(parent, ()))
+
+    def top_level(self):
+        """Match declarations without a parent."""
+        m = self._model
+
+        return self._add(lambda i, d: m.parents[i] == -1)
+
+    def where(self, predicate):
+        """Match declarations for which a function returns True.
+
+        The function is called with declarations matching the indexed
+        criteria.
+        """
+        return self._add(lambda i, d: predicate(d))
+
+    def ids(self):
+        """Obtain the sorted list of ids of matching declarations."""
+        m = self._model
+
+        best = None
+        best_size = None
+        for criterion in self._criteria:
+            test, select, estimate = criterion
+            if select is None:
+                continue
+
+            size = estimate(m)
+            if best is None or size < best_size:
+                best = criterion
+                best_size = size
+
+        if best is None:
+            candidates = range(len(m.declarations))
+        else:
+            candidates = sorted(set(best[1](m)))
+
+        tests = [c[0] for c in self._criteria if c is not best]
+
+        declarations = m.declarations
+        result = []
+        for i in candidates:
+            d = declarations[i]
+            for test in tests:
+                if not test(i, d):
+                    break
+            else:
+                result.append(i)
+
+        return result
+
+    def all(self):
+        """Obtain the list of matching declarations."""
+        declarations = self._model.declarations
+
+        return [declarations[i] for i in self.ids()]
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def first(self):
+        """Obtain the first matching declaration, or None."""
+        ids = self.ids()
+        if not ids:
+            return None
+
+        return self._model.declarations[ids[0]]
+
+    def count(self):
+        """Obtain the number of matching declarations."""
+        return len(self.ids())
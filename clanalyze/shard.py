@@ -0,0 +1,430 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file contains code for splitting the analysis of a set of files into
+# shards which run independently, and for merging their results.
+
+from .declaration import from_dict
+from .observer.base import DefinitionObserver
+from .observer.cursor.declaration import DEFINITION_METHODS
+
+import hashlib
+import heapq
+import json
+import os
+import tempfile
+import zlib
+
+# Version of the format of result files.
+FORMAT = 2
+
+# Ways of assigning files to shards.
+STRATEGIES = ('hash', 'size')
+
+def observer_name(obs):
+    """Obtain the "module:ClassName" name results of an observer are stored
+    under."""
+    return '%s:%s' % (type(obs).__module__, type(obs).__name__)
+
+def jobs_digest(jobs):
+    """Obtain a hash identifying a list of (filename, args) jobs.
+
+    Shards of the same analysis must be planned from the same jobs, in the
+    same order. The digest is stored in result files so merging can verify
+    this.
+    """
+    h = hashlib.sha1()
+    for filename, args in jobs:
+        h.update(('%s\0%s\0\0' % (filename, '\0'.join(args))).encode('utf-8'))
+
+    return h.hexdigest()
+
+def partition(jobs, count, strategy='hash'):
+    """Assign jobs to shards.
+
+    The assignment only depends on the jobs and the number of shards, so
+    every process planning the same analysis computes the same shards.
+
+    jobs -- List of (filename, args) tuples.
+    count -- Number of shards.
+    strategy -- 'hash' assigns files by a hash of their filename. A file
+      stays in the same shard when other files are added or removed.
+      'size' balances the total size of the files in each shard, which
+      evens out the time shards take. Sizes are read from disk, so all
+      shards must see the same files.
+
+    Returns a list of count lists of job indices. The indices of a shard
+    are in ascending order.
+    """
+    if count < 1:
+        raise Exception('Shard count must be at least 1.')
+
+    shards = [[] for i in range(count)]
+
+    if strategy == 'hash':
+        for i, (filename, args) in enumerate(jobs):
+            shards[zlib.crc32(filename.encode('utf-8')) % count].append(i)
+    elif strategy == 'size':
+        sizes = []
+        for filename, args in jobs:
+            try:
+                sizes.append(os.path.getsize(filename))
+            except OSError:
+                sizes.append(0)
+
+        # Largest files first, each to the shard with the least total size.
+        # Ties go to the lowest index, keeping the plan deterministic.
+        totals = [(0, s) for s in range(count)]
+        for i in sorted(range(len(jobs)), key=lambda i: (-sizes[i], i)):
+            total, s = heapq.heappop(totals)
+            shards[s].append(i)
+            heapq.heappush(totals, (total + sizes[i], s))
+
+        for shard in shards:
+            shard.sort()
+    else:
+        raise Exception('Unknown shard strategy: %s' % strategy)
+
+    return shards
+
+def covered_shards(header):
+    """Obtain the list of shard indices the header of a result file covers.
+
+    Result files of run_shard() cover their shard. Merged result files list
+    the shards they were merged from under 'covered'.
+    """
+    if header.get('covered') is not None:
+        return header['covered']
+
+    return [header['shard']]
+
+def _write_record(fh, record):
+    fh.write(json.dumps(record, sort_keys=True))
+    fh.write('\n')
+
+class ShardWriter(DefinitionObserver):
+    """Definition observer writing definitions to a result file.
+
+    Definitions are written as records tagged with their position in the
+    analysis: the index of the job that produced them and their sequence
+    within that job. Records are written once a file has been processed, in
+    the order of the jobs.
+    """
+
+    def __init__(self, fh, indices):
+        """Create a writer.
+
+        fh -- File object to write records to.
+        indices -- List of the job indices of the files that will be parsed,
+          in the order they are parsed.
+        """
+        self._fh = fh
+        self._indices = indices
+        self._position = 0
+        self._pending = []
+
+        self.definitions = 0
+
+    def process_definition(self, d):
+        self._pending.append((DEFINITION_METHODS[type(d)], d))
+
+    def end_file(self, filename):
+        if self._position >= len(self._indices):
+            raise Exception('More files processed than planned: %s' %
+                    filename)
+
+        index = self._indices[self._position]
+        self._position += 1
+
+        for seq, (method, declaration) in enumerate(self._pending):
+            _write_record(self._fh, {
+                'type': 'definition',
+                'order': [index, seq],
+                'usr': declaration.usr,
+                'method': method,
+                'declaration': declaration.to_dict(),
+            })
+
+        self.definitions += len(self._pending)
+        self._pending = []
+
+    def flush(self):
+        self._fh.flush()
+
+def run_shard(parser, jobs, index, count, path, strategy='hash',
+        observers=(), **kwargs):
+    """Analyze the files of one shard and write a result file.
+
+    The result file is in JSON lines format. It starts with a header record
+    describing the shard: its index, the number of shards, the strategy,
+    a digest of all jobs, and the files of the shard. Definition records
+    follow in source order, then a record for the results of each observer,
+    and finally an end record listing files that failed to parse. A file
+    lacking the end record is incomplete.
+
+    parser -- Parser to parse files with. Its definition observers are
+      notified of the definitions of the shard.
+    jobs -- List of (filename, args) tuples of all files of the analysis.
+      Every shard must be given the same list.
+    index -- Index of the shard to analyze, from 0 to count - 1.
+    count -- Number of shards.
+    path -- Filename to write results to. It is replaced atomically once
+      the shard completes.
+    strategy -- See partition().
+    observers -- Cursor and token observers registered with the parser
+      whose results are written to the result file. Results are obtained
+      with worker_result() after parsing and must be JSON serializable.
+      merge() passes them to merge_worker_result().
+
+    Other keyword arguments are passed to Parser.parse_many().
+
+    Returns the list of ParseResult for the files of the shard.
+    """
+    if index < 0 or index >= count:
+        raise Exception('Shard index must be between 0 and %d: %d' %
+                (count - 1, index))
+
+    jobs = [(f, list(a)) for f, a in jobs]
+    indices = partition(jobs, count, strategy)[index]
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            _write_record(fh, {
+                'type': 'header',
+                'format': FORMAT,
+                'shard': index,
+                'shards': count,
+                'strategy': strategy,
+                'jobs': jobs_digest(jobs),
+                'total_files': len(jobs),
+                'files': [[i, jobs[i][0], jobs[i][1]] for i in indices],
+            })
+
+            writer = ShardWriter(fh, indices)
+            parser.add_observer(writer)
+            try:
+                results = parser.parse_many([jobs[i] for i in indices],
+                        **kwargs)
+            finally:
+                parser.remove_observer(writer)
+
+            for obs in observers:
+                result = obs.worker_result()
+                if result is None:
+                    continue
+
+                try:
+                    _write_record(fh, {'type': 'observer',
+                        'observer': observer_name(obs), 'result': result})
+                except TypeError:
+                    raise Exception('Result of observer %s is not JSON '
+                            'serializable.' % observer_name(obs))
+
+            _write_record(fh, {
+                'type': 'end',
+                'definitions': writer.definitions,
+                'errors': [[i, r.filename, r.error] for i, r in
+                    zip(indices, results) if not r.ok],
+            })
+
+        os.rename(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+    return results
+
+class ShardFile(object):
+    """Reader of a result file written by run_shard() or merge().
+
+    header -- The header record.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fh = open(path, 'r')
+
+        line = self._fh.readline()
+        try:
+            self.header = json.loads(line)
+        except ValueError:
+            self.header = None
+
+        if (not isinstance(self.header, dict) or
+                self.header.get('type') != 'header'):
+            self.close()
+            raise Exception('Not a result file: %s' % path)
+
+        if self.header.get('format') != FORMAT:
+            self.close()
+            raise Exception('Unsupported result file format: %s' % path)
+
+        self.trailer = []
+        self.end = None
+
+    def close(self):
+        self._fh.close()
+
+    def definitions(self):
+        """Generator of (order, line, record) for definition records.
+
+        order is a tuple of (job index, sequence). Other records are
+        collected into trailer as they are encountered, and the end record
+        is stored in end.
+        """
+        for line in self._fh:
+            record = json.loads(line)
+            kind = record['type']
+
+            if kind == 'definition':
+                yield tuple(record['order']), line, record
+            elif kind == 'end':
+                self.end = record
+            else:
+                self.trailer.append(record)
+
+def merge(paths, output=None, observers=(), partial=False):
+    """Merge the result files of shards.
+
+    Definitions are merged in source order: the order of the jobs the shards
+    were planned from, then the order definitions were produced within each
+    file. Definitions sharing a USR, such as classes of a header included by
+    files in different shards, are only kept the first time they appear.
+    Merging streams through the files, so its cost is linear in their size
+    and memory only grows with the number of distinct USRs.
+
+    paths -- Filenames of result files. They must be shards of the same
+      analysis.
+    output -- Filename to write the merged results to. It has the format of
+      a result file, with the shards it covers listed in its header, so it
+      can be merged again, including with other partial merges.
+    observers -- Observers to send results to. Definition observers are
+      notified of merged definitions. Other observers receive the results
+      stored for them via merge_worker_result().
+    partial -- Whether to allow merging a subset of the shards.
+
+    Returns a dict with the number of 'definitions' kept, the number of
+    'duplicates' dropped, and the 'errors' of the shards as lists of
+    [job index, filename, error].
+    """
+    shards = [ShardFile(path) for path in paths]
+    try:
+        header = _merged_header(shards, partial)
+
+        definition_observers = [o for o in observers
+                if isinstance(o, DefinitionObserver)]
+        result_observers = dict((observer_name(o), o) for o in observers
+                if not isinstance(o, DefinitionObserver))
+
+        out = None
+        temp = None
+        if output is not None:
+            directory = os.path.dirname(os.path.abspath(output))
+            fd, temp = tempfile.mkstemp(dir=directory)
+            out = os.fdopen(fd, 'w')
+            _write_record(out, header)
+
+        try:
+            summary = _merge_definitions(shards, out, definition_observers)
+
+            for shard in shards:
+                if shard.end is None:
+                    raise Exception('Result file is incomplete: %s' %
+                            shard.path)
+
+                summary['errors'].extend(shard.end['errors'])
+
+                for record in shard.trailer:
+                    obs = result_observers.get(record.get('observer'))
+                    if obs is not None:
+                        obs.merge_worker_result(record['result'])
+
+                    if out is not None:
+                        _write_record(out, record)
+
+            summary['errors'].sort()
+
+            if out is not None:
+                _write_record(out, {
+                    'type': 'end',
+                    'definitions': summary['definitions'],
+                    'errors': summary['errors'],
+                })
+                out.close()
+                os.rename(temp, output)
+        except BaseException:
+            if out is not None:
+                out.close()
+                os.unlink(temp)
+            raise
+    finally:
+        for shard in shards:
+            shard.close()
+
+    return summary
+
+def _merged_header(shards, partial):
+    """Validate that result files belong together and obtain the header of
+    their merge."""
+    if not shards:
+        raise Exception('No result files to merge.')
+
+    first = shards[0].header
+    covered = set()
+    files = []
+    for shard in shards:
+        header = shard.header
+        for key in ('jobs', 'shards', 'strategy'):
+            if header[key] != first[key]:
+                raise Exception('%s is not a shard of the same analysis as '
+                        '%s.' % (shard.path, shards[0].path))
+
+        for index in covered_shards(header):
+            if index in covered:
+                raise Exception('Shard %d given more than once.' % index)
+
+            covered.add(index)
+
+        files.extend(header['files'])
+
+    missing = set(range(first['shards'])) - covered
+    if missing and not partial:
+        raise Exception('Missing shards: %s' %
+                ', '.join(str(i) for i in sorted(missing)))
+
+    header = dict(first)
+    header['shard'] = None
+    header['covered'] = sorted(covered)
+    header['files'] = sorted(files)
+
+    return header
+
+def _merge_definitions(shards, out, observers):
+    summary = {'definitions': 0, 'duplicates': 0, 'errors': []}
+
+    seen = set()
+    streams = [shard.definitions() for shard in shards]
+    for order, line, record in heapq.merge(*streams, key=lambda r: r[0]):
+        usr = record['usr']
+        # Anonymous entities have no USR and are always distinct.
+        if usr:
+            if usr in seen:
+                summary['duplicates'] += 1
+                continue
+
+            seen.add(usr)
+
+        summary['definitions'] += 1
+
+        if out is not None:
+            out.write(line)
+
+        if observers:
+            declaration = from_dict(record['declaration'])
+            for obs in observers:
+                getattr(obs, record['method'])(declaration)
+
+    return summary
@@ -0,0 +1,328 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file contains instrumentation for measuring where parsing time goes.
+
+import clang.cindex
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import sys
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+def peak_memory():
+    """The peak resident set size of this process in bytes, if known."""
+    if resource is None:
+        return None
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes, macOS reports bytes.
+    if sys.platform != 'darwin':
+        rss *= 1024
+
+    return rss
+
+def current_memory():
+    """The current resident set size of this process in bytes, if known.
+
+    This is only available on Linux. Elsewhere, the peak is returned.
+    """
+    try:
+        with open('/proc/self/statm', 'r') as fh:
+            pages = int(fh.read().split()[1])
+    except (IOError, OSError, ValueError, IndexError):
+        return peak_memory()
+
+    return pages * os.sysconf('SC_PAGE_SIZE')
+
+class Timing(object):
+    """Accumulated wall and CPU time of repeated events.
+
+    count -- Number of events.
+    wall -- Total wall time in seconds.
+    cpu -- Total CPU time of this process in seconds.
+    """
+
+    __slots__ = (
+        'count',
+        'cpu',
+        'wall',
+    )
+
+    def __init__(self, count=0, wall=0.0, cpu=0.0):
+        self.count = count
+        self.wall = wall
+        self.cpu = cpu
+
+    def add(self, wall, cpu, count=1):
+        self.count += count
+        self.wall += wall
+        self.cpu += cpu
+
+    def merge(self, other):
+        self.add(other.wall, other.cpu, other.count)
+
+    def to_dict(self):
+        return {'count': self.count, 'wall': self.wall, 'cpu': self.cpu}
+
+    def __getstate__(self):
+        return (self.count, self.wall, self.cpu)
+
+    def __setstate__(self, state):
+        self.count, self.wall, self.cpu = state
+
+class _TimedCursorObserver(object):
+    """Proxy for a cursor observer accounting its time to ParseStats."""
+
+    __slots__ = (
+        'observer',
+        'stats',
+        'timing',
+    )
+
+    def __init__(self, observer, stats):
+        self.observer = observer
+        self.stats = stats
+        self.timing = stats.observer_timing(observer)
+
+    def process_cursor(self, cursor):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        self.observer.process_cursor(cursor)
+
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+
+        self.timing.add(wall, cpu)
+        self.stats.kind_timing(cursor.kind).add(wall, cpu, 0)
+
+    def end_cursor(self, cursor):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        self.observer.end_cursor(cursor)
+
+        self.timing.add(time.perf_counter() - wall,
+                time.process_time() - cpu, 0)
+
+class ParseStats(object):
+    """Statistics about the work performed by a parser.
+
+    Give an instance to a Parser to have it record statistics. They
+    accumulate across all files the parser parses, including files parsed in
+    worker processes by Parser.parse_many().
+
+    The following is recorded:
+
+    files -- Number of files parsed, including those served from the
+      declaration cache.
+    bytes -- Total size of the main files parsed by libclang.
+    cursors -- Number of cursors visited by the AST walk.
+    tokens -- Number of tokens extracted for token observers.
+    declarations -- Number of definitions sent to definition observers.
+    phases -- dict of phase name to Timing. Phases are:
+      input -- Reading input and computing cache keys.
+      cache -- Looking up and storing declaration cache entries.
+      replay -- Sending cached definitions to definition observers.
+      clang -- Parsing the translation unit in libclang.
+      pch -- Building or validating precompiled headers for a batch.
+      walk -- Walking the AST and dispatching to cursor observers.
+      tokens -- Extracting tokens and dispatching to token observers.
+    observers -- dict of observer class name to Timing of calls into
+      observers of that class. Time of a cursor observer includes
+      definition observers it notifies.
+    cursor_kinds -- dict of CursorKind value to Timing. The count is the
+      number of cursors of that kind visited. Times are of cursor observer
+      calls for cursors of that kind.
+    memory -- dict of phase name to the peak traced memory in bytes during
+      the phase. Only recorded when tracing memory.
+
+    Recording per-observer and per-kind times adds overhead to every
+    observer call, so parsing is slower while stats are recorded.
+    """
+
+    def __init__(self, profile=None, trace_memory=False):
+        """Create an empty statistics object.
+
+        profile -- Iterable of phase names to run under cProfile. Profiles
+          accumulate across files and are available from profile_stats().
+        trace_memory -- Whether to record the peak memory allocated by Python
+          in each phase with tracemalloc. Tracing is started if needed.
+        """
+        self.files = 0
+        self.bytes = 0
+        self.cursors = 0
+        self.tokens = 0
+        self.declarations = 0
+
+        self.phases = {}
+        self.observers = {}
+        self.cursor_kinds = {}
+        self.memory = {}
+
+        self.profile = set(profile or ())
+        self.trace_memory = trace_memory
+        self._profilers = {}
+
+    def __getstate__(self):
+        # Profilers can't be transferred between processes.
+        state = dict(self.__dict__)
+        state['profile'] = set()
+        state['_profilers'] = {}
+
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+
+    def phase_timing(self, name):
+        timing = self.phases.get(name)
+        if timing is None:
+            timing = self.phases[name] = Timing()
+
+        return timing
+
+    def observer_timing(self, observer):
+        name = type(observer).__name__
+
+        timing = self.observers.get(name)
+        if timing is None:
+            timing = self.observers[name] = Timing()
+
+        return timing
+
+    def kind_timing(self, kind):
+        timing = self.cursor_kinds.get(kind.value)
+        if timing is None:
+            timing = self.cursor_kinds[kind.value] = Timing()
+
+        return timing
+
+    def count_cursor(self, kind):
+        self.cursors += 1
+        self.kind_timing(kind).count += 1
+
+    def wrap_cursor_observer(self, observer):
+        """Obtain a proxy recording the time spent in a cursor observer."""
+        return _TimedCursorObserver(observer, self)
+
+    def call_observer(self, observer, method, *args):
+        """Call a method on an observer, recording the time spent."""
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        result = getattr(observer, method)(*args)
+
+        self.observer_timing(observer).add(time.perf_counter() - wall,
+                time.process_time() - cpu)
+
+        return result
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """Context manager accounting the enclosed code to a phase."""
+        profiler = None
+        if name in self.profile:
+            profiler = self._profilers.get(name)
+            if profiler is None:
+                profiler = self._profilers[name] = cProfile.Profile()
+
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+
+            start_memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+
+        wall = time.perf_counter()
+        cpu = time.process_time()
+
+        if profiler is not None:
+            profiler.enable()
+
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+
+            self.phase_timing(name).add(time.perf_counter() - wall,
+                    time.process_time() - cpu)
+
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1] - start_memory
+                self.memory[name] = max(self.memory.get(name, 0), peak)
+
+    def profile_stats(self, name):
+        """Obtain a pstats.Stats for a profiled phase.
+
+        Returns None if the phase wasn't profiled.
+        """
+        profiler = self._profilers.get(name)
+        if profiler is None:
+            return None
+
+        return pstats.Stats(profiler)
+
+    def merge(self, other):
+        """Add the statistics of another instance to this one."""
+        self.files += other.files
+        self.bytes += other.bytes
+        self.cursors += other.cursors
+        self.tokens += other.tokens
+        self.declarations += other.declarations
+
+        for ours, theirs in ((self.phases, other.phases),
+                (self.observers, other.observers),
+                (self.cursor_kinds, other.cursor_kinds)):
+            for key, timing in theirs.items():
+                if key in ours:
+                    ours[key].merge(timing)
+                else:
+                    ours[key] = Timing(timing.count, timing.wall, timing.cpu)
+
+        for name, peak in other.memory.items():
+            self.memory[name] = max(self.memory.get(name, 0), peak)
+
+    def to_dict(self):
+        """Obtain the statistics as a dict of JSON-compatible types.
+
+        Cursor kinds are keyed by name.
+        """
+        kinds = {}
+        for value, timing in self.cursor_kinds.items():
+            kinds[clang.cindex.CursorKind.from_id(value).name] = \
+                timing.to_dict()
+
+        return {
+            'files': self.files,
+            'bytes': self.bytes,
+            'cursors': self.cursors,
+            'tokens': self.tokens,
+            'declarations': self.declarations,
+            'phases': dict((k, v.to_dict()) for k, v in self.phases.items()),
+            'observers': dict((k, v.to_dict()) for k, v in
+                self.observers.items()),
+            'cursor_kinds': kinds,
+            'memory': dict(self.memory),
+        }
+
+    def to_json(self, **kwargs):
+        """Serialize the statistics to a JSON string.
+
+        Keyword arguments are passed to json.dumps().
+        """
+        kwargs.setdefault('sort_keys', True)
+
+        return json.dumps(self.to_dict(), **kwargs)
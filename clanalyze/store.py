@@ -0,0 +1,547 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file contains a compact, column-oriented store of declarations.
+
+from .declaration import (Class, Enum, EnumConstant, Field, Function,
+    Method, Struct, Typedef, Union)
+from .observer.base import DefinitionObserver
+
+import array
+
+# Declaration types that can be stored, indexed by their integer kind code.
+KINDS = [
+    Class,
+    Field,
+    Struct,
+    Function,
+    Method,
+    Enum,
+    EnumConstant,
+    Typedef,
+    Union,
+]
+
+# Bits of the flags column holding the boolean attributes of methods.
+FLAG_STATIC = 1
+FLAG_VIRTUAL = 2
+FLAG_CONST = 4
+
+FLAG_ATTRIBUTES = (
+    (FLAG_STATIC, 'is_static'),
+    (FLAG_VIRTUAL, 'is_virtual'),
+    (FLAG_CONST, 'is_const'),
+)
+
+# Bit of the flags column set when the value column holds an unsigned value
+# too large for a signed 64-bit integer. Such values are stored modulo 2**64.
+FLAG_UNSIGNED = 8
+
+VALUE_MAX = 2 ** 63 - 1
+
+KIND_CODES = dict((cls, code) for code, cls in enumerate(KINDS))
+
+class StringTable(object):
+    """Interns strings as integer ids.
+
+    Each distinct string is stored once. Id -1 represents None.
+    """
+
+    __slots__ = (
+        '_ids',
+        'strings',
+    )
+
+    def __init__(self):
+        self.strings = []
+        self._ids = {}
+
+    def __len__(self):
+        return len(self.strings)
+
+    def intern(self, s):
+        """Obtain the id of a string, adding it to the table if needed."""
+        if s is None:
+            return -1
+
+        i = self._ids.get(s)
+        if i is None:
+            i = self._ids[s] = len(self.strings)
+            self.strings.append(s)
+
+        return i
+
+    def lookup(self, s):
+        """Obtain the id of a string without adding it. Returns -1 if absent."""
+        return self._ids.get(s, -1)
+
+    def get(self, i):
+        """Obtain the string with an id."""
+        if i < 0:
+            return None
+
+        return self.strings[i]
+
+    def __getstate__(self):
+        return self.strings
+
+    def __setstate__(self, strings):
+        self.strings = strings
+        self._ids = dict((s, i) for i, s in enumerate(strings))
+
+class DeclarationStore(DefinitionObserver):
+    """Stores declarations in typed arrays instead of Python objects.
+
+    Each stored declaration is a row, identified by its index. The
+    attributes of declarations are held in parallel columns:
+
+    kinds -- array of kind codes. See KINDS.
+    names, spellings, usrs -- arrays of ids in the strings table.
+    start_files, end_files -- arrays of ids in the files table.
+    start_lines, start_columns, start_offsets, end_lines, end_columns,
+      end_offsets -- arrays of location components.
+    parents -- array of the index of the enclosing declaration, such as the
+      class of a field. -1 for top-level declarations.
+    child_counts -- array of the number of children of each declaration.
+      Children are stored in the rows immediately following their parent.
+    types, type_usrs -- arrays of ids in the strings table of the type and
+      type USR of fields and typedefs. Functions, methods and enums only
+      have a type. -1 otherwise.
+    result_types -- array of ids in the strings table of the result type of
+      functions and methods. -1 for other declarations.
+    flags -- array of the FLAG_* bits of methods and enum constants. 0 for
+      other declarations.
+    values -- array of the values of enum constants, as signed 64-bit
+      integers. See FLAG_UNSIGNED. 0 for other declarations.
+
+    Function arguments aren't stored.
+
+    Strings and filenames are interned, so each distinct value is stored
+    once no matter how many declarations refer to it. Columns support the
+    buffer protocol, so they can be wrapped by numpy.frombuffer() for bulk
+    processing.
+
+    Stored declarations are accessed through views, which have the same
+    attributes as the declaration classes but read them from the store.
+
+    The store is a definition observer. Register it with a parser to store
+    every definition the parser produces.
+    """
+
+    def __init__(self):
+        self.strings = StringTable()
+        self.files = StringTable()
+
+        self.kinds = array.array('B')
+        self.names = array.array('i')
+        self.spellings = array.array('i')
+        self.usrs = array.array('i')
+        self.start_files = array.array('i')
+        self.start_lines = array.array('I')
+        self.start_columns = array.array('I')
+        self.start_offsets = array.array('I')
+        self.end_files = array.array('i')
+        self.end_lines = array.array('I')
+        self.end_columns = array.array('I')
+        self.end_offsets = array.array('I')
+        self.parents = array.array('i')
+        self.child_counts = array.array('I')
+        self.types = array.array('i')
+        self.type_usrs = array.array('i')
+        self.result_types = array.array('i')
+        self.flags = array.array('B')
+        self.values = array.array('q')
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self.kinds)
+
+        if i < 0 or i >= len(self.kinds):
+            raise IndexError('declaration index out of range')
+
+        return VIEWS[self.kinds[i]](self, i)
+
+    def __iter__(self):
+        for i in range(len(self.kinds)):
+            yield VIEWS[self.kinds[i]](self, i)
+
+    def process_definition(self, d):
+        self.add(d)
+
+    def _add_location(self, location, files, lines, columns, offsets):
+        filename, line, column, offset = location
+        if filename is not None:
+            filename = getattr(filename, 'name', filename)
+
+        files.append(self.files.intern(filename))
+        lines.append(line)
+        columns.append(column)
+        offsets.append(offset)
+
+    def add(self, declaration, parent=-1):
+        """Store a declaration and its children.
+
+        Returns the index of the declaration.
+        """
+        code = KIND_CODES.get(type(declaration))
+        if code is None:
+            raise Exception('Unsupported declaration type: %s' %
+                    type(declaration).__name__)
+
+        index = len(self.kinds)
+        strings = self.strings
+
+        self.kinds.append(code)
+        self.names.append(strings.intern(declaration.name))
+        self.spellings.append(strings.intern(declaration.spelling))
+        self.usrs.append(strings.intern(declaration.usr))
+        self._add_location(declaration.start_location, self.start_files,
+                self.start_lines, self.start_columns, self.start_offsets)
+        self._add_location(declaration.end_location, self.end_files,
+                self.end_lines, self.end_columns, self.end_offsets)
+        self.parents.append(parent)
+        self.types.append(strings.intern(getattr(declaration, 'type', None)))
+        self.type_usrs.append(strings.intern(getattr(declaration, 'type_usr',
+            None)))
+        self.result_types.append(strings.intern(getattr(declaration,
+            'result_type', None)))
+        self.flags.append(flags_of(declaration))
+        self.values.append(stored_value(declaration))
+
+        children = children_of(declaration)
+        self.child_counts.append(len(children))
+
+        # Children are added depth-first, so grandchildren would break the
+        # contiguity of children.
+        for child in children:
+            if children_of(child):
+                raise Exception('Nested children are not supported.')
+
+            self.add(child, index)
+
+        return index
+
+    def children(self, i):
+        """Obtain the range of indices of the children of a declaration."""
+        return range(i + 1, i + 1 + self.child_counts[i])
+
+    def indices(self, kind=None, top_level=False):
+        """Generator of indices of stored declarations.
+
+        kind -- Declaration class (such as declaration.Class) to limit
+          results to.
+        top_level -- Only generate declarations without a parent.
+        """
+        kinds = self.kinds
+        parents = self.parents
+        code = None if kind is None else KIND_CODES[kind]
+
+        for i in range(len(kinds)):
+            if code is not None and kinds[i] != code:
+                continue
+
+            if top_level and parents[i] != -1:
+                continue
+
+            yield i
+
+    def classes(self):
+        """Generator of ClassView for every stored class."""
+        for i in self.indices(Class):
+            yield ClassView(self, i)
+
+    def find_usr(self, usr):
+        """Obtain the indices of declarations with a USR."""
+        sid = self.strings.lookup(usr)
+        if sid == -1:
+            return []
+
+        return [i for i, u in enumerate(self.usrs) if u == sid]
+
+    def memory_usage(self):
+        """Estimate the number of bytes used by columns."""
+        size = 0
+        for name in COLUMNS:
+            column = getattr(self, name)
+            size += column.itemsize * len(column)
+
+        return size
+
+# Names of the array attributes of DeclarationStore.
+COLUMNS = (
+    'kinds',
+    'names',
+    'spellings',
+    'usrs',
+    'start_files',
+    'start_lines',
+    'start_columns',
+    'start_offsets',
+    'end_files',
+    'end_lines',
+    'end_columns',
+    'end_offsets',
+    'parents',
+    'child_counts',
+    'types',
+    'type_usrs',
+    'result_types',
+    'flags',
+    'values',
+)
+
+def children_of(declaration):
+    """Obtain the child declarations of a declaration as a list."""
+    return declaration.children()
+
+def flags_of(declaration):
+    """Obtain the value of the flags column for a declaration."""
+    flags = 0
+    for flag, name in FLAG_ATTRIBUTES:
+        if getattr(declaration, name, False):
+            flags |= flag
+
+    if (getattr(declaration, 'value', None) or 0) > VALUE_MAX:
+        flags |= FLAG_UNSIGNED
+
+    return flags
+
+def stored_value(declaration):
+    """Obtain the value of the values column for a declaration."""
+    value = getattr(declaration, 'value', None) or 0
+    if value > VALUE_MAX:
+        value -= 2 ** 64
+
+    return value
+
+class DeclarationView(object):
+    """Read-only view of a declaration in a DeclarationStore.
+
+    Views have the same attributes as declaration.Declaration. Locations use
+    filenames instead of Clang File instances.
+    """
+
+    __slots__ = (
+        'index',
+        'store',
+    )
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __eq__(self, other):
+        return (isinstance(other, DeclarationView) and
+                self.store is other.store and self.index == other.index)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    @property
+    def kind(self):
+        """The declaration class this is a view of."""
+        return KINDS[self.store.kinds[self.index]]
+
+    @property
+    def name(self):
+        return self.store.strings.get(self.store.names[self.index])
+
+    @property
+    def spelling(self):
+        return self.store.strings.get(self.store.spellings[self.index])
+
+    @property
+    def usr(self):
+        return self.store.strings.get(self.store.usrs[self.index])
+
+    @property
+    def start_location(self):
+        s = self.store
+        i = self.index
+        return (s.files.get(s.start_files[i]), s.start_lines[i],
+                s.start_columns[i], s.start_offsets[i])
+
+    @property
+    def end_location(self):
+        s = self.store
+        i = self.index
+        return (s.files.get(s.end_files[i]), s.end_lines[i],
+                s.end_columns[i], s.end_offsets[i])
+
+    @property
+    def parent(self):
+        """View of the enclosing declaration, or None."""
+        parent = self.store.parents[self.index]
+        if parent == -1:
+            return None
+
+        return self.store[parent]
+
+class TypedView(DeclarationView):
+    """View of a declaration with a type."""
+
+    __slots__ = ()
+
+    @property
+    def type(self):
+        return self.store.strings.get(self.store.types[self.index])
+
+class FieldView(TypedView):
+    """View of a declaration.Field."""
+
+    __slots__ = ()
+
+    @property
+    def type_usr(self):
+        return self.store.strings.get(self.store.type_usrs[self.index])
+
+class MembersView(object):
+    """Read-only mapping of member names to views, in declaration order.
+
+    This stands in for the fields OrderedDict of declaration.Class and the
+    constants OrderedDict of declaration.Enum. Only children of one kind are
+    members.
+    """
+
+    __slots__ = (
+        'code',
+        'index',
+        'store',
+    )
+
+    def __init__(self, store, index, kind):
+        self.store = store
+        self.index = index
+        self.code = KIND_CODES[kind]
+
+    def __len__(self):
+        return len(self.values())
+
+    def values(self):
+        kinds = self.store.kinds
+        return [VIEWS[self.code](self.store, i) for i in
+                self.store.children(self.index) if kinds[i] == self.code]
+
+    def keys(self):
+        return [m.name for m in self.values()]
+
+    def items(self):
+        return [(m.name, m) for m in self.values()]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, name):
+        return name in self.keys()
+
+    def __getitem__(self, name):
+        for m in self.values():
+            if m.name == name:
+                return m
+
+        raise KeyError(name)
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+class ClassView(DeclarationView):
+    """View of a declaration.Class."""
+
+    __slots__ = ()
+
+    @property
+    def fields(self):
+        return MembersView(self.store, self.index, Field)
+
+    @property
+    def methods(self):
+        return MembersView(self.store, self.index, Method).values()
+
+class StructView(ClassView):
+    """View of a declaration.Struct."""
+
+    __slots__ = ()
+
+class UnionView(ClassView):
+    """View of a declaration.Union."""
+
+    __slots__ = ()
+
+class FunctionView(TypedView):
+    """View of a declaration.Function.
+
+    Arguments aren't stored, so this has no arguments attribute.
+    """
+
+    __slots__ = ()
+
+    @property
+    def result_type(self):
+        return self.store.strings.get(self.store.result_types[self.index])
+
+class MethodView(FunctionView):
+    """View of a declaration.Method."""
+
+    __slots__ = ()
+
+    @property
+    def is_static(self):
+        return bool(self.store.flags[self.index] & FLAG_STATIC)
+
+    @property
+    def is_virtual(self):
+        return bool(self.store.flags[self.index] & FLAG_VIRTUAL)
+
+    @property
+    def is_const(self):
+        return bool(self.store.flags[self.index] & FLAG_CONST)
+
+class EnumView(TypedView):
+    """View of a declaration.Enum."""
+
+    __slots__ = ()
+
+    @property
+    def constants(self):
+        return MembersView(self.store, self.index, EnumConstant)
+
+class EnumConstantView(DeclarationView):
+    """View of a declaration.EnumConstant."""
+
+    __slots__ = ()
+
+    @property
+    def value(self):
+        value = self.store.values[self.index]
+        if self.store.flags[self.index] & FLAG_UNSIGNED:
+            value += 2 ** 64
+
+        return value
+
+class TypedefView(FieldView):
+    """View of a declaration.Typedef."""
+
+    __slots__ = ()
+
+# View classes, indexed by kind code.
+VIEWS = [
+    ClassView,
+    FieldView,
+    StructView,
+    FunctionView,
+    MethodView,
+    EnumView,
+    EnumConstantView,
+    TypedefView,
+    UnionView,
+]
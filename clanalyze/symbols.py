@@ -0,0 +1,272 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file contains a persistent index of symbols across translation units.
+
+from .observer.base import DefinitionObserver
+
+import collections
+import sqlite3
+
+"""Describes a symbol in the index.
+
+usr -- Unified Symbol Resolution string identifying the symbol.
+name -- Display name of the symbol.
+spelling -- Spelling of the symbol's identifier.
+kind -- Kind of declaration, such as 'class' or 'field'.
+parent_usr -- USR of the enclosing symbol, such as the class of a field.
+type -- Spelling of the symbol's type, for fields.
+type_usr -- USR of the declaration of the symbol's type, for fields.
+"""
+Symbol = collections.namedtuple('Symbol', ['usr', 'name', 'spelling', 'kind',
+    'parent_usr', 'type', 'type_usr'])
+
+"""Describes a location a symbol is defined or referenced at.
+
+usr -- USR of the symbol.
+role -- 'definition' or 'reference'.
+filename, line, column, offset -- Where the definition or reference starts.
+end_line, end_column, end_offset -- Where it ends.
+referrer_usr -- USR of the symbol containing a reference, such as the field
+  whose type refers to the symbol. None for definitions.
+"""
+Location = collections.namedtuple('Location', ['usr', 'role', 'filename',
+    'line', 'column', 'offset', 'end_line', 'end_column', 'end_offset',
+    'referrer_usr'])
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS symbols (
+    usr TEXT PRIMARY KEY,
+    name TEXT,
+    spelling TEXT,
+    kind TEXT,
+    parent_usr TEXT,
+    type TEXT,
+    type_usr TEXT
+);
+CREATE INDEX IF NOT EXISTS symbols_name ON symbols (name);
+CREATE INDEX IF NOT EXISTS symbols_kind ON symbols (kind);
+CREATE INDEX IF NOT EXISTS symbols_parent ON symbols (parent_usr);
+CREATE INDEX IF NOT EXISTS symbols_type ON symbols (type_usr);
+
+CREATE TABLE IF NOT EXISTS locations (
+    usr TEXT,
+    role TEXT,
+    filename TEXT,
+    line INTEGER,
+    column INTEGER,
+    offset INTEGER,
+    end_line INTEGER,
+    end_column INTEGER,
+    end_offset INTEGER,
+    referrer_usr TEXT,
+    UNIQUE (usr, role, filename, offset)
+);
+CREATE INDEX IF NOT EXISTS locations_usr ON locations (usr);
+CREATE INDEX IF NOT EXISTS locations_filename ON locations (filename);
+'''
+
+def declaration_kind(declaration):
+    """Obtain the kind name stored for a declaration."""
+    return type(declaration).__name__.lower()
+
+class SymbolIndex(DefinitionObserver):
+    """Index of symbols keyed by USR, stored in SQLite.
+
+    The index is a definition observer. Register it with a parser and every
+    definition the parser produces is added. Definitions of the same symbol
+    seen in multiple translation units, such as classes in a shared header,
+    are merged by USR. Distinct definition locations are all recorded.
+
+    Fields whose type refers to a declared type are recorded as references
+    to that type.
+
+    Files indexed again, such as after they changed, replace what was
+    recorded for them before: the first time a file is seen by an index,
+    its locations are removed, along with symbols no longer defined
+    anywhere. Call refresh() to have files replaced again, such as before
+    analyzing changed files with the same index.
+
+    Additions are written in a transaction which is committed by commit() or
+    close(). The index can be used as a context manager, which closes it.
+    """
+
+    def __init__(self, path=None):
+        """Open an index.
+
+        path -- Filename of the SQLite database. It is created if it doesn't
+          exist. None keeps the index in memory.
+        """
+        self.path = path
+        self._db = sqlite3.connect(path or ':memory:')
+        self._db.executescript(SCHEMA)
+        # Files whose previous rows were removed since the last refresh().
+        self._refreshed = set()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Commit pending additions and close the database."""
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    def commit(self):
+        """Write pending additions to the database."""
+        self._db.commit()
+
+    def flush(self):
+        self.commit()
+
+    def process_definition(self, d):
+        self.add(d)
+
+    def end_file(self, filename):
+        # A file whose definitions were all removed still needs its old
+        # rows removed.
+        self._remove(filename)
+
+    def refresh(self):
+        """Have files indexed from now on replace their rows again."""
+        self._refreshed = set()
+
+    def _remove(self, filename):
+        """Remove the rows of a file once per refresh()."""
+        if filename in self._refreshed:
+            return
+
+        self._refreshed.add(filename)
+
+        usrs = [row[0] for row in self._db.execute('SELECT DISTINCT usr FROM '
+                "locations WHERE filename = ? AND role = 'definition'",
+                (filename,))]
+        self._db.execute('DELETE FROM locations WHERE filename = ?',
+                (filename,))
+        self._db.executemany('DELETE FROM symbols WHERE usr = ? AND NOT '
+                'EXISTS (SELECT 1 FROM locations WHERE usr = symbols.usr '
+                "AND role = 'definition')", [(usr,) for usr in usrs])
+
+    def add(self, declaration, parent_usr=None):
+        """Add a declaration and its members to the index."""
+        symbols = []
+        locations = []
+        self._collect(declaration, parent_usr, symbols, locations)
+
+        for filename in set(l[2] for l in locations):
+            self._remove(filename)
+
+        # A symbol seen again may have changed, such as its type.
+        self._db.executemany('INSERT INTO symbols VALUES '
+                '(?, ?, ?, ?, ?, ?, ?) ON CONFLICT (usr) DO UPDATE SET '
+                'name = excluded.name, spelling = excluded.spelling, '
+                'kind = excluded.kind, parent_usr = excluded.parent_usr, '
+                'type = excluded.type, type_usr = excluded.type_usr',
+                symbols)
+        self._db.executemany('INSERT OR IGNORE INTO locations VALUES '
+                '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', locations)
+
+    def _collect(self, declaration, parent_usr, symbols, locations):
+        usr = declaration.usr
+        # Anonymous entities have no USR to link them by.
+        if not usr:
+            return
+
+        type_name = getattr(declaration, 'type', None)
+        type_usr = getattr(declaration, 'type_usr', None)
+
+        symbols.append((usr, declaration.name, declaration.spelling,
+            declaration_kind(declaration), parent_usr, type_name, type_usr))
+
+        filename, line, column, offset = declaration.start_location
+        filename = getattr(filename, 'name', filename)
+        end = declaration.end_location
+
+        locations.append((usr, 'definition', filename, line, column, offset,
+            end[1], end[2], end[3], None))
+
+        if type_usr:
+            locations.append((type_usr, 'reference', filename, line, column,
+                offset, end[1], end[2], end[3], usr))
+
+        for child in declaration.children():
+            self._collect(child, usr, symbols, locations)
+
+    def _symbols(self, where, params):
+        cursor = self._db.execute('SELECT usr, name, spelling, kind, '
+                'parent_usr, type, type_usr FROM symbols %s ORDER BY usr' %
+                where, params)
+
+        return [Symbol(*row) for row in cursor]
+
+    def _locations(self, usr, role):
+        cursor = self._db.execute('SELECT * FROM locations WHERE usr = ? AND '
+                'role = ? ORDER BY filename, offset', (usr, role))
+
+        return [Location(*row) for row in cursor]
+
+    def symbol(self, usr):
+        """Obtain the Symbol with a USR, or None."""
+        symbols = self._symbols('WHERE usr = ?', (usr,))
+
+        return symbols[0] if symbols else None
+
+    def find(self, name=None, kind=None, filename=None, parent_usr=None):
+        """Find symbols matching all given criteria.
+
+        name -- Display name of symbols.
+        kind -- Kind of declaration, such as 'class' or 'field'.
+        filename -- File symbols are defined in.
+        parent_usr -- USR of the enclosing symbol.
+
+        Returns a list of Symbol ordered by USR.
+        """
+        clauses = []
+        params = []
+        for column, value in (('name', name), ('kind', kind),
+                ('parent_usr', parent_usr)):
+            if value is not None:
+                clauses.append('%s = ?' % column)
+                params.append(value)
+
+        if filename is not None:
+            clauses.append('usr IN (SELECT usr FROM locations WHERE '
+                    "filename = ? AND role = 'definition')")
+            params.append(filename)
+
+        where = ''
+        if clauses:
+            where = 'WHERE ' + ' AND '.join(clauses)
+
+        return self._symbols(where, params)
+
+    def definitions(self, usr):
+        """Obtain the Locations a symbol is defined at."""
+        return self._locations(usr, 'definition')
+
+    def references(self, usr):
+        """Obtain the Locations a symbol is referenced at."""
+        return self._locations(usr, 'reference')
+
+    def members(self, usr):
+        """Obtain the Symbols enclosed by a symbol, such as class fields."""
+        return self.find(parent_usr=usr)
+
+    def classes_with_field(self, name):
+        """Obtain the class, struct and union Symbols having a field with a
+        name."""
+        return self._symbols("WHERE kind IN ('class', 'struct', 'union') AND "
+                "usr IN (SELECT parent_usr FROM symbols WHERE kind = 'field' "
+                "AND name = ?)", (name,))
+
+    def files(self):
+        """Obtain the sorted list of files symbols are defined in."""
+        cursor = self._db.execute('SELECT DISTINCT filename FROM locations '
+                'ORDER BY filename')
+
+        return [row[0] for row in cursor]
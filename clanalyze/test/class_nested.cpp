@@ -0,0 +1,9 @@
+namespace ns {
+class Outer {
+    int a;
+    class Inner {
+        int b;
+    };
+    int c;
+};
+}
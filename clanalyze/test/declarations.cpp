@@ -0,0 +1,22 @@
+struct Point {
+  int x;
+  int y;
+};
+
+enum Color { Red, Green = 5, Blue };
+
+typedef Point *PointPtr;
+
+int area(int width, int height);
+
+class Shape {
+public:
+  Shape();
+  virtual ~Shape();
+  virtual int sides() const;
+  static Shape *create(Color color);
+
+  Point origin;
+};
+
+int Shape::sides() const { return 0; }
@@ -0,0 +1,20 @@
+extern "C" {
+struct S {
+  int a;
+};
+
+union U {
+  int i;
+  float f;
+};
+
+int f(int x);
+}
+
+template <typename T>
+class Box {
+  T value;
+  T get() const;
+};
+
+int g();
@@ -0,0 +1,98 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.aio import AsyncParser
+from clanalyze.observer.base import CursorObserver, DefinitionObserver
+import asyncio
+import os.path
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+class AsyncRecordDefinitionObserver(DefinitionObserver):
+    def __init__(self):
+        self.classes = []
+
+    async def process_class_definition(self, c):
+        await asyncio.sleep(0)
+        self.classes.append(c)
+
+class TestAsyncParser(unittest.TestCase):
+    def setUp(self):
+        self.parser = AsyncParser(max_concurrency=2)
+        self.observer = AsyncRecordDefinitionObserver()
+        self.parser.add_observer(self.observer)
+
+    def tearDown(self):
+        self.parser.close()
+
+    def test_parse(self):
+        result = asyncio.run(self.parser.parse(
+            filename=os.path.join(here, 'class_nested.cpp')))
+
+        self.assertEqual(['Inner', 'Outer'], [c.name for c in result])
+        self.assertEqual(['Inner', 'Outer'],
+                [c.name for c in self.observer.classes])
+
+    def test_concurrent(self):
+        async def run():
+            return await asyncio.gather(*[
+                self.parser.parse(content='class C%d { int x; };' % i)
+                for i in range(5)])
+
+        results = asyncio.run(run())
+        self.assertEqual(['C%d' % i for i in range(5)],
+                [r[0].name for r in results])
+        self.assertEqual(5, len(self.observer.classes))
+
+    def test_multiple_loops(self):
+        parser = AsyncParser(max_concurrency=1)
+
+        async def run():
+            return await asyncio.gather(*[
+                parser.parse(content='class C%d { };' % i) for i in range(3)])
+
+        try:
+            # The semaphore of the first loop can't be used by the second.
+            for i in range(2):
+                results = asyncio.run(run())
+                self.assertEqual(['C0', 'C1', 'C2'],
+                        [r[0].name for r in results])
+        finally:
+            parser.close()
+
+    def test_stop_early(self):
+        async def run():
+            names = []
+            async for c in self.parser.iter_definitions(
+                    content='class A { }; class B { };'):
+                names.append(c.name)
+                break
+
+            return names
+
+        self.assertEqual(['A'], asyncio.run(run()))
+
+    def test_timeout(self):
+        async def run():
+            await self.parser.parse(content='class A { };', timeout=0)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            asyncio.run(run())
+
+    def test_processes(self):
+        parser = AsyncParser(max_concurrency=2, use_processes=True)
+        parser.add_observer(self.observer)
+        try:
+            result = asyncio.run(parser.parse(
+                filename=os.path.join(here, 'class_empty.cpp')))
+        finally:
+            parser.close()
+
+        self.assertEqual(['Foo'], [c.name for c in result])
+        self.assertEqual(['Foo'], [c.name for c in self.observer.classes])
+
+    def test_reject_cursor_observer(self):
+        with self.assertRaises(Exception):
+            self.parser.add_observer(CursorObserver())
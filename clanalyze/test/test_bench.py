@@ -0,0 +1,74 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.bench import corpus, runner
+import copy
+import os.path
+import shutil
+import tempfile
+import unittest
+
+class TestBench(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def read_tree(self, directory):
+        files = {}
+        for root, dirs, names in os.walk(directory):
+            for name in names:
+                path = os.path.join(root, name)
+                with open(path, 'rb') as fh:
+                    files[os.path.relpath(path, directory)] = fh.read()
+
+        return files
+
+    def test_reproducible(self):
+        spec = corpus.CorpusSpec(files=2, classes=3, headers=4,
+                header_fanout=2, seed=5)
+
+        a = os.path.join(self.root, 'a')
+        b = os.path.join(self.root, 'b')
+        corpus.generate(a, spec)
+        corpus.generate(b, spec)
+
+        # The database embeds absolute paths.
+        a_files = self.read_tree(a)
+        b_files = self.read_tree(b)
+        del a_files['compile_commands.json']
+        del b_files['compile_commands.json']
+
+        self.assertEqual(a_files, b_files)
+        self.assertEqual(6, len(a_files))
+
+    def test_run_compare(self):
+        spec = corpus.CorpusSpec(files=2, classes=3, fields=2,
+                namespace_depth=2, headers=2, header_classes=2,
+                header_fanout=1)
+        paths = corpus.generate(self.root, spec)
+
+        result = runner.run(paths, corpus.clang_args(self.root), repeat=1,
+                spec=spec)
+
+        self.assertEqual(2, result['files'])
+        # Classes in included headers are expanded too.
+        self.assertEqual(10, result['stats']['declarations'])
+        self.assertTrue(result['tokens_per_sec'] > 0)
+        self.assertTrue(result['cursors_per_sec'] > 0)
+        self.assertIn('walk', result['phases'])
+
+        self.assertEqual([], runner.compare(result, result))
+
+        slower = copy.deepcopy(result)
+        slower['files_per_sec'] = result['files_per_sec'] / 2
+        slower['phases']['walk'] = result['phases']['walk'] * 2
+        regressed = [r[0] for r in runner.compare(slower, result)]
+        self.assertEqual(['files_per_sec', 'phases.walk'], regressed)
+
+        other = copy.deepcopy(result)
+        other['corpus']['seed'] = 1
+        with self.assertRaises(Exception):
+            runner.compare(other, result)
@@ -0,0 +1,110 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.cache import DeclarationCache
+from clanalyze.observer.base import DefinitionObserver
+from clanalyze.parser import Parser
+import os.path
+import shutil
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+class RecordDefinitionObserver(DefinitionObserver):
+    def __init__(self):
+        self.classes = []
+
+    def process_class_definition(self, c):
+        self.classes.append(c)
+
+class TestDeclarationCache(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_replay(self):
+        filename = os.path.join(here, 'class_empty.cpp')
+        cache = DeclarationCache(self.path)
+
+        for i in range(2):
+            parser = Parser(cache=cache)
+            observer = RecordDefinitionObserver()
+            parser.add_observer(observer)
+            parser.parse(filename=filename)
+
+            self.assertEqual(1, len(observer.classes))
+            self.assertEqual('Foo', observer.classes[0].name)
+
+        stats = cache.stats()
+        self.assertEqual(1, stats['hits'])
+        self.assertEqual(1, stats['misses'])
+        self.assertEqual(1, stats['stores'])
+        self.assertEqual(1, stats['entries'])
+
+    def test_eviction(self):
+        cache = DeclarationCache(self.path, max_size=1)
+        cache.put(cache.key('a.c', b'a', []), [])
+        cache.put(cache.key('b.c', b'b', []), [])
+
+        stats = cache.stats()
+        self.assertEqual(0, stats['entries'])
+        self.assertEqual(2, stats['evictions'])
+
+    def test_replace(self):
+        cache = DeclarationCache(self.path, max_size=1 << 20)
+        cache.stats()
+
+        key = cache.key('a.c', b'a', [])
+        cache.put(key, [])
+        cache.put(key, [])
+
+        # Replacing an entry doesn't count its size twice.
+        size = cache._size
+        self.assertEqual(cache.stats()['size'], size)
+
+    def test_header_changed(self):
+        root = os.path.join(self.path, 'src')
+        os.mkdir(root)
+        header = os.path.join(root, 'shared.h')
+
+        sources = []
+        for name in ('a', 'b'):
+            sources.append(os.path.join(root, '%s.cpp' % name))
+            with open(sources[-1], 'w') as fh:
+                fh.write('#include "shared.h"\n')
+
+        cache = DeclarationCache(os.path.join(self.path, 'cache'))
+
+        def parse(workers):
+            parser = Parser(cache=cache)
+            observer = RecordDefinitionObserver()
+            parser.add_observer(observer)
+
+            if workers:
+                parser.parse_many([(s, ['-x', 'c++']) for s in sources],
+                        workers=workers)
+            else:
+                for source in sources:
+                    parser.parse(filename=source, clang_args=['-x', 'c++'])
+
+            return [c.name for c in observer.classes]
+
+        for workers in (None, 2):
+            with open(header, 'w') as fh:
+                fh.write('class Old { };\n')
+
+            self.assertEqual(['Old', 'Old'], parse(workers))
+            self.assertEqual(['Old', 'Old'], parse(workers))
+
+            with open(header, 'w') as fh:
+                fh.write('class Newer { };\n')
+
+            self.assertEqual(['Newer', 'Newer'], parse(workers))
+
+        stats = cache.stats()
+        self.assertEqual(4, stats['hits'])
+        self.assertEqual(8, stats['misses'])
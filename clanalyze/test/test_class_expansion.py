@@ -4,8 +4,14 @@
 
 from clanalyze.observer.base import DefinitionObserver
 from clanalyze.parser import Parser
+import io
+import os.path
+import shutil
+import tempfile
 import unittest
 
+here = os.path.dirname(os.path.abspath(__file__))
+
 class RecordDefinitionObserver(DefinitionObserver):
     def __init__(self):
         self.class_count = 0
@@ -21,7 +27,60 @@ class TestSimpleClassExpansion(unittest.TestCase):
         self.parser.add_observer(self.definition_observer)
 
     def test_notify_definition_fired(self):
-        # TODO proper path
-        self.parser.parse(filename='clanalyze/test/class_empty.cpp')
+        self.parser.parse(filename=os.path.join(here, 'class_empty.cpp'))
 
         self.assertEqual(1, self.definition_observer.class_count)
+
+    def test_parse_content(self):
+        self.parser.parse(content='class Foo { };\nclass Bar { };\n')
+        self.parser.parse(content=b'class Baz { };')
+
+        self.assertEqual(3, self.definition_observer.class_count)
+
+    def test_parse_fh(self):
+        self.parser.parse(fh=io.StringIO(u'class Foo { };'))
+
+        self.assertEqual(1, self.definition_observer.class_count)
+
+class TestTranslationUnitCache(unittest.TestCase):
+    def test_reparse(self):
+        parser = Parser(tu_cache_size=1)
+        observer = RecordDefinitionObserver()
+        parser.add_observer(observer)
+
+        parser.parse(filename='clanalyze/test/class_empty.cpp')
+        tu = list(parser._tu_cache.values())[0]
+
+        parser.parse(filename='clanalyze/test/class_empty.cpp')
+        self.assertEqual(1, len(parser._tu_cache))
+        self.assertTrue(tu is list(parser._tu_cache.values())[0])
+        self.assertEqual(2, observer.class_count)
+
+    def test_failed_reparse(self):
+        root = tempfile.mkdtemp()
+        try:
+            source = os.path.join(root, 'main.cpp')
+            with open(source, 'w') as fh:
+                fh.write('class Main { };\n')
+
+            parser = Parser(tu_cache_size=1)
+            observer = RecordDefinitionObserver()
+            parser.add_observer(observer)
+            parser.parse(filename=source)
+
+            # libclang fails to reparse a file it can't read. The translation
+            # unit is dropped and the file parsed from scratch, which fails
+            # as well.
+            os.remove(source)
+            os.mkdir(source)
+            self.assertRaises(Exception, parser.parse, filename=source)
+            self.assertEqual(0, len(parser._tu_cache))
+
+            os.rmdir(source)
+            with open(source, 'w') as fh:
+                fh.write('class Main { };\n')
+
+            parser.parse(filename=source)
+            self.assertEqual(2, observer.class_count)
+        finally:
+            shutil.rmtree(root)
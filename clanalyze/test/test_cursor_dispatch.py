@@ -0,0 +1,128 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.observer.base import CursorObserver, DefinitionObserver
+from clanalyze.parser import Parser
+from clanalyze import wrapper
+import clang.cindex
+import gc
+import os.path
+import unittest
+import weakref
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+class RecordDefinitionObserver(DefinitionObserver):
+    def __init__(self):
+        self.classes = []
+
+    def process_class_definition(self, c):
+        self.classes.append(c)
+
+class RecordCursorObserver(CursorObserver):
+    def __init__(self):
+        self.kinds = []
+
+    def process_cursor(self, cursor):
+        self.kinds.append(cursor.kind)
+
+class TestCursorDispatch(unittest.TestCase):
+    def setUp(self):
+        self.parser = Parser()
+        self.definition_observer = RecordDefinitionObserver()
+        self.cursor_observer = RecordCursorObserver()
+
+        self.parser.add_observer(self.definition_observer)
+        self.parser.add_observer(self.cursor_observer)
+
+        self.parser.parse(filename=os.path.join(here, 'class_nested.cpp'))
+
+    def test_nested_classes(self):
+        classes = self.definition_observer.classes
+        self.assertEqual(['Inner', 'Outer'], [c.name for c in classes])
+        self.assertEqual(['b'], list(classes[0].fields.keys()))
+        self.assertEqual(['a', 'c'], list(classes[1].fields.keys()))
+
+    def test_subtrees_not_shared(self):
+        # Class members are visited for the built-in class expander but must
+        # not be sent to observers that didn't ask for them.
+        CursorKind = clang.cindex.CursorKind
+        self.assertEqual([CursorKind.TRANSLATION_UNIT, CursorKind.NAMESPACE,
+            CursorKind.CLASS_DECL], self.cursor_observer.kinds)
+
+class TestCursorWrappers(unittest.TestCase):
+    def test_memoized(self):
+        wrapper.reset_cache_stats()
+        wrapper.enable_cache_stats()
+        try:
+            parser = Parser()
+            parser.parse(filename=os.path.join(here, 'class_nested.cpp'))
+        finally:
+            wrapper.enable_cache_stats(False)
+
+        stats = wrapper.cache_stats()
+        self.assertTrue(stats['misses'] > 0)
+        self.assertTrue(stats['hits'] > 0)
+
+    def test_shared(self):
+        index = clang.cindex.Index.create()
+        tu = index.parse('INPUT.C', unsaved_files=[('INPUT.C',
+            'class Foo { int a; };')])
+        parser = Parser()
+
+        cursor = parser.wrap_cursor(tu.cursor, tu)
+        children = [c for c, level in parser.emit_child_cursors(cursor)]
+        again = [c for c, level in parser.emit_child_cursors(cursor)]
+
+        self.assertEqual(2, len(children))
+        self.assertTrue(children[0] is again[0])
+        self.assertTrue(children[1] is again[1])
+        self.assertTrue(children[1].tu is tu)
+
+class MacroObserver(CursorObserver):
+    PROCESS_KINDS = [clang.cindex.CursorKind.MACRO_DEFINITION]
+    NEEDS_FUNCTION_BODIES = False
+
+    def process_cursor(self, cursor):
+        pass
+
+class TestParseOptions(unittest.TestCase):
+    def test_defaults(self):
+        TranslationUnit = clang.cindex.TranslationUnit
+        parser = Parser()
+        parser.add_observer(RecordDefinitionObserver())
+
+        self.assertEqual(TranslationUnit.PARSE_SKIP_FUNCTION_BODIES,
+                parser.parse_options())
+
+        parser.add_observer(MacroObserver())
+        self.assertEqual(TranslationUnit.PARSE_SKIP_FUNCTION_BODIES |
+                TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD,
+                parser.parse_options())
+
+        parser.add_observer(RecordCursorObserver())
+        self.assertEqual(TranslationUnit.PARSE_DETAILED_PROCESSING_RECORD,
+                parser.parse_options())
+
+    def test_explicit(self):
+        parser = Parser(parse_options=0)
+        parser.add_observer(RecordDefinitionObserver())
+
+        self.assertEqual(0, parser.parse_options())
+
+    def test_released(self):
+        # Wrappers no longer in use don't keep their translation unit alive.
+        index = clang.cindex.Index.create()
+        tu = index.parse('INPUT.C', unsaved_files=[('INPUT.C',
+            'class Foo { int a; };')])
+        parser = Parser()
+
+        cursor = parser.wrap_cursor(tu.cursor, tu)
+        list(parser.emit_child_cursors(cursor))
+
+        ref = weakref.ref(tu)
+        del tu, cursor
+        gc.collect()
+
+        self.assertIsNone(ref())
@@ -0,0 +1,161 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.declaration import (Class, Enum, Function, Struct, Typedef,
+    Union, from_dict)
+from clanalyze.observer.base import DefinitionObserver
+from clanalyze.parser import Parser
+from clanalyze.store import DeclarationStore, MethodView
+import os.path
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+class RecordDefinitionObserver(DefinitionObserver):
+    def __init__(self):
+        self.events = []
+
+    def process_class_definition(self, c):
+        self.events.append(('class', c))
+
+    def process_struct_definition(self, s):
+        self.events.append(('struct', s))
+
+    def process_union_definition(self, u):
+        self.events.append(('union', u))
+
+    def process_function_declaration(self, f):
+        self.events.append(('function', f))
+
+    def process_enum_definition(self, e):
+        self.events.append(('enum', e))
+
+    def process_typedef_definition(self, t):
+        self.events.append(('typedef', t))
+
+class TestDeclarationExpansion(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(here, 'declarations.cpp')
+        self.observer = RecordDefinitionObserver()
+        self.store = DeclarationStore()
+
+        parser = Parser()
+        parser.add_observer(self.observer)
+        parser.add_observer(self.store)
+        parser.parse(filename=self.path)
+
+        self.events = dict((d.spelling, (m, d)) for m, d in
+                self.observer.events)
+
+    def test_kinds(self):
+        # Out of line method definitions aren't reported again.
+        self.assertEqual([('struct', 'Point'), ('enum', 'Color'),
+            ('typedef', 'PointPtr'), ('function', 'area'), ('class', 'Shape')],
+            [(m, d.spelling) for m, d in self.observer.events])
+
+        for name, cls in (('Point', Struct), ('Color', Enum),
+                ('PointPtr', Typedef), ('area', Function), ('Shape', Class)):
+            self.assertIs(cls, type(self.events[name][1]))
+
+    def test_members(self):
+        point = self.events['Point'][1]
+        self.assertEqual(['x', 'y'], list(point.fields))
+
+        color = self.events['Color'][1]
+        self.assertEqual('unsigned int', color.type)
+        self.assertEqual([('Red', 0), ('Green', 5), ('Blue', 6)],
+                [(c.name, c.value) for c in color.constants.values()])
+
+        typedef = self.events['PointPtr'][1]
+        self.assertEqual('Point *', typedef.type)
+        self.assertEqual(point.usr, typedef.type_usr)
+
+        area = self.events['area'][1]
+        self.assertEqual('int', area.result_type)
+        self.assertEqual([('width', 'int'), ('height', 'int')],
+                area.arguments)
+
+        shape = self.events['Shape'][1]
+        self.assertEqual(['origin'], list(shape.fields))
+        self.assertEqual(['Shape', '~Shape', 'sides', 'create'],
+                [m.spelling for m in shape.methods])
+
+        sides = shape.methods[2]
+        self.assertTrue(sides.is_virtual)
+        self.assertTrue(sides.is_const)
+        self.assertFalse(sides.is_static)
+        self.assertTrue(shape.methods[3].is_static)
+        self.assertEqual([('color', 'Color')], shape.methods[3].arguments)
+
+    def test_roundtrip(self):
+        for method, d in self.observer.events:
+            copy = from_dict(d.to_dict())
+            self.assertEqual(d.to_dict(), copy.to_dict())
+
+    def test_store(self):
+        store = self.store
+        self.assertEqual(15, len(store))
+
+        views = dict((v.spelling, v) for v in store
+                if v.parent is None)
+        self.assertEqual(['x', 'y'], list(views['Point'].fields))
+        self.assertEqual(6, views['Color'].constants['Blue'].value)
+        self.assertEqual('int', views['area'].result_type)
+        self.assertEqual('Point *', views['PointPtr'].type)
+
+        shape = views['Shape']
+        self.assertEqual(['origin'], list(shape.fields))
+        methods = shape.methods
+        self.assertEqual(4, len(methods))
+        self.assertIsInstance(methods[2], MethodView)
+        self.assertTrue(methods[2].is_const)
+        self.assertTrue(methods[3].is_static)
+        self.assertFalse(methods[3].is_virtual)
+
+    def test_failed_parse(self):
+        # An observer failing mid-walk must not leave state behind for the
+        # next translation unit.
+        class FailingObserver(DefinitionObserver):
+            def process_definition(self, d):
+                if d.spelling == 'x':
+                    raise Exception('failure')
+
+            def process_struct_definition(self, s):
+                raise Exception('failure')
+
+        parser = Parser()
+        observer = RecordDefinitionObserver()
+        parser.add_observer(observer)
+        failing = FailingObserver()
+        parser.add_observer(failing)
+
+        self.assertRaises(Exception, parser.parse,
+                content='struct A { struct B { int x; }; };')
+
+        parser.remove_observer(failing)
+        observer.events = []
+        parser.parse(content='int h(); class C {};')
+
+        self.assertEqual([('function', 'h'), ('class', 'C')],
+                [(m, d.spelling) for m, d in observer.events])
+
+class TestScopes(unittest.TestCase):
+    def test_linkage_and_templates(self):
+        observer = RecordDefinitionObserver()
+        parser = Parser()
+        parser.add_observer(observer)
+        parser.parse(filename=os.path.join(here, 'declarations_linkage.cpp'))
+
+        self.assertEqual([('struct', 'S'), ('union', 'U'),
+            ('function', 'f(int)'), ('class', 'Box<T>'), ('function', 'g()')],
+            [(m, d.name) for m, d in observer.events])
+
+        events = dict((d.spelling, d) for m, d in observer.events)
+        self.assertIs(Union, type(events['U']))
+        self.assertEqual(['i', 'f'], list(events['U'].fields))
+
+        box = events['Box']
+        self.assertIs(Class, type(box))
+        self.assertEqual(['value'], list(box.fields))
+        self.assertEqual(['get'], [m.spelling for m in box.methods])
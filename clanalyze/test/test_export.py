@@ -0,0 +1,91 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.declaration import Class
+from clanalyze.export import BinaryExporter, ExportFile
+from clanalyze.parser import Parser
+from clanalyze.store import ClassView, DeclarationStore, FieldView
+import os.path
+import shutil
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+ATTRIBUTES = ('kind', 'name', 'spelling', 'usr', 'start_location',
+        'end_location')
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'export.bin')
+
+        self.store = DeclarationStore()
+        parser = Parser()
+        parser.add_observer(self.store)
+
+        with BinaryExporter(self.path) as exporter:
+            parser.add_observer(exporter)
+            parser.parse(filename=os.path.join(here, 'class_nested.cpp'))
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_roundtrip(self):
+        with ExportFile(self.path) as f:
+            self.assertEqual(len(self.store), len(f))
+
+            for expected, actual in zip(self.store, f):
+                for name in ATTRIBUTES:
+                    self.assertEqual(getattr(expected, name),
+                            getattr(actual, name))
+
+            outer = f[-3]
+            self.assertIsInstance(outer, ClassView)
+            self.assertEqual('Outer', outer.name)
+            self.assertEqual(['a', 'c'], list(outer.fields))
+
+            field = outer.fields['c']
+            self.assertIsInstance(field, FieldView)
+            self.assertEqual(self.store[4].type, field.type)
+            self.assertEqual(outer, field.parent)
+
+            self.assertEqual(['Inner', 'Outer'], [c.name for c in
+                f.classes()])
+            self.assertEqual(list(self.store.indices(Class, True)),
+                    list(f.indices(Class, True)))
+            self.assertEqual(list(self.store.kinds),
+                    list(f.iter_column('kinds')))
+            self.assertRaises(IndexError, f.__getitem__, len(f))
+
+    def test_incomplete(self):
+        path = os.path.join(self.root, 'other.bin')
+
+        exporter = BinaryExporter(path)
+        parser = Parser()
+        parser.add_observer(exporter)
+        parser.parse(filename=os.path.join(here, 'class_nested.cpp'))
+        self.assertEqual(5, exporter.count)
+        self.assertFalse(os.path.exists(path))
+
+        exporter.discard()
+        self.assertEqual(['export.bin'], os.listdir(self.root))
+
+        with open(path, 'wb') as fh:
+            fh.write(b'\0' * 128)
+
+        self.assertRaises(Exception, ExportFile, path)
+
+    def test_enum_values(self):
+        path = os.path.join(self.root, 'enum.bin')
+
+        with BinaryExporter(path) as exporter:
+            parser = Parser()
+            parser.add_observer(exporter)
+            parser.parse(content='enum E : unsigned long long { '
+                    'Big = 0xFFFFFFFFFFFFFFFFull, Small = 1 };\n')
+
+        with ExportFile(path) as f:
+            self.assertEqual([2 ** 64 - 1, 1],
+                    [c.value for c in f[0].constants.values()])
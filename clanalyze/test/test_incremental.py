@@ -0,0 +1,117 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.incremental import DependencyState, analyze, watch
+from clanalyze.observer.base import DefinitionObserver
+from clanalyze.parser import Parser
+from clanalyze.pch import PrecompiledHeaders
+import os.path
+import shutil
+import tempfile
+import unittest
+
+class RecordDefinitionObserver(DefinitionObserver):
+    def __init__(self):
+        self.classes = []
+
+    def process_class_definition(self, c):
+        self.classes.append(c.name)
+
+class TestIncremental(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.state_path = os.path.join(self.root, 'state.json')
+
+        self.write('shared.h', '#pragma once\nclass Shared { };\n')
+        self.write('other.h', '#pragma once\nclass Other { };\n')
+        self.jobs = [
+            (self.write('a.cpp', '#include "shared.h"\nclass A { };\n'),
+                ['-x', 'c++']),
+            (self.write('b.cpp', '#include "shared.h"\n'
+                '#include "other.h"\nclass B { };\n'), ['-x', 'c++']),
+        ]
+
+        self.parser = Parser()
+        self.observer = RecordDefinitionObserver()
+        self.parser.add_observer(self.observer)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name, content):
+        path = os.path.join(self.root, name)
+        with open(path, 'w') as fh:
+            fh.write(content)
+
+        return path
+
+    def analyzed(self, **kwargs):
+        state = DependencyState(self.state_path)
+        results = analyze(self.parser, self.jobs, state, workers=1, **kwargs)
+
+        return sorted(os.path.basename(r.filename) for r in results)
+
+    def test_incremental(self):
+        self.assertEqual(['a.cpp', 'b.cpp'], self.analyzed())
+        self.assertEqual([], self.analyzed())
+
+        self.write('other.h', '#pragma once\nclass Other { int x; };\n')
+        self.assertEqual(['b.cpp'], self.analyzed())
+        self.assertEqual([], self.analyzed())
+
+        self.write('shared.h', '#pragma once\nclass Shared2 { };\n')
+        self.assertEqual(['a.cpp', 'b.cpp'], self.analyzed())
+        self.assertIn('Shared2', self.observer.classes)
+
+        self.write('a.cpp', '#include "shared.h"\nclass A2 { };\n')
+        self.assertEqual(['a.cpp'], self.analyzed())
+
+        # Touching a file without changing it doesn't trigger analysis.
+        os.utime(os.path.join(self.root, 'other.h'), None)
+        self.assertEqual([], self.analyzed())
+
+    def test_changed_during_analysis(self):
+        class EditingObserver(DefinitionObserver):
+            def process_class_definition(observer, c):
+                if c.name == 'A':
+                    self.write('a.cpp', '#include "shared.h"\nclass A2 { };\n')
+
+        editing = EditingObserver()
+        self.parser.add_observer(editing)
+        self.assertEqual(['a.cpp', 'b.cpp'], self.analyzed())
+        self.parser.remove_observer(editing)
+
+        # The edit was made after a.cpp was checked, so it is analyzed again.
+        self.assertEqual(['a.cpp'], self.analyzed())
+        self.assertIn('A2', self.observer.classes)
+
+    def test_pch(self):
+        pch = PrecompiledHeaders(os.path.join(self.root, 'pch'))
+
+        self.assertEqual(['a.cpp', 'b.cpp'], self.analyzed(pch=pch))
+        self.assertEqual(1, pch.builds)
+        self.assertEqual([], self.analyzed(pch=pch))
+
+        # The header is only known to be included through the PCH.
+        self.write('shared.h', '#pragma once\nclass Shared2 { };\n')
+        self.assertEqual(['a.cpp', 'b.cpp'], self.analyzed(pch=pch))
+
+    def test_watch(self):
+        rounds = []
+
+        def stop():
+            if len(rounds) == 1:
+                self.write('other.h', '#pragma once\nclass Other2 { };\n')
+
+            rounds.append(None)
+            return len(rounds) > 3
+
+        batches = []
+        watch(self.parser, self.jobs, DependencyState(), interval=0,
+                callback=batches.append, stop=stop, workers=1)
+
+        self.assertEqual([['a.cpp', 'b.cpp'], ['b.cpp']],
+                [[os.path.basename(r.filename) for r in results]
+                    for results in batches])
+        self.assertIn('Other2', self.observer.classes)
@@ -0,0 +1,55 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.observer.base import DefinitionObserver
+from clanalyze.parser import Parser
+import clang.cindex
+import os.path
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+class RecordDefinitionObserver(DefinitionObserver):
+    def __init__(self):
+        self.classes = []
+
+    def process_class_definition(self, c):
+        self.classes.append(c)
+
+class TestIterDefinitions(unittest.TestCase):
+    def test_all(self):
+        parser = Parser()
+        names = [c.name for c in parser.iter_definitions(
+            filename=os.path.join(here, 'class_nested.cpp'))]
+
+        self.assertEqual(['Inner', 'Outer'], names)
+
+    def test_stop_early(self):
+        parser = Parser()
+        observer = RecordDefinitionObserver()
+        parser.add_observer(observer)
+
+        it = parser.iter_definitions(content='class A { }; class B { };')
+        self.assertEqual('A', next(it).name)
+        it.close()
+
+        self.assertEqual(['A'], [c.name for c in observer.classes])
+
+        # The parser is usable again once iteration stopped.
+        parser.parse(content='class C { };')
+        self.assertEqual(['A', 'C'], [c.name for c in observer.classes])
+
+class TestIterCursors(unittest.TestCase):
+    def test_kinds(self):
+        parser = Parser()
+
+        fields = [c.spelling for c in parser.iter_cursors(
+            filename=os.path.join(here, 'class_nested.cpp'),
+            kinds=[clang.cindex.CursorKind.FIELD_DECL])]
+        self.assertEqual(['a', 'b', 'c'], fields)
+
+        variables = [c.spelling for c in parser.iter_cursors(
+            content='void f() { int x = 1; }',
+            kinds=[clang.cindex.CursorKind.VAR_DECL])]
+        self.assertEqual(['x'], variables)
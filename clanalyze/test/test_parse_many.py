@@ -0,0 +1,109 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.observer.base import CursorObserver, DefinitionObserver
+from clanalyze.parser import Parser, ParseError
+import clang.cindex
+import os
+import os.path
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+class RecordDefinitionObserver(DefinitionObserver):
+    def __init__(self):
+        self.classes = []
+
+    def process_class_definition(self, c):
+        self.classes.append(c)
+
+class FlushDefinitionObserver(DefinitionObserver):
+    def __init__(self):
+        self.flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+
+class ProcessCursorObserver(CursorObserver):
+    """Records the ids of the processes translation units are walked in."""
+
+    PROCESS_KINDS = [clang.cindex.CursorKind.TRANSLATION_UNIT]
+
+    def __init__(self):
+        self.pids = []
+
+    def process_cursor(self, cursor):
+        self.pids.append(os.getpid())
+
+    def worker_result(self):
+        pids = self.pids
+        self.pids = []
+        return pids
+
+    def merge_worker_result(self, result):
+        self.pids.extend(result)
+
+class TestParseMany(unittest.TestCase):
+    def setUp(self):
+        self.parser = Parser()
+        self.definition_observer = RecordDefinitionObserver()
+
+        self.parser.add_observer(self.definition_observer)
+
+    def test_parallel(self):
+        paths = [os.path.join(here, 'class_empty.cpp')] * 3
+        results = self.parser.parse_many(paths, workers=2)
+
+        self.assertEqual([r.filename for r in results], paths)
+        self.assertTrue(all(r.ok for r in results))
+        self.assertEqual(3, len(self.definition_observer.classes))
+        self.assertEqual('Foo', self.definition_observer.classes[0].name)
+        self.assertEqual(paths[0],
+                self.definition_observer.classes[0].start_location[0])
+
+    def test_failure_isolated(self):
+        good = os.path.join(here, 'class_empty.cpp')
+        bad = os.path.join(here, 'does_not_exist.cpp')
+        results = self.parser.parse_many([bad, good], workers=2)
+
+        self.assertFalse(results[0].ok)
+        self.assertTrue(results[1].ok)
+        self.assertEqual(1, len(self.definition_observer.classes))
+
+    def test_fail_fast(self):
+        bad = os.path.join(here, 'does_not_exist.cpp')
+
+        with self.assertRaises(ParseError):
+            self.parser.parse_many([bad, bad], workers=2, fail_fast=True)
+
+    def test_memory_budget(self):
+        paths = [os.path.join(here, 'class_empty.cpp')] * 3
+        flush_observer = FlushDefinitionObserver()
+        self.parser.add_observer(flush_observer)
+
+        for workers in (1, 2):
+            results = self.parser.parse_many(paths, workers=workers,
+                    memory_budget=1)
+
+            self.assertTrue(all(r.ok for r in results))
+            self.assertTrue(all(r.max_rss > 0 for r in results))
+
+        self.assertEqual(6, len(self.definition_observer.classes))
+        self.assertIsInstance(
+                self.definition_observer.classes[0].start_location[0], str)
+
+        # The budget is exceeded after every file.
+        self.assertEqual(6, flush_observer.flushes)
+
+    def test_memory_budget_single_worker(self):
+        observer = ProcessCursorObserver()
+        self.parser.add_observer(observer)
+
+        paths = [os.path.join(here, 'class_empty.cpp')] * 2
+        self.parser.parse_many(paths, workers=1, memory_budget=2 ** 40)
+        self.parser.parse_many(paths[:1], memory_budget=2 ** 40)
+
+        # Every file is parsed in a new process.
+        self.assertEqual(3, len(set(observer.pids)))
+        self.assertNotIn(os.getpid(), observer.pids)
@@ -0,0 +1,96 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.observer.base import DefinitionObserver
+from clanalyze.parser import Parser
+from clanalyze.pch import PrecompiledHeaders, common_prefix, leading_includes
+import os.path
+import shutil
+import tempfile
+import unittest
+
+class RecordDefinitionObserver(DefinitionObserver):
+    def __init__(self):
+        self.classes = []
+
+    def process_class_definition(self, c):
+        self.classes.append(c.name)
+
+class TestPrecompiledHeaders(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.cache = os.path.join(self.root, 'pch')
+
+        self.write('base.h', '#pragma once\nclass Base { int x; };\n')
+        self.write('extra.h', '#pragma once\nclass Extra { };\n')
+
+        self.sources = [
+            self.write('a.cpp', '// A.\n#include "base.h"\n'
+                '#include "extra.h"\nclass A { Base b; };\n'),
+            self.write('b.cpp', '/* B.\n */\n#include "base.h"\n'
+                'class B { Base b; };\n'),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write(self, name, content):
+        path = os.path.join(self.root, name)
+        with open(path, 'w') as fh:
+            fh.write(content)
+
+        return path
+
+    def parse(self, pch=None):
+        parser = Parser()
+        observer = RecordDefinitionObserver()
+        parser.add_observer(observer)
+
+        results = parser.parse_many(self.sources, clang_args=['-x', 'c++'],
+                workers=1, pch=pch)
+        self.assertTrue(all(r.ok for r in results))
+
+        return observer.classes
+
+    def test_leading_includes(self):
+        base = '"%s"' % os.path.join(self.root, 'base.h')
+        extra = '"%s"' % os.path.join(self.root, 'extra.h')
+
+        includes = [leading_includes(p) for p in self.sources]
+        self.assertEqual([[base, extra], [base]], includes)
+        self.assertEqual([base], common_prefix(includes))
+
+    def test_build_and_reuse(self):
+        expected = self.parse()
+
+        pch = PrecompiledHeaders(self.cache)
+        self.assertEqual(expected, self.parse(pch))
+        self.assertEqual({'builds': 1, 'reuses': 0, 'failures': 0},
+                pch.stats())
+
+        pch = PrecompiledHeaders(self.cache)
+        jobs = pch.prepare([(p, ['-x', 'c++']) for p in self.sources],
+                Parser().parse_options())
+        self.assertEqual(1, pch.reuses)
+        self.assertIn('-include-pch', jobs[0][1])
+
+        # Changing a header included by the PCH invalidates it.
+        self.write('base.h', '#pragma once\nclass Base { int y; };\n')
+        self.assertEqual(expected, self.parse(pch))
+        self.assertEqual(1, pch.builds)
+
+    def test_prelude(self):
+        prelude = self.write('prelude.h', '#include "extra.h"\n')
+
+        pch = PrecompiledHeaders(self.cache, prelude=prelude)
+        classes = self.parse(pch)
+
+        self.assertEqual(['Extra', 'Base', 'A', 'Extra', 'Base', 'B'],
+                classes)
+
+    def test_min_files(self):
+        pch = PrecompiledHeaders(self.cache, min_files=3)
+        jobs = [(p, []) for p in self.sources]
+
+        self.assertEqual(jobs, pch.prepare(jobs))
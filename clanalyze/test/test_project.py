@@ -0,0 +1,89 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.cli import main
+from clanalyze.project import CompilationDatabase
+import contextlib
+import io
+import json
+import os.path
+import shutil
+import tempfile
+import unittest
+
+class TestCompilationDatabase(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def write_database(self, entries):
+        path = os.path.join(self.root, 'compile_commands.json')
+        with open(path, 'w') as fh:
+            json.dump(entries, fh)
+
+        return CompilationDatabase(self.root)
+
+    def test_normalize_args(self):
+        db = self.write_database([
+            {
+                'directory': self.root,
+                'command': 'c++ -Iinclude -DFOO=1 -c -o foo.o foo.cpp',
+                'file': 'foo.cpp',
+            },
+        ])
+
+        self.assertEqual(1, len(db.commands))
+        command = db.commands[0]
+        self.assertEqual(os.path.join(self.root, 'foo.cpp'), command.filename)
+        self.assertEqual(('-I' + os.path.join(self.root, 'include'),
+            '-DFOO=1'), command.args)
+
+    def test_dedupe(self):
+        entry = {
+            'directory': self.root,
+            'arguments': ['c++', '-DFOO', '-c', 'a.cpp'],
+            'file': 'a.cpp',
+        }
+        other = dict(entry, arguments=['c++', '-DFOO', '-c', 'b.cpp'],
+                file='b.cpp')
+        db = self.write_database([entry, entry, other])
+
+        self.assertEqual(2, len(db.commands))
+        self.assertTrue(db.commands[0].args is db.commands[1].args)
+
+    def test_select(self):
+        entries = []
+        for name, size in (('small.cpp', 1), ('big.cpp', 100),
+                ('third_party/x.cpp', 50)):
+            path = os.path.join(self.root, name)
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, 'w') as fh:
+                fh.write(' ' * size)
+
+            entries.append({'directory': self.root,
+                'arguments': ['cc', '-c', name], 'file': name})
+
+        db = self.write_database(entries)
+
+        names = [os.path.relpath(c.filename, self.root) for c in
+                db.select(exclude=['third_party/*'])]
+        self.assertEqual(['big.cpp', 'small.cpp'], names)
+
+        names = [os.path.relpath(c.filename, self.root) for c in
+                db.select(include=['*.cpp'], order='database')]
+        self.assertEqual(['small.cpp', 'big.cpp', 'third_party/x.cpp'], names)
+
+class TestCommandLine(unittest.TestCase):
+    def test_dependent_options(self):
+        for argv in (['--prelude', 'all.h'], ['--watch']):
+            stderr = io.StringIO()
+            with contextlib.redirect_stderr(stderr):
+                with self.assertRaises(SystemExit) as e:
+                    main(['analyze', '-p', 'missing'] + argv)
+
+            self.assertEqual(2, e.exception.code)
+            self.assertIn('requires', stderr.getvalue())
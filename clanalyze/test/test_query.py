@@ -0,0 +1,85 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.declaration import Class, Field
+from clanalyze.parser import Parser
+from clanalyze.query import DeclarationModel, IntervalIndex
+import os.path
+import random
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+class TestIntervalIndex(unittest.TestCase):
+    def test_overlapping(self):
+        rng = random.Random(0)
+        intervals = []
+        index = IntervalIndex()
+        for i in range(200):
+            start = rng.randint(0, 1000)
+            end = start + rng.randint(0, 50)
+            intervals.append((start, end))
+            index.add(start, end, i)
+
+        for start, end in ((0, 0), (10, 20), (500, 500), (990, 2000)):
+            expected = sorted(i for i, (s, e) in enumerate(intervals)
+                    if s <= end and e >= start)
+            self.assertEqual(expected, sorted(index.overlapping(start, end)))
+
+        self.assertEqual([], IntervalIndex().overlapping(0, 10))
+
+class TestDeclarationModel(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(here, 'class_nested.cpp')
+        self.model = DeclarationModel()
+
+        parser = Parser()
+        parser.add_observer(self.model)
+        parser.parse(filename=self.path)
+
+    def names(self, query):
+        return [d.name for d in query]
+
+    def test_indexes(self):
+        q = self.model.query()
+
+        self.assertEqual(5, q.count())
+        self.assertEqual(['Inner', 'Outer'], self.names(q.kind(Class)))
+        self.assertEqual(['b', 'a', 'c'], self.names(q.kind(Field)))
+        self.assertEqual(['Outer'], self.names(q.usr('c:@N@ns@S@Outer')))
+        self.assertEqual(5, q.in_file(self.path).count())
+        self.assertEqual(0, q.in_file('other.h').count())
+        self.assertEqual([self.path], self.model.files())
+
+    def test_composition(self):
+        q = self.model.query()
+
+        self.assertEqual(['Outer'], self.names(q.with_field('c')))
+        self.assertEqual(['Outer'], self.names(q.kind(Class).with_field('a')
+            .in_file(self.path)))
+        self.assertEqual(['a', 'c'], self.names(q.name_matches('^[ac]$')))
+        self.assertEqual(['Inner', 'Outer'], self.names(q.top_level()))
+        self.assertEqual(['c'], self.names(q.kind(Field)
+            .where(lambda d: d.start_location[1] > 5)))
+
+        outer = q.name('Outer').first()
+        self.assertEqual(['a', 'c'], self.names(q.children_of(outer)))
+        self.assertIs(outer, self.model.parent(q.name('c').first()))
+        self.assertIsNone(q.name('nothing').first())
+
+    def test_ranges(self):
+        q = self.model.query()
+
+        # Line 5 is within both classes.
+        self.assertEqual(['Inner', 'b', 'Outer'],
+                self.names(q.at(self.path, 5)))
+        self.assertEqual(['Outer', 'c'], self.names(q.overlapping(self.path,
+            7, 20)))
+
+        outer = q.name('Outer').first()
+        start, end = outer.start_location[3], outer.end_location[3]
+        self.assertEqual(['Outer'], self.names(q.kind(Class).overlapping(
+            self.path, start, start, lines=False)))
+        self.assertEqual(0, q.overlapping(self.path, end + 1, end + 10,
+            lines=False).count())
@@ -0,0 +1,140 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.observer.base import CursorObserver, DefinitionObserver
+from clanalyze.parser import Parser
+import clang.cindex
+import os.path
+import shutil
+import tempfile
+import unittest
+
+class RecordDefinitionObserver(DefinitionObserver):
+    def __init__(self):
+        self.classes = []
+
+    def process_class_definition(self, c):
+        self.classes.append(c.name)
+
+class AllOccurrencesObserver(RecordDefinitionObserver):
+    NEEDS_ALL_OCCURRENCES = True
+
+class SharedCursorCounter(CursorObserver):
+    PROCESS_KINDS = [clang.cindex.CursorKind.CLASS_DECL]
+
+    def __init__(self):
+        CursorObserver.__init__(self)
+        self.count = 0
+
+    def process_cursor(self, cursor):
+        if cursor.spelling == 'Shared':
+            self.count += 1
+
+    def worker_result(self):
+        count = self.count
+        self.count = 0
+
+        return count
+
+    def merge_worker_result(self, result):
+        self.count += result
+
+class TestSeenHeaders(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+        with open(os.path.join(self.root, 'shared.h'), 'w') as fh:
+            fh.write('namespace ns { class Shared { int x; }; }\n'
+                    'class Other { };\n')
+
+        self.sources = []
+        for name in ('a', 'b'):
+            path = os.path.join(self.root, '%s.cpp' % name)
+            with open(path, 'w') as fh:
+                fh.write('#include "shared.h"\nclass %s { };\n' %
+                        name.upper())
+
+            self.sources.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def parse(self, observer, **kwargs):
+        parser = Parser(**kwargs)
+        parser.add_observer(observer)
+
+        for path in self.sources:
+            parser.parse(filename=path, clang_args=['-x', 'c++'])
+
+        return parser
+
+    def test_default(self):
+        observer = RecordDefinitionObserver()
+        self.parse(observer)
+
+        self.assertEqual(['Shared', 'Other', 'A', 'Shared', 'Other', 'B'],
+                observer.classes)
+
+    def test_skip_seen_headers(self):
+        observer = RecordDefinitionObserver()
+        parser = self.parse(observer, skip_seen_headers=True)
+
+        self.assertEqual(['Shared', 'Other', 'A', 'B'], observer.classes)
+        self.assertIn(os.path.join(self.root, 'shared.h'),
+                parser.seen_headers)
+
+        parser.clear_seen_headers()
+        parser.parse(filename=self.sources[0], clang_args=['-x', 'c++'])
+        self.assertEqual(['Shared', 'Other', 'A', 'B', 'Shared', 'Other',
+            'A'], observer.classes)
+
+    def test_opt_out(self):
+        observer = AllOccurrencesObserver()
+        self.parse(observer, skip_seen_headers=True)
+
+        self.assertEqual(6, len(observer.classes))
+
+    def test_main_file_only(self):
+        observer = RecordDefinitionObserver()
+        self.parse(observer, main_file_only=True)
+
+        self.assertEqual(['A', 'B'], observer.classes)
+
+    def test_parallel(self):
+        # Sources alternate between headers, so workers would each see
+        # headers the other skipped.
+        for name in ('c', 'd'):
+            path = os.path.join(self.root, '%s.cpp' % name)
+            with open(path, 'w') as fh:
+                fh.write('#include "shared.h"\nclass %s { };\n' %
+                        name.upper())
+
+            self.sources.append(path)
+
+        jobs = [(path, ['-x', 'c++']) for path in self.sources]
+
+        observer = RecordDefinitionObserver()
+        parser = Parser(skip_seen_headers=True)
+        parser.add_observer(observer)
+        parser.parse_many(jobs, workers=2)
+
+        self.assertEqual(['Shared', 'Other', 'A', 'B', 'C', 'D'],
+                observer.classes)
+        self.assertIn(os.path.join(self.root, 'shared.h'),
+                parser.seen_headers)
+
+        observer = AllOccurrencesObserver()
+        parser = Parser(skip_seen_headers=True)
+        parser.add_observer(observer)
+        parser.parse_many(jobs, workers=2)
+
+        self.assertEqual(4, observer.classes.count('Shared'))
+
+        # Workers skip headers they parsed before themselves.
+        counter = SharedCursorCounter()
+        parser = Parser(skip_seen_headers=True)
+        parser.add_observer(counter)
+        parser.parse_many(jobs, workers=2)
+
+        self.assertLessEqual(counter.count, 2)
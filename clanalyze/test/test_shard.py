@@ -0,0 +1,132 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.bench import corpus
+from clanalyze.observer.base import DefinitionObserver
+from clanalyze.parser import Parser
+from clanalyze.project import CompilationDatabase
+from clanalyze.shard import ShardFile, merge, partition, run_shard
+import os.path
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# Runs the command line tool in a separate interpreter.
+CLI = 'import sys; from clanalyze.cli import main; sys.exit(main(sys.argv[1:]))'
+
+class RecordDefinitionObserver(DefinitionObserver):
+    def __init__(self):
+        self.classes = []
+
+    def process_class_definition(self, c):
+        self.classes.append((c.usr, c.name, list(c.fields)))
+
+class TestShard(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        corpus.generate(self.root, corpus.CorpusSpec(files=6, classes=3,
+            fields=2, headers=3, header_classes=2, header_fanout=2))
+
+        database = CompilationDatabase(self.root)
+        self.jobs = [(c.filename, c.args) for c in
+                database.select(order='database')]
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def expected(self):
+        """Definitions of a single analysis, deduplicated by USR."""
+        observer = RecordDefinitionObserver()
+        parser = Parser()
+        parser.add_observer(observer)
+        parser.parse_many(self.jobs, workers=1)
+
+        seen = set()
+        result = []
+        for c in observer.classes:
+            if c[0] not in seen:
+                seen.add(c[0])
+                result.append(c)
+
+        return result
+
+    def test_partition(self):
+        for strategy in ('hash', 'size'):
+            shards = partition(self.jobs, 3, strategy)
+            self.assertEqual(shards, partition(self.jobs, 3, strategy))
+            self.assertEqual(list(range(len(self.jobs))),
+                    sorted(sum(shards, [])))
+
+            for indices in shards:
+                self.assertEqual(sorted(indices), indices)
+
+        self.assertRaises(Exception, partition, self.jobs, 0)
+        self.assertRaises(Exception, partition, self.jobs, 2, 'bogus')
+
+    def test_merge(self):
+        paths = []
+        for i in range(3):
+            path = os.path.join(self.root, 'shard%d.jsonl' % i)
+            run_shard(Parser(), self.jobs, i, 3, path, strategy='size',
+                    workers=1)
+            paths.append(path)
+
+        merged = os.path.join(self.root, 'merged.jsonl')
+        observer = RecordDefinitionObserver()
+        summary = merge(reversed(paths), output=merged, observers=[observer])
+
+        expected = self.expected()
+        self.assertEqual(expected, observer.classes)
+        self.assertEqual(len(expected), summary['definitions'])
+        self.assertTrue(summary['duplicates'] > 0)
+        self.assertEqual([], summary['errors'])
+
+        # Merged results can be merged again.
+        observer = RecordDefinitionObserver()
+        merge([merged], observers=[observer])
+        self.assertEqual(expected, observer.classes)
+
+        self.assertRaises(Exception, merge, paths[1:])
+        self.assertRaises(Exception, merge, [paths[0], paths[0]])
+
+        observer = RecordDefinitionObserver()
+        merge(paths[1:], observers=[observer], partial=True)
+        self.assertTrue(len(observer.classes) < len(expected))
+
+        # Partial merges of disjoint shards can be merged with each other.
+        first = os.path.join(self.root, 'first.jsonl')
+        rest = os.path.join(self.root, 'rest.jsonl')
+        merge(paths[:1], output=first, partial=True)
+        merge(paths[1:], output=rest, partial=True)
+        f = ShardFile(rest)
+        self.assertEqual([1, 2], f.header['covered'])
+        f.close()
+
+        observer = RecordDefinitionObserver()
+        merge([rest, first], observers=[observer])
+        self.assertEqual(expected, observer.classes)
+
+        self.assertRaises(Exception, merge, [rest, paths[2]], partial=True)
+        self.assertRaises(Exception, merge, [rest])
+
+    def test_processes(self):
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.path.dirname(os.path.dirname(here))
+
+        paths = []
+        for i in range(2):
+            path = os.path.join(self.root, 'shard%d.jsonl' % i)
+            subprocess.check_call([sys.executable, '-c', CLI, 'shard', '-p',
+                self.root, '--shard', str(i), '--shards', '2', '-o', path,
+                '-j', '1'], env=env)
+            paths.append(path)
+
+        observer = RecordDefinitionObserver()
+        merge(paths, observers=[observer])
+
+        self.assertEqual(self.expected(), observer.classes)
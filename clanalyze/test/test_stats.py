@@ -0,0 +1,86 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.observer.base import DefinitionObserver, TokenObserver
+from clanalyze.parser import Parser
+from clanalyze.stats import ParseStats
+import json
+import os.path
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+class CountDefinitionObserver(DefinitionObserver):
+    def __init__(self):
+        self.count = 0
+
+    def process_class_definition(self, c):
+        self.count += 1
+
+class CountTokenObserver(TokenObserver):
+    def __init__(self):
+        self.count = 0
+
+    def process_tokens(self, batch):
+        self.count += len(batch)
+
+class TestParseStats(unittest.TestCase):
+    def test_counts(self):
+        stats = ParseStats()
+        parser = Parser(stats=stats)
+        parser.add_observer(CountDefinitionObserver())
+        tokens = CountTokenObserver()
+        parser.add_observer(tokens)
+
+        path = os.path.join(here, 'class_nested.cpp')
+        parser.parse(filename=path)
+        parser.parse(content='class A { int x; };')
+
+        self.assertEqual(2, stats.files)
+        self.assertEqual(os.path.getsize(path) + 19, stats.bytes)
+        self.assertEqual(3, stats.declarations)
+        self.assertEqual(tokens.count, stats.tokens)
+        self.assertTrue(stats.cursors > 0)
+
+        for phase in ('input', 'clang', 'walk', 'tokens'):
+            self.assertEqual(2, stats.phases[phase].count)
+
+        self.assertIn('DeclarationExpander', stats.observers)
+        self.assertEqual(3, stats.observers['CountDefinitionObserver'].count)
+        self.assertIn('CountTokenObserver', stats.observers)
+
+        d = json.loads(stats.to_json())
+        self.assertEqual(3, d['cursor_kinds']['CLASS_DECL']['count'])
+        self.assertEqual(4, d['cursor_kinds']['FIELD_DECL']['count'])
+
+    def test_merge(self):
+        a = ParseStats()
+        b = ParseStats()
+        Parser(stats=a).parse(content='class A { };')
+        Parser(stats=b).parse(content='class B { };')
+
+        a.merge(b)
+        self.assertEqual(2, a.files)
+        self.assertEqual(2, a.declarations)
+        self.assertEqual(2, a.phases['walk'].count)
+
+    def test_parse_many(self):
+        stats = ParseStats()
+        parser = Parser(stats=stats)
+        parser.add_observer(CountDefinitionObserver())
+
+        paths = [os.path.join(here, 'class_empty.cpp')] * 3
+        parser.parse_many(paths, workers=2)
+
+        self.assertEqual(3, stats.files)
+        self.assertEqual(3, stats.declarations)
+        self.assertEqual(3, stats.phases['clang'].count)
+
+    def test_hooks(self):
+        stats = ParseStats(profile=['walk'], trace_memory=True)
+        Parser(stats=stats).parse(content='class A { };')
+
+        self.assertIsNotNone(stats.profile_stats('walk'))
+        self.assertIsNone(stats.profile_stats('clang'))
+        self.assertIn('walk', stats.memory)
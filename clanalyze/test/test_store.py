@@ -0,0 +1,89 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.declaration import Class, Field
+from clanalyze.parser import Parser
+from clanalyze.store import ClassView, DeclarationStore, FieldView
+import os.path
+import pickle
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+class TestDeclarationStore(unittest.TestCase):
+    def setUp(self):
+        self.path = os.path.join(here, 'class_nested.cpp')
+        self.store = DeclarationStore()
+
+        parser = Parser()
+        parser.add_observer(self.store)
+        parser.parse(filename=self.path)
+
+    def test_views(self):
+        store = self.store
+
+        self.assertEqual(5, len(store))
+        classes = list(store.classes())
+        self.assertEqual(['Inner', 'Outer'], [c.name for c in classes])
+
+        outer = classes[1]
+        self.assertIsInstance(outer, ClassView)
+        self.assertIs(Class, outer.kind)
+        self.assertEqual(['a', 'c'], list(outer.fields))
+        self.assertEqual(2, len(outer.fields))
+        self.assertEqual(self.path, outer.start_location[0])
+        self.assertEqual('c:@N@ns@S@Outer', outer.usr)
+
+        field = outer.fields['c']
+        self.assertIsInstance(field, FieldView)
+        self.assertIs(Field, field.kind)
+        self.assertEqual(outer, field.parent)
+        self.assertIsNone(outer.parent)
+
+    def test_interning(self):
+        store = self.store
+
+        # Every declaration is in the same file.
+        self.assertEqual(1, len(store.files))
+        self.assertEqual([0] * 5, list(store.start_files))
+
+        strings = len(store.strings)
+        store.add(self.make_class('Outer'))
+        self.assertEqual(1, len(store.files))
+        self.assertEqual(strings, len(store.strings))
+
+    def make_class(self, name):
+        c = Class.__new__(Class)
+        c.name = name
+        c.spelling = name
+        c.usr = 'c:@N@ns@S@%s' % name
+        c.start_location = (self.path, 1, 1, 0)
+        c.end_location = (self.path, 1, 10, 9)
+        c.fields = {}
+        c.methods = []
+
+        return c
+
+    def test_find_usr(self):
+        self.assertEqual([2], self.store.find_usr('c:@N@ns@S@Outer'))
+        self.assertEqual([], self.store.find_usr('c:@S@Missing'))
+
+    def test_pickle(self):
+        store = pickle.loads(pickle.dumps(self.store))
+
+        self.assertEqual(['Inner', 'Outer'], [c.name for c in store.classes()])
+        self.assertEqual(0, store.strings.lookup(store.strings.get(0)))
+
+    def test_enum_values(self):
+        store = DeclarationStore()
+        parser = Parser()
+        parser.add_observer(store)
+        parser.parse(content='enum E : unsigned long long { '
+                'Big = 0xFFFFFFFFFFFFFFFFull, Half = 0x8000000000000000ull, '
+                'Zero = 0 };\nenum S : long long { Min = -0x7FFFFFFFFFFFFFFFll '
+                '- 1 };\n')
+
+        values = [(v.name, v.value) for v in store if v.parent is not None]
+        self.assertEqual([('Big', 2 ** 64 - 1), ('Half', 2 ** 63),
+            ('Zero', 0), ('Min', -2 ** 63)], values)
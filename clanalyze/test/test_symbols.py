@@ -0,0 +1,115 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.parser import Parser
+from clanalyze.symbols import SymbolIndex
+import os.path
+import shutil
+import tempfile
+import unittest
+
+HEADER = b'''
+class Shared {
+    int size;
+};
+'''
+
+class TestSymbolIndex(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+        self.header = os.path.join(self.root, 'shared.h')
+        with open(self.header, 'wb') as fh:
+            fh.write(HEADER)
+
+        self.sources = []
+        for name, body in (('a', 'class A { Shared *s; int size; };'),
+                ('b', 'class B { Shared s; };')):
+            path = os.path.join(self.root, '%s.cpp' % name)
+            with open(path, 'w') as fh:
+                fh.write('#include "shared.h"\n%s\n' % body)
+
+            self.sources.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def build(self, path=None):
+        index = SymbolIndex(path)
+
+        parser = Parser()
+        parser.add_observer(index)
+        for source in self.sources:
+            parser.parse(filename=source, clang_args=['-x', 'c++'])
+
+        return index
+
+    def test_merge(self):
+        index = self.build()
+
+        # Shared is emitted by both translation units, but stored once.
+        shared = index.find(name='Shared')
+        self.assertEqual(1, len(shared))
+        self.assertEqual('class', shared[0].kind)
+
+        definitions = index.definitions(shared[0].usr)
+        self.assertEqual([(self.header, 2)],
+                [(l.filename, l.line) for l in definitions])
+
+        self.assertEqual(['c:@S@Shared@FI@size'],
+                [s.usr for s in index.members(shared[0].usr)])
+
+    def test_queries(self):
+        index = self.build()
+
+        self.assertEqual(['A', 'Shared'],
+                [s.name for s in index.classes_with_field('size')])
+
+        references = index.references('c:@S@Shared')
+        self.assertEqual(['c:@S@A@FI@s', 'c:@S@B@FI@s'],
+                sorted(r.referrer_usr for r in references))
+
+        self.assertEqual(['B'], [s.name for s in
+            index.find(kind='class', filename=self.sources[1])])
+        self.assertEqual(sorted([self.header] + self.sources), index.files())
+
+    def test_record_kinds(self):
+        self.sources.append(os.path.join(self.root, 'c.cpp'))
+        with open(self.sources[-1], 'w') as fh:
+            fh.write('struct P { int x; };\nclass Q { int x; };\n'
+                    'union R { int x; };\n')
+
+        self.assertEqual(['P', 'Q', 'R'],
+                [s.name for s in self.build().classes_with_field('x')])
+
+    def test_persistent(self):
+        path = os.path.join(self.root, 'index.sqlite')
+        self.build(path).close()
+
+        with SymbolIndex(path) as index:
+            symbol = index.symbol('c:@S@A@FI@s')
+            self.assertEqual('field', symbol.kind)
+            self.assertEqual('c:@S@A', symbol.parent_usr)
+            self.assertEqual('Shared *', symbol.type)
+            self.assertEqual('c:@S@Shared', symbol.type_usr)
+
+    def test_reindex(self):
+        path = os.path.join(self.root, 'index.sqlite')
+        source = os.path.join(self.root, 'c.cpp')
+
+        for content in ('class A { int x; };', '\n\nclass A { long y; };'):
+            with open(source, 'w') as fh:
+                fh.write(content)
+
+            with SymbolIndex(path) as index:
+                parser = Parser()
+                parser.add_observer(index)
+                parser.parse(filename=source, clang_args=['-x', 'c++'])
+
+        with SymbolIndex(path) as index:
+            self.assertEqual([('y', 'long')],
+                    [(s.name, s.type) for s in index.members('c:@S@A')])
+            self.assertEqual([(source, 3)], [(l.filename, l.line) for l in
+                index.definitions('c:@S@A')])
+            self.assertIsNone(index.symbol('c:@S@A@FI@x'))
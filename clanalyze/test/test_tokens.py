@@ -0,0 +1,93 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from clanalyze.observer.base import TokenObserver
+from clanalyze.parser import Parser
+import clang.cindex
+import os.path
+import unittest
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+class RecordTokenObserver(TokenObserver):
+    def __init__(self):
+        self.spellings = []
+
+    def process_token(self, token):
+        self.spellings.append(token.spelling)
+
+class RecordBatchObserver(TokenObserver):
+    def __init__(self):
+        self.spellings = []
+        self.kinds = []
+        self.locations = []
+
+    def process_tokens(self, batch):
+        for i in range(len(batch)):
+            self.spellings.append(batch.spelling(i))
+            self.kinds.append(batch.kind(i))
+            self.locations.append(batch.location(i))
+
+class TestTokenStream(unittest.TestCase):
+    def test_token_compatibility(self):
+        parser = Parser()
+        observer = RecordTokenObserver()
+        parser.add_observer(observer)
+
+        parser.parse(filename=os.path.join(here, 'class_empty.cpp'))
+
+        self.assertEqual(['class', 'Foo', '{', '}', ';'], observer.spellings)
+
+    def test_token_batches(self):
+        parser = Parser(token_batch_size=2)
+        observer = RecordBatchObserver()
+        parser.add_observer(observer)
+
+        for kwargs in ({'filename': os.path.join(here, 'class_empty.cpp')},
+                {'content': 'class Foo { };\n'}):
+            observer.__init__()
+            parser.parse(**kwargs)
+
+            self.assertEqual(['class', 'Foo', '{', '}', ';'],
+                    observer.spellings)
+            self.assertEqual(clang.cindex.TokenKind.KEYWORD,
+                    observer.kinds[0])
+            self.assertEqual(clang.cindex.TokenKind.IDENTIFIER,
+                    observer.kinds[1])
+            self.assertEqual((1, 7, 6), observer.locations[1])
+
+class CommentObserver(RecordBatchObserver):
+    PROCESS_KINDS = [clang.cindex.TokenKind.COMMENT]
+
+class LineObserver(RecordBatchObserver):
+    PROCESS_LINES = (2, 2)
+
+class ClassTokenObserver(RecordBatchObserver):
+    PROCESS_CURSOR_KINDS = [clang.cindex.CursorKind.CLASS_DECL]
+
+class TestTokenFiltering(unittest.TestCase):
+    SOURCE = '\n'.join([
+        '// leading',
+        'int x;',
+        'class Foo { int y; };',
+        'int z; // trailing',
+    ])
+
+    def parse(self, observer):
+        parser = Parser()
+        parser.add_observer(observer)
+        parser.parse(content=self.SOURCE)
+
+        return observer.spellings
+
+    def test_kinds(self):
+        self.assertEqual(['// leading', '// trailing'],
+                self.parse(CommentObserver()))
+
+    def test_lines(self):
+        self.assertEqual(['int', 'x', ';'], self.parse(LineObserver()))
+
+    def test_cursor_kinds(self):
+        self.assertEqual(['class', 'Foo', '{', 'int', 'y', ';', '}'],
+                self.parse(ClassTokenObserver()))
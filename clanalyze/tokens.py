@@ -0,0 +1,279 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this file,
+# You can obtain one at http://mozilla.org/MPL/2.0/.
+
+# This file contains code for efficiently extracting the token stream from
+# translation units.
+
+from . import wrapper
+
+import array
+import clang.cindex
+import ctypes
+import mmap
+
+class TokenBatch(object):
+    """A batch of tokens stored in compact arrays.
+
+    Token observers receive tokens in batches instead of as individual
+    objects. A batch stores the kind, byte offsets, and start line and
+    column of each token in arrays. Token spellings are not extracted from
+    libclang. Instead, they are sliced from the source buffer on demand.
+
+    Tokens are referred to by their index in the batch, which is in the range
+    [0, len(batch)).
+
+    Batches are reused by the parser. Observers must not retain a batch after
+    process_tokens() returns. Use select() to obtain an independent batch.
+
+    kinds -- array of clang.cindex.TokenKind values.
+    starts -- array of byte offsets where tokens start.
+    ends -- array of byte offsets where tokens end.
+    lines -- array of lines tokens start on. Indexed from 1.
+    columns -- array of columns tokens start on. Indexed from 1.
+    source -- Buffer holding the content of the main file.
+    tu -- Translation unit the tokens were derived from.
+    parser -- Parser instance the tokens were derived from.
+    """
+
+    __slots__ = (
+        'columns',
+        'ends',
+        'kinds',
+        'lines',
+        'parser',
+        'source',
+        'starts',
+        'tokens',
+        'tu',
+    )
+
+    def __init__(self, source, tu=None, parser=None, keep_tokens=False):
+        self.source = source
+        self.tu = tu
+        self.parser = parser
+
+        self.kinds = array.array('B')
+        self.starts = array.array('l')
+        self.ends = array.array('l')
+        self.lines = array.array('l')
+        self.columns = array.array('l')
+
+        # Raw clang.cindex.Token instances. Only retained when an observer
+        # needs them for the per-token compatibility API.
+        self.tokens = [] if keep_tokens else None
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def kind(self, i):
+        """The clang.cindex.TokenKind of the token at an index."""
+        return clang.cindex.TokenKind.from_value(self.kinds[i])
+
+    def spelling(self, i):
+        """The spelling of the token at an index, as a str."""
+        return self.source[self.starts[i]:self.ends[i]].decode('utf-8',
+                'replace')
+
+    def location(self, i):
+        """The (line, column, offset) where the token at an index starts."""
+        return (self.lines[i], self.columns[i], self.starts[i])
+
+    def select(self, indices):
+        """Obtain a new batch containing the tokens at the given indices.
+
+        The new batch shares the source buffer with this one.
+        """
+        batch = TokenBatch(self.source, self.tu, self.parser,
+                self.tokens is not None)
+
+        for i in indices:
+            batch.kinds.append(self.kinds[i])
+            batch.starts.append(self.starts[i])
+            batch.ends.append(self.ends[i])
+            batch.lines.append(self.lines[i])
+            batch.columns.append(self.columns[i])
+
+            if self.tokens is not None:
+                batch.tokens.append(self.tokens[i])
+
+        return batch
+
+    def filtered(self, kinds=None, ranges=None):
+        """Obtain the tokens in this batch matching filters.
+
+        kinds -- Set of TokenKind values (ints) to retain. None retains all
+          kinds.
+        ranges -- Sorted list of non-overlapping (start, end) byte ranges.
+          Only tokens starting in one of the ranges are retained. None
+          retains tokens at all offsets.
+
+        Returns this batch if all tokens match. Otherwise, a new batch is
+        returned.
+        """
+        if kinds is None and ranges is None:
+            return self
+
+        batch_kinds = self.kinds
+        starts = self.starts
+
+        indices = []
+        r = 0
+        for i in range(len(batch_kinds)):
+            if kinds is not None and batch_kinds[i] not in kinds:
+                continue
+
+            if ranges is not None:
+                # Tokens are ordered by offset, so we can walk the ranges
+                # alongside them.
+                offset = starts[i]
+                while r < len(ranges) and ranges[r][1] <= offset:
+                    r += 1
+
+                if r == len(ranges) or offset < ranges[r][0]:
+                    continue
+
+            indices.append(i)
+
+        if len(indices) == len(batch_kinds):
+            return self
+
+        return self.select(indices)
+
+    def wrapped_tokens(self):
+        """Generator of wrapper.Token for every token in the batch.
+
+        This is only available if the batch was created with keep_tokens.
+        """
+        if self.tokens is None:
+            raise Exception('Batch does not retain tokens.')
+
+        for token in self.tokens:
+            yield wrapper.Token(token, self.tu, self.parser)
+
+    def clear(self):
+        """Remove all tokens from the batch, retaining its storage."""
+        del self.kinds[:]
+        del self.starts[:]
+        del self.ends[:]
+        del self.lines[:]
+        del self.columns[:]
+
+        if self.tokens is not None:
+            del self.tokens[:]
+
+def merge_ranges(ranges):
+    """Merge (start, end) ranges into a sorted list of disjoint ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+
+    return merged
+
+def intersect_ranges(a, b):
+    """Intersect two lists of ranges as returned by merge_ranges()."""
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            result.append((start, end))
+
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+
+    return result
+
+def source_buffer(filename, source, size):
+    """Obtain a buffer holding the content of a source file.
+
+    If source is not None, it is returned as is. Otherwise, the file is
+    memory mapped. The returned object supports slicing and should be closed
+    when it is no longer needed if it has a close() method.
+    """
+    if source is not None:
+        return source
+
+    if not size:
+        return b''
+
+    with open(filename, 'rb') as fh:
+        return mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+
+def tokenize(tu, extent, source, batch_size, parser=None, keep_tokens=False):
+    """Generator of TokenBatch for all tokens in an extent.
+
+    Tokens are obtained from libclang in a single call. The same TokenBatch
+    instance is yielded repeatedly, holding up to batch_size tokens each
+    time.
+    """
+    lib = clang.cindex.conf.lib
+
+    memory = ctypes.POINTER(clang.cindex.Token)()
+    count = ctypes.c_uint()
+    lib.clang_tokenize(tu, extent, ctypes.byref(memory), ctypes.byref(count))
+
+    count = int(count.value)
+    if count < 1:
+        return
+
+    # The group disposes of the token memory once it and all tokens
+    # referencing it are garbage collected.
+    group = clang.cindex.TokenGroup(tu, memory, ctypes.c_uint(count))
+    tokens = ctypes.cast(memory, ctypes.POINTER(clang.cindex.Token *
+        count)).contents
+
+    batch = TokenBatch(source, tu, parser, keep_tokens)
+
+    line = ctypes.c_uint()
+    column = ctypes.c_uint()
+    offset = ctypes.c_uint()
+    line_ref = ctypes.byref(line)
+    column_ref = ctypes.byref(column)
+    offset_ref = ctypes.byref(offset)
+
+    get_kind = lib.clang_getTokenKind
+    get_extent = lib.clang_getTokenExtent
+    get_start = lib.clang_getRangeStart
+    get_end = lib.clang_getRangeEnd
+    get_location = lib.clang_getInstantiationLocation
+
+    kinds = batch.kinds
+    starts = batch.starts
+    ends = batch.ends
+    lines = batch.lines
+    columns = batch.columns
+
+    for i in range(count):
+        token = tokens[i]
+        token_extent = get_extent(tu, token)
+
+        get_location(get_start(token_extent), None, line_ref, column_ref,
+                offset_ref)
+        kinds.append(get_kind(token))
+        starts.append(offset.value)
+        lines.append(line.value)
+        columns.append(column.value)
+
+        get_location(get_end(token_extent), None, line_ref, column_ref,
+                offset_ref)
+        ends.append(offset.value)
+
+        if keep_tokens:
+            token._tu = tu
+            token._group = group
+            batch.tokens.append(token)
+
+        if len(kinds) >= batch_size:
+            yield batch
+            batch.clear()
+
+    if len(kinds):
+        yield batch
@@ -11,25 +11,109 @@
 import clang.cindex
 import sys
 
+# Counters of memoized attribute lookups on Cursor: [hits, misses]. They are
+# only updated while _counting is set.
+_memo_counts = [0, 0]
+_counting = False
+
+def enable_cache_stats(enabled=True):
+    """Start or stop counting memoized Cursor attribute lookups.
+
+    Counting is off by default, as it costs time on every lookup.
+    """
+    global _counting
+    _counting = enabled
+
+def cache_stats():
+    """Obtain counters for memoized Cursor attribute lookups.
+
+    Returns a dict with the number of hits (value served from the wrapper) and
+    misses (value fetched from libclang) while counting was enabled. See
+    enable_cache_stats().
+    """
+    return {'hits': _memo_counts[0], 'misses': _memo_counts[1]}
+
+def reset_cache_stats():
+    """Reset the counters returned by cache_stats()."""
+    _memo_counts[0] = 0
+    _memo_counts[1] = 0
+
+class _Memoized(object):
+    """Descriptor caching an attribute of a wrapped cursor.
+
+    Each access to an attribute of a Clang cursor is a round trip through
+    ctypes. This descriptor performs the lookup on first access and stores
+    the result in the slot of the wrapper named like the attribute with a
+    leading underscore.
+    """
+
+    __slots__ = (
+        'fetch',
+        'slot',
+    )
+
+    def __init__(self, fetch):
+        self.fetch = fetch
+        self.slot = None
+
+    def __set_name__(self, owner, name):
+        self.slot = owner.__dict__['_' + name]
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+
+        try:
+            value = self.slot.__get__(obj, objtype)
+        except AttributeError:
+            value = self.fetch(obj._wrapped)
+            self.slot.__set__(obj, value)
+
+            if _counting:
+                _memo_counts[1] += 1
+        else:
+            if _counting:
+                _memo_counts[0] += 1
+
+        return value
+
 class Cursor(object):
     """Wrapper around Clang's cursor class.
 
     Aside from providing convenience APIs, this class also keeps a reference
     to the translation unit and Parser instance it was produced by.
 
-    This class acts as a proxy to the original type.
+    This class acts as a proxy to the original type. Frequently accessed
+    attributes (kind, spelling, displayname, extent, location, type, and the
+    USR) are fetched from libclang once and cached in the wrapper.
     """
 
     __slots__ = (
+        '_displayname',
+        '_extent',
+        '_kind',
+        '_location',
+        '_spelling',
+        '_type',
+        '_usr',
         '_wrapped',
         'tu',
         'parser',
+        '__weakref__',
     )
 
-    def __init__(self, cursor):
-        self._wrapped = cursor
-        self.tu = None
-        self.parser = None
+    displayname = _Memoized(lambda c: c.displayname)
+    extent = _Memoized(lambda c: c.extent)
+    kind = _Memoized(lambda c: c.kind)
+    location = _Memoized(lambda c: c.location)
+    spelling = _Memoized(lambda c: c.spelling)
+    type = _Memoized(lambda c: c.type)
+    usr = _Memoized(lambda c: c.get_usr())
+
+    def __init__(self, cursor, tu=None, parser=None):
+        object.__setattr__(self, '_wrapped', cursor)
+        object.__setattr__(self, 'tu', tu)
+        object.__setattr__(self, 'parser', parser)
 
     def __getattr__(self, name):
         return getattr(self._wrapped, name)
@@ -37,8 +121,12 @@ class Cursor(object):
     def __setattr__(self, name, value):
         if name in ('_wrapped', 'tu', 'parser'):
             object.__setattr__(self, name, value)
+        else:
+            setattr(self._wrapped, name, value)
 
-        object.__setattr__(self._wrapped, name, value)
+    def get_usr(self):
+        """The Unified Symbol Resolution (USR) string of the cursor."""
+        return self.usr
 
     def is_pointer(self):
         """Whether the entity is a pointer."""
@@ -118,10 +206,10 @@ class Token(object):
         'parser'
     )
 
-    def __init__(self, token):
-        self._wrapped = token
-        self.tu = None
-        self.parser = None
+    def __init__(self, token, tu=None, parser=None):
+        object.__setattr__(self, '_wrapped', token)
+        object.__setattr__(self, 'tu', tu)
+        object.__setattr__(self, 'parser', parser)
 
     def __getattr__(self, name):
         return getattr(self._wrapped, name)
@@ -129,5 +217,5 @@ class Token(object):
     def __setattr__(self, name, value):
         if name in ('_wrapped', 'tu', 'parser'):
             object.__setattr__(self, name, value)
-
-        object.__setattr__(self._wrapped, name, value)
+        else:
+            setattr(self._wrapped, name, value)
@@ -5,8 +5,8 @@ setup(
     version='0.0.1',
     author='Gregory Szorc',
     author_email='gregory.szorc@gmail.com',
-    packages=['clanalyze', 'clanalyze.test'],
-    scripts=[],
+    packages=['clanalyze', 'clanalyze.bench', 'clanalyze.test'],
+    scripts=['bin/clanalyze'],
     url='https://github.com/indygreg/clanalyze',
     license='LICENSE.txt',
     description='C language analyzer.',